@@ -0,0 +1,207 @@
+#!/usr/bin/python
+"""Throughput benchmarks for the engine, brains, solvers and tournaments.
+
+    python benchmark.py -o results.json             # run and save
+    python benchmark.py --compare results.json      # run and compare against an earlier run
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import random
+import subprocess
+import time
+from typing import Optional, Set
+
+from brains.Brain import Brain
+from brains.example_ai import RandomAI
+from brains.registry import default_registry
+from brave_rats import play_game
+from components.cards import Card
+from components.compact_state import CompactGameStatus
+from components.fight_contexts import INITIAL_CONTEXT
+from components.game_status import GameStatus
+from components.player import Player
+from experiments import solveable_games
+from experiments.equilibrium_solver import EquilibriumSolver
+from tournament import play_round_robin, tournament_brain_names
+
+
+class _TimedBrain(Brain):
+    """Wraps a brain and tallies the time spent in its `play_turn`"""
+
+    def __init__(self, brain: Brain):
+        self.brain = brain
+        self.calls = 0
+        self.seconds = 0.0
+
+    def play_turn(
+        self,
+        player: Player,
+        game: GameStatus,
+        spied_card: Optional[Card],
+        opponent_hand: Optional[Set[Card]],
+    ) -> Card:
+        start = time.perf_counter()
+        card = self.brain.play_turn(player, game, spied_card, opponent_hand)
+        self.seconds += time.perf_counter() - start
+        self.calls += 1
+        return card
+
+
+def _random_fight_sequences(count):
+    cards = [card for card in Card]
+    sequences = []
+    for _ in range(count):
+        red, blue = cards.copy(), cards.copy()
+        random.shuffle(red)
+        random.shuffle(blue)
+        sequences.append(list(zip(red, blue)))
+    return sequences
+
+
+def bench_resolve_fight(game_class, num_games):
+    """Fights resolved per second, playing random full games until someone wins"""
+    sequences = _random_fight_sequences(num_games)
+    fights = 0
+    start = time.perf_counter()
+    for sequence in sequences:
+        game = game_class()
+        for red_card, blue_card in sequence:
+            game.resolve_fight(red_card, blue_card)
+            fights += 1
+            if game.winner:
+                break
+    return fights / (time.perf_counter() - start)
+
+
+def bench_play_game(brain_names, num_games):
+    """Games per second for every (red, blue) pairing of `brain_names`"""
+    results = {}
+    for red_name, blue_name in itertools.product(brain_names, repeat=2):
+        red_brain, blue_brain = default_registry().create(red_name), default_registry().create(blue_name)
+        start = time.perf_counter()
+        for _ in range(num_games):
+            play_game(red_brain, blue_brain, verbose=False)
+        results["{} vs {}".format(red_name, blue_name)] = num_games / (time.perf_counter() - start)
+    return results
+
+
+def bench_decisions(brain_names, num_games):
+    """`play_turn` calls per second for each brain, playing against RandomAI"""
+    results = {}
+    for name in brain_names:
+        timed = _TimedBrain(default_registry().create(name))
+        for _ in range(num_games):
+            play_game(timed, RandomAI(), verbose=False)
+        results[name] = timed.calls / timed.seconds
+    return results
+
+
+def bench_solveable_games(cards_to_play):
+    """Nodes per second and cache hit rate of the red-commits-first solver in `experiments.solveable_games`"""
+    solveable_games.cached_res.clear()
+    solveable_games.cache_stats.update(lookups=0, hits=0)
+    hand = [card for card in Card][:cards_to_play]
+    start = time.perf_counter()
+    solveable_games.play_a_round(hand, hand.copy(), GameStatus(points_to_win=cards_to_play // 2 + 1))
+    elapsed = time.perf_counter() - start
+    stats = solveable_games.cache_stats
+    return {
+        "nodes_per_second": stats["lookups"] / elapsed,
+        "cache_hit_rate": stats["hits"] / stats["lookups"],
+        "seconds": elapsed,
+    }
+
+
+def bench_equilibrium_solver(cards_to_play):
+    """Nodes per second and memo hit rate of `experiments.equilibrium_solver`"""
+    solver = EquilibriumSolver()
+    mask = (1 << cards_to_play) - 1 << (8 - cards_to_play)
+    start = time.perf_counter()
+    solver.value(mask, mask, 0, 0, 0, INITIAL_CONTEXT)
+    elapsed = time.perf_counter() - start
+    return {
+        "nodes_per_second": solver.lookups / elapsed,
+        "cache_hit_rate": solver.hits / solver.lookups,
+        "states": len(solver.table),
+        "seconds": elapsed,
+    }
+
+
+def bench_round_robin(num_games):
+    """Wall time of a full `play_round_robin`, output suppressed"""
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        play_round_robin(num_games=num_games)
+    return time.perf_counter() - start
+
+
+def run_benchmarks(quick=False):
+    scale = 5 if quick else 50
+    brain_names = tournament_brain_names()
+    return {
+        "resolve_fight_ops_per_second": {
+            "GameStatus": bench_resolve_fight(GameStatus, 2000 * scale),
+            "CompactGameStatus": bench_resolve_fight(CompactGameStatus, 2000 * scale),
+        },
+        "play_game_games_per_second": bench_play_game(brain_names, 5 * scale),
+        "play_turn_decisions_per_second": bench_decisions(brain_names, 10 * scale),
+        "solveable_games": bench_solveable_games(4 if quick else 5),
+        "equilibrium_solver": bench_equilibrium_solver(5 if quick else 6),
+        "round_robin_seconds": bench_round_robin(2 * scale),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _flatten(results, prefix=""):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, prefix + key + ".")
+        else:
+            yield prefix + key, value
+
+
+def _print_results(results, baseline=None):
+    baseline_values = dict(_flatten(baseline["results"])) if baseline else {}
+    for name, value in _flatten(results):
+        line = "{:70} {:>14.2f}".format(name, value)
+        if name in baseline_values and baseline_values[name]:
+            line += "  ({:+.1f}% vs {})".format(
+                100.0 * (value - baseline_values[name]) / baseline_values[name],
+                (baseline.get("commit") or "baseline")[:10],
+            )
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Brave Rats engine, brains and solvers")
+    parser.add_argument("-o", "--output", help="Save results to this JSON file")
+    parser.add_argument("-c", "--compare", help="JSON file from an earlier run to compare against")
+    parser.add_argument("-q", "--quick", action="store_true", default=False, help="Smaller workloads")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="Seed for the random workloads")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    benchmark_results = run_benchmarks(quick=args.quick)
+
+    baseline_run = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline_run = json.load(f)
+    _print_results(benchmark_results, baseline_run)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {"commit": _git_commit(), "timestamp": time.time(), "quick": args.quick, "results": benchmark_results},
+                f,
+                indent=2,
+            )
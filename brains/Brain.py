@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Optional, Set
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional, Sequence, Set
 
 if TYPE_CHECKING:
     from components.cards import Card
@@ -8,7 +8,20 @@ if TYPE_CHECKING:
     from components.player import Player
 
 
+class TurnRequest(NamedTuple):
+    """The arguments of one `play_turn` call"""
+
+    player: Player
+    game: GameStatus
+    spied_card: Optional[Card]
+    opponent_hand: Optional[Set[Card]]
+
+
 class Brain:
+    # Anytime brains set this and accept a `deadline` keyword argument in `play_turn`: a `time.perf_counter()`
+    # value by which they should return their best move so far. Only passed when the game has a time budget.
+    supports_deadline = False
+
     def play_turn(
         self,
         player: Player,
@@ -17,3 +30,23 @@ class Brain:
         opponent_hand: Optional[Set[Card]],
     ) -> Card:
         raise NotImplementedError()
+
+    def play_turns(self, requests: Sequence[TurnRequest]) -> List[Card]:
+        """Optional: decides many turns at once, returning one card per request, in order.
+        Batched matches (`play_match` with a `batch_size`) hand each brain all of a round's pending decisions in one
+        call, so brains with expensive per-call setup can override this to pay for it once per batch. By default
+        it's `play_turn` for each request.
+        """
+        return [self.play_turn(*request) for request in requests]
+
+    def action_distribution(
+        self,
+        player: Player,
+        game: GameStatus,
+        spied_card: Optional[Card],
+        opponent_hand: Optional[Set[Card]],
+    ) -> Dict[Card, float]:
+        """Optional: the probability of each card `play_turn` would play given the same arguments.
+        Brains that implement it can be evaluated exactly by experiments/exploitability.py.
+        """
+        raise NotImplementedError()
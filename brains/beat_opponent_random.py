@@ -1,14 +1,16 @@
 import random
-from typing import Optional, Set
+from typing import Dict, Optional, Set
 
 from brains.Brain import Brain
-from brains.common import best_card_against
+from brains.common import best_card_against, uniform_distribution
 from components.cards import Card
 from components.game_status import GameStatus
 from components.player import Player
 
 
 class BeatOpponentRandomAI(Brain):
+    name = "beatOpponentRandom"
+
     def play_turn(
         self,
         player: Player,
@@ -25,5 +27,20 @@ class BeatOpponentRandomAI(Brain):
         # Pick a random card from the opponent and pretend they will play that, then try to beat it
         opponent_plays = random.choice(list(opponent_hand))
         return best_card_against(
-            player.hand, game.recent_fight_for(player.color), opponent_plays
+            player.hand, game.recent_fight_for(player.color), opponent_plays, game.rules
+        )
+
+    def action_distribution(
+        self,
+        player: Player,
+        game: GameStatus,
+        spied_card: Optional[Card],
+        opponent_hand: Optional[Set[Card]],
+    ) -> Dict[Card, float]:
+        assert opponent_hand
+        if len(player.hand) == 1:
+            return {player.hand[0]: 1.0}
+        prev_round = tuple(game.recent_fight_for(player.color))
+        return uniform_distribution(
+            best_card_against(player.hand, prev_round, opponent_plays, game.rules) for opponent_plays in opponent_hand
         )
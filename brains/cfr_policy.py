@@ -0,0 +1,107 @@
+import random
+from typing import Dict, List, Optional, Sequence, Set
+
+from brains.Brain import Brain, TurnRequest
+from brains.common import uniform_distribution
+from components.cards import Card, Color
+from components.compact_state import NO_CARD, CompactGameStatus, card_code, hand_mask
+from components.fight_contexts import CONTEXT_BY_PREV, state_key
+from components.game_status import GameStatus
+from components.mapped_table import MappedTable
+from components.paths import DEFAULT_POLICY_PATH
+from components.player import Player
+
+_CARDS = tuple(Card)
+
+
+def policy_key(state_key: int, color: Color, spied_code: int, points_to_win: int, house_rules_id: int = 0) -> int:
+    """Table key of an infoset: the `state_key` of the position, the color to move, the code of
+    the card they spied (NO_CARD if they didn't) and the rules (see `Rules.house_rules_id`)"""
+    return state_key | spied_code << 32 | color.value << 36 | points_to_win << 40 | house_rules_id << 44
+
+
+class CfrPolicy(Brain):
+    """Plays the average strategy found by `experiments.cfr`, which it memory-maps rather than loads. A move is
+    one table lookup and a weighted draw, so this plays close to equilibrium at table-lookup speed.
+
+    Positions missing from the table (from a policy trained for another `points_to_win` or rules variant, say) are
+    played uniformly at random and counted in `misses`.
+    """
+
+    name = "cfrPolicy"
+
+    def __init__(self, path: str = DEFAULT_POLICY_PATH):
+        self.table = MappedTable(path)
+        self.misses = 0
+
+    @staticmethod
+    def _opponent_mask(player: Player, game: GameStatus, opponent_hand: Optional[Set[Card]]) -> int:
+        if opponent_hand is not None:
+            return hand_mask(opponent_hand)
+        if isinstance(game, CompactGameStatus):
+            return game.blue_hand if player.color == Color.red else game.red_hand
+        # Without being told, work it out from the cards the opponent has played
+        played = game.resolved_fights + game.on_hold_fights
+        opponent_index = 1 if player.color == Color.red else 0
+        return hand_mask(set(game.rules.cards) - {fight[opponent_index] for fight in played})
+
+    def _key(
+        self, player: Player, game: GameStatus, spied_card: Optional[Card], opponent_hand: Optional[Set[Card]]
+    ) -> int:
+        own_mask, opponent_mask = hand_mask(player.hand), self._opponent_mask(player, game, opponent_hand)
+        prev_red, prev_blue = game.most_recent_fight
+        context = CONTEXT_BY_PREV[card_code(prev_red) * 9 + card_code(prev_blue)]
+        if player.color == Color.red:
+            state = (own_mask, opponent_mask, game.red_points, game.blue_points)
+        else:
+            state = (opponent_mask, own_mask, game.red_points, game.blue_points)
+        key = state_key(*state, game.on_hold_points, context)
+        spied_code = NO_CARD if spied_card is None else int(spied_card)
+        return policy_key(key, player.color, spied_code, game.points_to_win, game.rules.house_rules_id)
+
+    def _probabilities(
+        self, player: Player, game: GameStatus, spied_card: Optional[Card], opponent_hand: Optional[Set[Card]]
+    ):
+        return self.table.get(self._key(player, game, spied_card, opponent_hand))
+
+    def _draw(self, hand: List[Card], probabilities) -> Card:
+        if probabilities is None:
+            self.misses += 1
+            return random.choice(hand)
+        return random.choices(_CARDS, probabilities)[0]
+
+    def play_turn(
+        self,
+        player: Player,
+        game: GameStatus,
+        spied_card: Optional[Card],
+        opponent_hand: Optional[Set[Card]],
+    ) -> Card:
+        if len(player.hand) == 1:
+            return player.hand[0]
+        return self._draw(player.hand, self._probabilities(player, game, spied_card, opponent_hand))
+
+    def play_turns(self, requests: Sequence[TurnRequest]) -> List[Card]:
+        # Same draws as calling `play_turn` for each request, but the whole batch is looked up in one pass
+        looked_up = [request for request in requests if len(request.player.hand) > 1]
+        probabilities = iter(self.table.get_many([self._key(*request) for request in looked_up]))
+        cards = []
+        for request in requests:
+            hand = request.player.hand
+            cards.append(hand[0] if len(hand) == 1 else self._draw(hand, next(probabilities)))
+        return cards
+
+    def action_distribution(
+        self,
+        player: Player,
+        game: GameStatus,
+        spied_card: Optional[Card],
+        opponent_hand: Optional[Set[Card]],
+    ) -> Dict[Card, float]:
+        if len(player.hand) == 1:
+            return {player.hand[0]: 1.0}
+        probabilities = self._probabilities(player, game, spied_card, opponent_hand)
+        if probabilities is None:
+            self.misses += 1
+            return uniform_distribution(player.hand)
+        return {card: probability for card, probability in zip(_CARDS, probabilities) if probability > 0}
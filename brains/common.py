@@ -1,40 +1,111 @@
-from typing import List, Tuple
+from typing import Dict, Iterable, List, Tuple
 
 from components.cards import Card
-from components.fight import QUICK_FIGHT_RESULT, FightResult
+from components.fight import NO_CARD, FightResult
+from components.rules import STANDARD_RULES, Rules
+
+
+def _build_best_responses(payoff_matrices):
+    """Precomputes (best FightResult, mask of cards achieving it) for every hand mask, previous fight and opponent
+    card. Most previous fights only differ by whether a General bonus applies, so the table is built once per
+    distinct set of fight results and shared between the previous fights that produce it."""
+    context_by_prev = []
+    context_results = []
+    for payoffs in payoff_matrices:
+        # In these lookups we are always "red", same as in `best_cards_against`
+        results = tuple(payoffs[card][opponent_card] for opponent_card in range(8) for card in range(8))
+        if results not in context_results:
+            context_results.append(results)
+        context_by_prev.append(context_results.index(results))
+
+    best_responses = []
+    for results in context_results:
+        for opponent_card in Card:
+            table = [(FightResult.blue_wins_game, 0)] * 256
+            for mask in range(1, 256):
+                lowest_bit = mask & -mask
+                res = results[opponent_card * 8 + lowest_bit.bit_length() - 1]
+                rest = mask ^ lowest_bit
+                best_rest, rest_cards = table[rest]
+                if not rest or res > best_rest:
+                    table[mask] = (res, lowest_bit)
+                elif res == best_rest:
+                    table[mask] = (res, rest_cards | lowest_bit)
+                else:
+                    table[mask] = table[rest]
+            best_responses.extend(table)
+    return context_by_prev, best_responses
+
+
+# Rules.fight_table -> (context_by_prev, best_responses) for that table, where
+#   context_by_prev[our_prev_code * 9 + opponent_prev_code] -> context id
+#   best_responses[(context * 8 + opponent_card) * 256 + hand_mask] -> (best FightResult, mask of cards achieving it)
+_BEST_RESPONSE_TABLES = {STANDARD_RULES.fight_table: _build_best_responses(STANDARD_RULES.payoff_matrices)}
+
+
+def best_response(
+    hand_mask: int, prev_round_codes: Tuple[int, int], opponent_card: int, rules: Rules = STANDARD_RULES
+) -> Tuple[FightResult, int]:
+    """O(1) lookup of the best result against `opponent_card` and the mask of cards in `hand_mask` that get it.
+    :param prev_round_codes: (our previous card, opponent's previous card) as ints, 8 for no previous card
+    :param rules: whose fight table to judge by. The lookup table is built the first time a table is seen.
+    """
+    tables = _BEST_RESPONSE_TABLES.get(rules.fight_table)
+    if tables is None:
+        tables = _BEST_RESPONSE_TABLES[rules.fight_table] = _build_best_responses(rules.payoff_matrices)
+    context_by_prev, best_responses = tables
+    our_previous_code, opponent_previous_code = prev_round_codes
+    context = context_by_prev[our_previous_code * 9 + opponent_previous_code]
+    return best_responses[(context * 8 + opponent_card) * 256 + hand_mask]
 
 
 # Like `best_card_against` but returns all cards that produce the same result
 def best_cards_against(
-    hand: List[Card], prev_round: Tuple[Card, Card], opponent_card: Card
+    hand: List[Card], prev_round: Tuple[Card, Card], opponent_card: Card, rules: Rules = STANDARD_RULES
 ) -> List[Card]:
     if not hand:
         raise ValueError("Hand must not be empty")
 
     our_previous_card, opponent_previous_card = prev_round
-
-    # Start with the worst possible result. In this call, we are always "red"
-    best_result = FightResult.blue_wins_game
-    cards_that_produce_best_result = []
-    # Loop over every card to find the best possible FightResult with what we have
+    hand_mask = 0
     for card in hand:
-        res = QUICK_FIGHT_RESULT[
-            (card, opponent_card, our_previous_card, opponent_previous_card)
-        ]
+        hand_mask |= 1 << card
+    _, best_cards = best_response(
+        hand_mask,
+        (
+            NO_CARD if our_previous_card is None else our_previous_card,
+            NO_CARD if opponent_previous_card is None else opponent_previous_card,
+        ),
+        opponent_card,
+        rules,
+    )
+    # Keep the hand's order, so `best_card_against` picks the same card it always has
+    return [card for card in hand if best_cards >> card & 1]
+
 
-        # `FightResult` is ordered in ascending order for "red", who we are pretending to be
-        # >= so that we at least always replace `best_card=None` with a real card
-        if res > best_result:
-            best_result = res
-            cards_that_produce_best_result = [card]
-        elif res == best_result:
-            cards_that_produce_best_result.append(card)
-    return cards_that_produce_best_result
+def uniform_distribution(cards: Iterable[Card]) -> Dict[Card, float]:
+    """`random.choice(cards)` as a distribution. Cards listed more than once are that much more likely."""
+    cards = list(cards)
+    distribution: Dict[Card, float] = {}
+    for card in cards:
+        distribution[card] = distribution.get(card, 0.0) + 1.0 / len(cards)
+    return distribution
 
 
-# TODO: This should be cacheable, and is currently the slowest bit
 def best_card_against(
-    hand: List[Card], prev_round: Tuple[Card, Card], opponent_card: Card
+    hand: List[Card], prev_round: Tuple[Card, Card], opponent_card: Card, rules: Rules = STANDARD_RULES
 ) -> Card:
     # Just pick an arbitrary card
-    return best_cards_against(hand, prev_round, opponent_card)[0]
+    return best_cards_against(hand, prev_round, opponent_card, rules)[0]
+
+
+def best_outcomes_distribution(
+    hand: List[Card], prev_round: Tuple[Card, Card], opponent_hand: Iterable[Card], rules: Rules = STANDARD_RULES
+) -> Dict[Card, float]:
+    """Distribution of picking one of the best responses to each card in `opponent_hand`, keeping duplicates
+    across opponent cards, which is what RandomBestOutcome plays"""
+    return uniform_distribution(
+        card
+        for opponent_card in opponent_hand
+        for card in best_cards_against(hand, prev_round, opponent_card, rules)
+    )
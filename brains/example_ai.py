@@ -1,13 +1,16 @@
 import random
-from typing import Optional, Set
+from typing import Dict, Optional, Set
 
 from brains.Brain import Brain
+from brains.common import uniform_distribution
 from components.cards import Card
 from components.game_status import GameStatus
 from components.player import Player
 
 
 class RandomAI(Brain):
+    name = "random"
+
     def play_turn(
         self,
         player: Player,
@@ -25,3 +28,12 @@ class RandomAI(Brain):
         :return: a card from my player's hand with which to vanquish my opponent, or None if the game is over
         """
         return random.choice(player.hand)
+
+    def action_distribution(
+        self,
+        player: Player,
+        game: GameStatus,
+        spied_card: Optional[Card],
+        opponent_hand: Optional[Set[Card]],
+    ) -> Dict[Card, float]:
+        return uniform_distribution(player.hand)
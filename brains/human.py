@@ -9,6 +9,8 @@ from components.player import Player
 
 
 class HumanBrain(Brain):
+    name = "human"
+
     def play_turn(
         self,
         player: Player,
@@ -1,9 +1,9 @@
 import itertools
 import random
-from typing import Optional, Set
+from typing import Dict, Optional, Set
 
 from brains.Brain import Brain
-from brains.common import best_card_against, best_cards_against
+from brains.common import best_card_against, best_cards_against, best_outcomes_distribution
 from brains.random_best_outcome import RandomBestOutcome
 from brave_rats import _get_played_cards
 from components.cards import Card, Color
@@ -12,6 +12,8 @@ from components.player import Player
 
 
 class InProgressAI(Brain):
+    name = "inProgressAI"
+
     def play_turn(
         self,
         player: Player,
@@ -27,7 +29,7 @@ class InProgressAI(Brain):
 
         if spied_card:
             return best_card_against(
-                player.hand, game.recent_fight_for(player.color), spied_card
+                player.hand, game.recent_fight_for(player.color), spied_card, game.rules
             )
 
         # TODO: This block needs to come out
@@ -46,10 +48,27 @@ class InProgressAI(Brain):
         # duplicates across opponent cards
         best_responses_by_opp_card = {
             opp_card: best_cards_against(
-                player.hand, game.recent_fight_for(player.color), opp_card
+                player.hand, game.recent_fight_for(player.color), opp_card, game.rules
             )
             for opp_card in opponent_hand
         }
         return random.choice(
             list(itertools.chain(*best_responses_by_opp_card.values()))
         )
+
+    def action_distribution(
+        self,
+        player: Player,
+        game: GameStatus,
+        spied_card: Optional[Card],
+        opponent_hand: Optional[Set[Card]],
+    ) -> Dict[Card, float]:
+        # The simulated playout in `play_turn` doesn't affect the card it picks, so this is the same as
+        # RandomBestOutcome
+        assert opponent_hand
+        if len(player.hand) == 1:
+            return {player.hand[0]: 1.0}
+        prev_round = tuple(game.recent_fight_for(player.color))
+        if spied_card:
+            return {best_card_against(player.hand, prev_round, spied_card, game.rules): 1.0}
+        return best_outcomes_distribution(player.hand, prev_round, opponent_hand, game.rules)
@@ -0,0 +1,271 @@
+import math
+import os
+import random
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from brains.Brain import Brain
+from components.cards import Card, Color
+from components.compact_state import CompactGameStatus, SearchGameStatus, cards_in_mask, hand_mask, hand_zobrist
+from components.game_status import GameStatus
+from components.paths import DEFAULT_TABLEBASE_PATH
+from components.player import Player
+from components.tablebase import Tablebase
+
+# Key for a choice made without seeing the other player's card
+_BLIND = -1
+
+# Fraction of the time left before a deadline from the game loop that the search uses, leaving the rest as slack
+# for building the answer and for the clock only being checked every few iterations
+_DEADLINE_SAFETY = 0.9
+
+# _CARD_CODES[mask] -> tuple of the card codes in `mask`, so rollouts never build lists
+_CARD_CODES = [tuple(code for code in range(8) if mask >> code & 1) for mask in range(256)]
+
+
+class _Node(object):
+    """Decoupled statistics for one node of the search tree.
+
+    Each player keeps their own [visits, total reward for us] per (revealed card, card) so that simultaneous
+    rounds are searched as two independent bandits. The revealed card is `_BLIND` unless that player is answering
+    a spy, in which case the opponent's revealed card is part of the key.
+    """
+
+    __slots__ = ("own_stats", "opponent_stats")
+
+    def __init__(self):
+        self.own_stats: Dict[Tuple[int, int], List[float]] = {}
+        self.opponent_stats: Dict[Tuple[int, int], List[float]] = {}
+
+
+def _select(stats, revealed: int, cards: Tuple[int, ...], for_us: bool, exploration: float) -> int:
+    untried = [card for card in cards if (revealed, card) not in stats]
+    if untried:
+        return random.choice(untried)
+
+    log_total = math.log(sum(stats[(revealed, card)][0] for card in cards))
+    best_card, best_score = cards[0], -1.0
+    for card in cards:
+        visits, total = stats[(revealed, card)]
+        mean = total / visits if for_us else 1.0 - total / visits
+        score = mean + exploration * math.sqrt(log_total / visits)
+        if score > best_score:
+            best_card, best_score = card, score
+    return best_card
+
+
+class ISMCTSBrain(Brain):
+    """Information-set Monte Carlo tree search.
+
+    Normal rounds are searched with decoupled UCT (each player picks from their own bandit statistics without
+    seeing the other's choice); rounds after a successful spy are searched sequentially, with the spy's statistics
+    keyed on the revealed card. If the opponent's hand isn't provided, each iteration samples one consistent with
+    the cards they've been seen to play.
+
+    Nodes live in a transposition table keyed on the Zobrist hash of the position as we can see it (the
+    opponent's hand is hashed out when it's hidden), so move orders reaching the same position share statistics.
+    Iterations walk a single SearchGameStatus forward with `push` and unwind it with `pop`.
+
+    This is an anytime brain: when the game loop passes a deadline, the search stops there and plays the best
+    move found so far.
+
+    When there's an endgame tablebase (see `experiments.tablebase`) for the rules being played, iterations stop at
+    the first position below the root that's in it and back up its exact value instead of a rollout.
+
+    :param iterations: max number of search iterations per move, or None for no limit
+    :param time_budget: max seconds to spend per move, or None for no limit
+    :param tablebase_path: tablebase file to probe, if it exists
+    """
+
+    name = "ismcts"
+    supports_deadline = True
+
+    def __init__(
+        self,
+        iterations: Optional[int] = 1000,
+        time_budget: Optional[float] = None,
+        exploration=0.7,
+        tablebase_path: Optional[str] = DEFAULT_TABLEBASE_PATH,
+    ):
+        if iterations is None and time_budget is None:
+            raise ValueError("ISMCTSBrain needs an iteration limit, a time budget, or both")
+        self.iterations = iterations
+        self.time_budget = time_budget
+        self.exploration = exploration
+        self.tablebase: Optional[Tablebase] = None
+        if tablebase_path and os.path.exists(tablebase_path):
+            self.tablebase = Tablebase.open(tablebase_path)
+
+    def play_turn(
+        self,
+        player: Player,
+        game: GameStatus,
+        spied_card: Optional[Card],
+        opponent_hand: Optional[Set[Card]],
+        deadline: Optional[float] = None,
+    ) -> Card:
+        if len(player.hand) == 1:
+            return player.hand[0]
+
+        now = time.perf_counter()
+        if deadline is not None:
+            deadline = now + (deadline - now) * _DEADLINE_SAFETY
+        if self.time_budget is not None:
+            own_deadline = now + self.time_budget
+            deadline = own_deadline if deadline is None else min(deadline, own_deadline)
+        return Card(self.search(player.color, game, hand_mask(player.hand), opponent_hand, spied_card, deadline))
+
+    def search(
+        self,
+        color: Color,
+        game: GameStatus,
+        own_hand: int,
+        opponent_hand: Optional[Set[Card]],
+        spied_card: Optional[Card],
+        deadline: Optional[float],
+    ) -> int:
+        """Runs the search from `color`'s point of view and returns the card code to play
+        :param deadline: `time.perf_counter()` value to stop searching at, or None to only stop on iterations
+        """
+        root = _Node()
+        nodes: Dict[int, _Node] = {}
+        root_revealed = _BLIND if spied_card is None else int(spied_card)
+        state = SearchGameStatus.from_game_status(game)
+        hidden_opponent_hand = opponent_hand is None
+        unseen_opponent_cards = _unseen_opponent_cards(color, game) if hidden_opponent_hand else None
+        own_hand_size = len(_CARD_CODES[own_hand])
+        if not hidden_opponent_hand:
+            self._set_hands(state, color, own_hand, hand_mask(opponent_hand))
+        tablebase = self.tablebase
+        if tablebase is not None and not tablebase.covers(game.rules, game.points_to_win):
+            tablebase = None
+
+        iteration = 0
+        start = time.perf_counter()
+        while self.iterations is None or iteration < self.iterations:
+            # Checking the clock is cheap next to an iteration, but not free. Stop once another batch of iterations
+            # at the average pace so far would run past the deadline, so the move comes back in time.
+            if deadline is not None and iteration and iteration % 8 == 0:
+                now = time.perf_counter()
+                if now + (now - start) * 8 / iteration >= deadline:
+                    break
+            if hidden_opponent_hand:
+                self._set_hands(state, color, own_hand, hand_mask(random.sample(unseen_opponent_cards, own_hand_size)))
+            self._iterate(root, nodes, color, state, root_revealed, hidden_opponent_hand, tablebase)
+            iteration += 1
+
+        own_keys = [key for key in root.own_stats if key[0] == root_revealed]
+        if root_revealed != _BLIND:
+            # Answering a spy is a pure decision, so take the most explored response
+            return max(own_keys, key=lambda key: root.own_stats[key][0])[1]
+        # Simultaneous rounds want a mixed strategy, which the visit counts approximate
+        weights = [root.own_stats[key][0] for key in own_keys]
+        return random.choices(own_keys, weights)[0][1]
+
+    @staticmethod
+    def _set_hands(state: SearchGameStatus, color: Color, own_hand: int, opponent_hand: int):
+        state.red_hand, state.blue_hand = (own_hand, opponent_hand) if color == Color.red else (opponent_hand, own_hand)
+        state.zobrist = state.compute_zobrist()
+
+    def _iterate(
+        self,
+        root: _Node,
+        nodes: Dict[int, _Node],
+        color: Color,
+        state: SearchGameStatus,
+        revealed: int,
+        hidden_opponent_hand: bool,
+        tablebase: Optional[Tablebase],
+    ):
+        we_are_red = color == Color.red
+        opponent_color = Color.blue if we_are_red else Color.red
+        max_tablebase_cards = tablebase.max_cards if tablebase is not None else 0
+
+        node = root
+        path = []
+        expanded = False
+        value = None
+        while not state.winner and state.red_hand and state.blue_hand:
+            if path:
+                if len(_CARD_CODES[state.red_hand]) <= max_tablebase_cards:
+                    value = tablebase.value_of(state)
+                    if value is not None:
+                        break
+                key = state.zobrist
+                if hidden_opponent_hand:
+                    key ^= hand_zobrist(opponent_color, state.blue_hand if we_are_red else state.red_hand)
+                node = nodes.get(key)
+                if node is None:
+                    if expanded:
+                        break
+                    node = nodes[key] = _Node()
+                    expanded = True
+            own_cards = _CARD_CODES[state.red_hand if we_are_red else state.blue_hand]
+            opponent_cards = _CARD_CODES[state.blue_hand if we_are_red else state.red_hand]
+            spy_color = state.spy_color()
+            if not path and revealed != _BLIND:
+                opponent_card = revealed
+                own_key = (revealed, _select(node.own_stats, revealed, own_cards, True, self.exploration))
+                opponent_key = None
+            elif spy_color == color:
+                opponent_key = (_BLIND, _select(node.opponent_stats, _BLIND, opponent_cards, False, self.exploration))
+                opponent_card = opponent_key[1]
+                own_key = (opponent_card, _select(node.own_stats, opponent_card, own_cards, True, self.exploration))
+            elif spy_color == opponent_color:
+                own_key = (_BLIND, _select(node.own_stats, _BLIND, own_cards, True, self.exploration))
+                opponent_key = (
+                    own_key[1],
+                    _select(node.opponent_stats, own_key[1], opponent_cards, False, self.exploration),
+                )
+                opponent_card = opponent_key[1]
+            else:
+                own_key = (_BLIND, _select(node.own_stats, _BLIND, own_cards, True, self.exploration))
+                opponent_key = (_BLIND, _select(node.opponent_stats, _BLIND, opponent_cards, False, self.exploration))
+                opponent_card = opponent_key[1]
+
+            own_card = own_key[1]
+            path.append((node, own_key, opponent_key))
+            if we_are_red:
+                state.push(own_card, opponent_card)
+            else:
+                state.push(opponent_card, own_card)
+
+        if value is None:
+            reward = _rollout(state, color)
+        else:
+            reward = value if we_are_red else 1.0 - value
+        for node, own_key, opponent_key in path:
+            _update(node.own_stats, own_key, reward)
+            if opponent_key is not None:
+                _update(node.opponent_stats, opponent_key, reward)
+        while state.depth:
+            state.pop()
+
+
+def _update(stats, key, reward):
+    entry = stats.get(key)
+    if entry is None:
+        stats[key] = [1, reward]
+    else:
+        entry[0] += 1
+        entry[1] += reward
+
+
+def _rollout(state: SearchGameStatus, color: Color) -> float:
+    """Finishes the game with uniformly random cards and returns the reward for `color`"""
+    choice = random.choice
+    while not state.winner and state.red_hand and state.blue_hand:
+        state.push(choice(_CARD_CODES[state.red_hand]), choice(_CARD_CODES[state.blue_hand]))
+    winner = state.winner
+    if winner is None:
+        return 0.5
+    return 1.0 if winner == color else 0.0
+
+
+def _unseen_opponent_cards(color: Color, game: GameStatus) -> List[Card]:
+    """Cards the opponent hasn't been seen to play, assuming they started with every card in the rules"""
+    if isinstance(game, CompactGameStatus):
+        return cards_in_mask(game.blue_hand if color == Color.red else game.red_hand)
+    opponent_index = 1 if color == Color.red else 0
+    played = {fight[opponent_index] for fight in game.resolved_fights + game.on_hold_fights}
+    return [card for card in game.rules.cards if card not in played]
@@ -1,15 +1,17 @@
 import itertools
 import random
-from typing import Optional, Set
+from typing import Dict, Optional, Set
 
 from brains.Brain import Brain
-from brains.common import best_card_against, best_cards_against
+from brains.common import best_card_against, best_cards_against, best_outcomes_distribution
 from components.cards import Card
 from components.game_status import GameStatus
 from components.player import Player
 
 
 class RandomBestOutcome(Brain):
+    name = "randomBestOutcome"
+
     def play_turn(
         self,
         player: Player,
@@ -26,17 +28,32 @@ class RandomBestOutcome(Brain):
         # If we spied let's do something smart
         if spied_card:
             return best_card_against(
-                player.hand, game.recent_fight_for(player.color), spied_card
+                player.hand, game.recent_fight_for(player.color), spied_card, game.rules
             )
 
         # For each opponent card, figure out all best responses, then randomly choose between them, respecting
         # duplicates across opponent cards
         best_responses_by_opp_card = {
             opp_card: best_cards_against(
-                player.hand, game.recent_fight_for(player.color), opp_card
+                player.hand, game.recent_fight_for(player.color), opp_card, game.rules
             )
             for opp_card in opponent_hand
         }
         return random.choice(
             list(itertools.chain(*best_responses_by_opp_card.values()))
         )
+
+    def action_distribution(
+        self,
+        player: Player,
+        game: GameStatus,
+        spied_card: Optional[Card],
+        opponent_hand: Optional[Set[Card]],
+    ) -> Dict[Card, float]:
+        assert opponent_hand
+        if len(player.hand) == 1:
+            return {player.hand[0]: 1.0}
+        prev_round = tuple(game.recent_fight_for(player.color))
+        if spied_card:
+            return {best_card_against(player.hand, prev_round, spied_card, game.rules): 1.0}
+        return best_outcomes_distribution(player.hand, prev_round, opponent_hand, game.rules)
@@ -1,14 +1,16 @@
 import random
-from typing import Optional, Set
+from typing import Dict, Optional, Set
 
 from brains.Brain import Brain
-from brains.common import best_card_against
+from brains.common import best_card_against, uniform_distribution
 from components.cards import Card
 from components.game_status import GameStatus
 from components.player import Player
 
 
 class RandomPlusBeatSpiedAI(Brain):
+    name = "randomPlusBeatSpied"
+
     def play_turn(
         self,
         player: Player,
@@ -22,6 +24,19 @@ class RandomPlusBeatSpiedAI(Brain):
         # If we spied, let's do something smart
         if spied_card:
             return best_card_against(
-                player.hand, game.recent_fight_for(player.color), spied_card
+                player.hand, game.recent_fight_for(player.color), spied_card, game.rules
             )
         return random.choice(player.hand)
+
+    def action_distribution(
+        self,
+        player: Player,
+        game: GameStatus,
+        spied_card: Optional[Card],
+        opponent_hand: Optional[Set[Card]],
+    ) -> Dict[Card, float]:
+        if len(player.hand) == 1:
+            return {player.hand[0]: 1.0}
+        if spied_card:
+            return {best_card_against(player.hand, game.recent_fight_for(player.color), spied_card, game.rules): 1.0}
+        return uniform_distribution(player.hand)
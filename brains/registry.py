@@ -0,0 +1,184 @@
+"""Finds every Brain in the tree without importing it.
+
+Brain modules are found by parsing each .py file under the repo root and looking for classes that subclass `Brain`
+(directly or through another brain class). A brain is registered under its `name` class attribute, or its class
+name if it doesn't set one; setting `name = None` keeps a base class out of the registry, and classes starting with
+an underscore are always left out.
+
+What each file contains is cached in `.brain_registry.json` at the repo root, keyed by the file's mtime, so only
+new or edited files get parsed again. Modules are only imported when a brain is `load`ed.
+"""
+import ast
+import importlib
+import json
+import os
+from typing import Dict, List, Optional, Tuple, Type
+
+from brains.Brain import Brain
+from components.paths import REPO_ROOT
+
+CACHE_FILE_NAME = ".brain_registry.json"
+_CACHE_VERSION = 1
+
+# Directories that never hold brains and can be big enough to slow the scan down
+_SKIPPED_DIRS = {"__pycache__", "venv", "site-packages", "node_modules"}
+
+# What the scan records for each class: (class name, names of its bases, value of its `name` attribute)
+# The `name` attribute is "" when the class doesn't set one, since None means "don't register".
+_ClassInfo = Tuple[str, List[str], Optional[str]]
+
+
+def _scan_file(path: str) -> List[_ClassInfo]:
+    try:
+        with open(path, "rb") as f:
+            tree = ast.parse(f.read(), filename=path)
+    except (OSError, SyntaxError, ValueError):
+        return []
+
+    classes = []
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+        bases = [
+            base.id if isinstance(base, ast.Name) else base.attr
+            for base in node.bases
+            if isinstance(base, (ast.Name, ast.Attribute))
+        ]
+        name = ""
+        for statement in node.body:
+            if (
+                isinstance(statement, ast.Assign)
+                and any(isinstance(target, ast.Name) and target.id == "name" for target in statement.targets)
+                and isinstance(statement.value, ast.Constant)
+                and (statement.value.value is None or isinstance(statement.value.value, str))
+            ):
+                name = statement.value.value
+        classes.append((node.name, bases, name))
+    return classes
+
+
+def _module_name(relative_path: str) -> str:
+    return os.path.splitext(relative_path)[0].replace(os.sep, ".")
+
+
+class BrainRegistry(object):
+    """Name -> Brain class index for every brain under `root`.
+
+    :param root: directory to scan; module names are relative to it, so it needs to be on `sys.path`
+    :param cache_path: where to keep the scan cache, or None for `.brain_registry.json` under `root`
+    """
+
+    def __init__(self, root: str = REPO_ROOT, cache_path: Optional[str] = None):
+        self.root = root
+        self.cache_path = cache_path if cache_path is not None else os.path.join(root, CACHE_FILE_NAME)
+        # Brain name -> (module name, class name), built on first use
+        self._index: Optional[Dict[str, Tuple[str, str]]] = None
+        self._loaded: Dict[str, Type[Brain]] = {}
+
+    def _python_files(self):
+        for directory, subdirectories, file_names in os.walk(self.root):
+            subdirectories[:] = [
+                subdirectory
+                for subdirectory in subdirectories
+                if not subdirectory.startswith(".") and subdirectory not in _SKIPPED_DIRS
+            ]
+            for file_name in file_names:
+                if file_name.endswith(".py"):
+                    path = os.path.join(directory, file_name)
+                    yield os.path.relpath(path, self.root), path
+
+    def _read_cache(self) -> Dict[str, dict]:
+        try:
+            with open(self.cache_path) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return cache.get("files", {}) if cache.get("version") == _CACHE_VERSION else {}
+
+    def _write_cache(self, files: Dict[str, dict]):
+        tmp_path = self.cache_path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({"version": _CACHE_VERSION, "files": files}, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            # A read-only checkout still works, it just rescans every time
+            pass
+
+    def _scan(self) -> Dict[str, Tuple[str, str]]:
+        cached_files = self._read_cache()
+        files = {}
+        for relative_path, path in self._python_files():
+            mtime = os.stat(path).st_mtime
+            entry = cached_files.get(relative_path)
+            if entry is None or entry["mtime"] != mtime:
+                entry = {"mtime": mtime, "classes": _scan_file(path)}
+            files[relative_path] = entry
+        if files != cached_files:
+            self._write_cache(files)
+
+        # Class name -> (module name, base names, `name` attribute). Bases are matched by class name alone, which
+        # is ambiguous in theory but keeps the scan from having to follow imports.
+        classes = {}
+        for relative_path, entry in files.items():
+            for class_name, bases, name in entry["classes"]:
+                classes.setdefault(class_name, (_module_name(relative_path), bases, name))
+
+        brain_classes = {Brain.__name__}
+        added = True
+        while added:
+            added = False
+            for class_name, (_, bases, _) in classes.items():
+                if class_name not in brain_classes and brain_classes.intersection(bases):
+                    brain_classes.add(class_name)
+                    added = True
+
+        index = {}
+        for class_name in sorted(brain_classes - {Brain.__name__}):
+            module_name, _, name = classes[class_name]
+            if class_name.startswith("_") or name is None:
+                continue
+            name = name or class_name
+            if name in index:
+                raise ValueError(
+                    "Brain name {!r} is used by both {}.{} and {}.{}".format(
+                        name, *index[name], module_name, class_name
+                    )
+                )
+            index[name] = (module_name, class_name)
+        return index
+
+    @property
+    def index(self) -> Dict[str, Tuple[str, str]]:
+        if self._index is None:
+            self._index = self._scan()
+        return self._index
+
+    def names(self) -> List[str]:
+        return sorted(self.index)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.index
+
+    def load(self, name: str) -> Type[Brain]:
+        """Imports the module `name` lives in, if it hasn't been already, and returns the brain class"""
+        if name not in self._loaded:
+            if name not in self.index:
+                raise KeyError("No brain named {!r}; known brains: {}".format(name, ", ".join(self.names())))
+            module_name, class_name = self.index[name]
+            self._loaded[name] = getattr(importlib.import_module(module_name), class_name)
+        return self._loaded[name]
+
+    def create(self, name: str, **kwargs) -> Brain:
+        return self.load(name)(**kwargs)
+
+
+_default_registry: Optional[BrainRegistry] = None
+
+
+def default_registry() -> BrainRegistry:
+    """The registry for this repo, shared by everything in the process"""
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = BrainRegistry()
+    return _default_registry
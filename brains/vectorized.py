@@ -0,0 +1,120 @@
+"""Vectorized counterparts of the random-style brains, for `components.batch_engine`.
+
+Each brain's `choose` picks a card for every game in `rows` at once and returns their card codes. `spied_cards` holds
+the card the opponent revealed for each row, or `NO_SPIED_CARD` if that row isn't a spy response.
+"""
+import numpy as np
+
+from components.batch_engine import CARD_BITS, FIGHT_RESULTS, NO_SPIED_CARD, POPCOUNT, BatchGames
+from components.cards import Color
+from components.rules import STANDARD_RULES
+
+
+def _build_best_masks(fight_results: np.ndarray) -> np.ndarray:
+    # Same trick as `best_cards_against`: we always pretend to be red, so fight results are ordered by our goodness
+    in_hand = (np.arange(256)[:, None] >> np.arange(8)[None, :]) & 1 == 1
+    results = np.where(in_hand[:, :, None, None, None], fight_results[None], -1)
+    best = results.max(axis=1, keepdims=True)
+    is_best = (results == best) & in_hand[:, :, None, None, None]
+    card_bits = (1 << np.arange(8))[None, :, None, None, None]
+    return (is_best * card_bits).sum(axis=1).astype(np.uint8)
+
+
+# BEST_MASKS[own_hand, opponent_card, own_prev_card, opponent_prev_card] -> mask of cards giving the best result,
+# under the standard rules
+BEST_MASKS = _build_best_masks(FIGHT_RESULTS)
+_BEST_MASKS_BY_RULES = {STANDARD_RULES: BEST_MASKS}
+
+
+def best_masks(games: BatchGames) -> np.ndarray:
+    """`BEST_MASKS` for the rules `games` are played by, built the first time those rules are seen"""
+    masks = _BEST_MASKS_BY_RULES.get(games.rules)
+    if masks is None:
+        masks = _BEST_MASKS_BY_RULES[games.rules] = _build_best_masks(games.fight_results)
+    return masks
+
+
+def random_cards(hands: np.ndarray, rng) -> np.ndarray:
+    """One uniformly random card out of each hand mask"""
+    picks = (rng.random(hands.size) * POPCOUNT[hands]).astype(np.int8)
+    return CARD_BITS[hands, picks]
+
+
+def best_cards_against(hands, opponent_cards, own_prev, opponent_prev, masks: np.ndarray = BEST_MASKS) -> np.ndarray:
+    """Vectorized `brains.common.best_card_against`: the lowest card giving the best result
+    :param masks: `best_masks` for the rules being played
+    """
+    return CARD_BITS[masks[hands, opponent_cards, own_prev, opponent_prev], 0]
+
+
+class VectorizedBrain(object):
+    def choose(
+        self, games: BatchGames, color: Color, rows: np.ndarray, spied_cards: np.ndarray, rng
+    ) -> np.ndarray:
+        raise NotImplementedError()
+
+
+class VectorizedRandomAI(VectorizedBrain):
+    def choose(self, games, color, rows, spied_cards, rng):
+        own_hand, _, _, _ = games.view_for(color, rows)
+        return random_cards(own_hand, rng)
+
+
+class VectorizedRandomPlusBeatSpiedAI(VectorizedBrain):
+    def choose(self, games, color, rows, spied_cards, rng):
+        own_hand, _, own_prev, opponent_prev = games.view_for(color, rows)
+        spied = spied_cards != NO_SPIED_CARD
+        return np.where(
+            spied,
+            best_cards_against(own_hand, np.where(spied, spied_cards, 0), own_prev, opponent_prev, best_masks(games)),
+            random_cards(own_hand, rng),
+        )
+
+
+class VectorizedBeatOpponentRandomAI(VectorizedBrain):
+    def choose(self, games, color, rows, spied_cards, rng):
+        own_hand, opponent_hand, own_prev, opponent_prev = games.view_for(color, rows)
+        opponent_cards = random_cards(opponent_hand, rng)
+        return best_cards_against(own_hand, opponent_cards, own_prev, opponent_prev, best_masks(games))
+
+
+class VectorizedSpyingBeatRandomAI(VectorizedBrain):
+    def choose(self, games, color, rows, spied_cards, rng):
+        own_hand, opponent_hand, own_prev, opponent_prev = games.view_for(color, rows)
+        opponent_cards = np.where(spied_cards != NO_SPIED_CARD, spied_cards, random_cards(opponent_hand, rng))
+        return best_cards_against(own_hand, opponent_cards, own_prev, opponent_prev, best_masks(games))
+
+
+class VectorizedRandomBestOutcome(VectorizedBrain):
+    def choose(self, games, color, rows, spied_cards, rng):
+        own_hand, opponent_hand, own_prev, opponent_prev = games.view_for(color, rows)
+
+        # `RandomBestOutcome` picks uniformly from the best responses to every opponent card, duplicates included.
+        # That's the same as picking opponent card `c` with weight len(best responses to c), then a response to it.
+        masks = best_masks(games)
+        best = masks[own_hand[:, None], np.arange(8)[None, :], own_prev[:, None], opponent_prev[:, None]]
+        in_opponent_hand = (opponent_hand[:, None] >> np.arange(8)[None, :]) & 1
+        weights = POPCOUNT[best] * in_opponent_hand
+        cumulative = weights.cumsum(axis=1)
+        picks = (rng.random(rows.size) * cumulative[:, -1]).astype(np.int64)
+        opponent_cards = (cumulative > picks[:, None]).argmax(axis=1)
+        all_rows = np.arange(rows.size)
+        offsets = picks - (cumulative[all_rows, opponent_cards] - weights[all_rows, opponent_cards])
+        random_best = CARD_BITS[best[all_rows, opponent_cards], offsets]
+
+        spied = spied_cards != NO_SPIED_CARD
+        return np.where(
+            spied,
+            best_cards_against(own_hand, np.where(spied, spied_cards, 0), own_prev, opponent_prev, masks),
+            random_best,
+        )
+
+
+# Keyed by the same names the tournament uses for the per-game brains
+VECTORIZED_BRAINS = {
+    "random": VectorizedRandomAI,
+    "randomPlusBeatSpied": VectorizedRandomPlusBeatSpiedAI,
+    "beatOpponentRandom": VectorizedBeatOpponentRandomAI,
+    "spyingBeatRand": VectorizedSpyingBeatRandomAI,
+    "randomBestOutcome": VectorizedRandomBestOutcome,
+}
@@ -1,39 +1,49 @@
 import argparse
+import random
 import sys
-from collections import Counter
+import time
+from typing import Dict, List, Tuple
 
-from brains.Brain import Brain
+from brains.Brain import Brain, TurnRequest
 from brains.example_ai import RandomAI
 from brains.human import HumanBrain
+from brains.registry import default_registry
 from components.cards import Color, Card
+from components.compact_state import CompactGameStatus, hand_mask
 from components.fight import successful_spy_color
+from components.game_log import GameLogWriter, brain_name
 from components.game_status import GameStatus
-from components.player import Player
+from components.instrumentation import Instrumentation
+from components.match_stats import MatchStats
+from components.player import FALLBACK, OVERRUN_POLICIES, Player, TimeBudgetExceeded
+from components.rules import STANDARD_RULES, Rules, add_rules_arguments, rules_from_args
 from components.style import blueify, redify
 
 
-def _get_played_cards(red_player, blue_player, game, notify_of_hand=True):
+def turn_order(game) -> Tuple[Color, Color, bool]:
+    """Who picks a card first this round, who picks second, and whether the second player gets to see the first
+    player's card (because of a spy played last round)"""
     spy_color = successful_spy_color(game.most_recent_fight)
-    red_hand, blue_hand = None, None
-    if notify_of_hand:
-        red_hand = set(red_player.hand)
-        blue_hand = set(blue_player.hand)
     if spy_color == Color.red:
         # Red gets to peek at Blue's card
-        blue_card = blue_player.choose_and_play_card(game, opponent_hand=red_hand)
-        red_card = red_player.choose_and_play_card(
-            game, blue_card, opponent_hand=blue_hand
-        )
-    elif spy_color == Color.blue:
+        return Color.blue, Color.red, True
+    if spy_color == Color.blue:
         # Blue gets to peek at Red's card
-        red_card = red_player.choose_and_play_card(game, opponent_hand=blue_hand)
-        blue_card = blue_player.choose_and_play_card(
-            game, red_card, opponent_hand=red_hand
-        )
-    else:
-        red_card = red_player.choose_and_play_card(game, opponent_hand=blue_hand)
-        blue_card = blue_player.choose_and_play_card(game, opponent_hand=red_hand)
-    return red_card, blue_card
+        return Color.red, Color.blue, True
+    return Color.red, Color.blue, False
+
+
+def _get_played_cards(red_player, blue_player, game, notify_of_hand=True):
+    players = {Color.red: red_player, Color.blue: blue_player}
+    hands = {Color.red: None, Color.blue: None}
+    if notify_of_hand:
+        hands = {color: set(player.hand) for color, player in players.items()}
+    first, second, second_sees_first = turn_order(game)
+    first_card = players[first].choose_and_play_card(game, opponent_hand=hands[second])
+    second_card = players[second].choose_and_play_card(
+        game, first_card if second_sees_first else None, opponent_hand=hands[first]
+    )
+    return (first_card, second_card) if first == Color.red else (second_card, first_card)
 
 
 def play_game(
@@ -43,23 +53,66 @@ def play_game(
     initial_blue_hand_str=None,
     verbose=True,
     notify_of_hand=True,
+    compact=False,
+    instrumentation: Instrumentation = None,
+    time_budget: float = None,
+    overrun_policy: str = FALLBACK,
+    game_log: GameLogWriter = None,
+    rules: Rules = STANDARD_RULES,
 ):
+    """Plays a single game to completion.
+    :param compact: if True, track the game with a CompactGameStatus instead of a GameStatus. Brains see the same
+        interface, but the per-fight history isn't kept.
+    :param instrumentation: if given, brain decisions and fight resolution are timed and recorded in it
+    :param time_budget: seconds each brain gets per move, or None for no limit
+    :param overrun_policy: FALLBACK to play a random card in place of a move that took too long, FORFEIT to lose
+        the game instead
+    :param game_log: if given, the game is appended to it once it's over. Logs record the hands and fights but not
+        house rules, so games played with non-standard fight rules won't replay correctly.
+    :param rules: the rules variant to play, which also sets the starting hands unless they're given
+    """
     if red_brain is None:
         red_brain = HumanBrain()
     if blue_brain is None:
         blue_brain = RandomAI()
 
-    game = GameStatus()
-    red_hand = [Card.get_from_int(int(x)) for x in initial_red_hand_str] if initial_red_hand_str else None
-    blue_hand = [Card.get_from_int(int(x)) for x in initial_blue_hand_str] if initial_blue_hand_str else None
-    red_player = Player(Color.red, brain=red_brain, hand=red_hand)
-    blue_player = Player(Color.blue, brain=blue_brain, hand=blue_hand)
+    red_hand = (
+        [Card.get_from_int(int(x)) for x in initial_red_hand_str] if initial_red_hand_str else list(rules.cards)
+    )
+    blue_hand = (
+        [Card.get_from_int(int(x)) for x in initial_blue_hand_str] if initial_blue_hand_str else list(rules.cards)
+    )
+    if compact:
+        game = CompactGameStatus(red_hand=hand_mask(red_hand), blue_hand=hand_mask(blue_hand), rules=rules)
+    else:
+        game = GameStatus(rules=rules)
+    # Players play out of these lists, so the log needs the starting hands before they do
+    starting_hands = (hand_mask(red_hand), hand_mask(blue_hand)) if game_log is not None else None
+    limits = dict(instrumentation=instrumentation, time_budget=time_budget, overrun_policy=overrun_policy)
+    red_player = Player(Color.red, brain=red_brain, hand=red_hand, **limits)
+    blue_player = Player(Color.blue, brain=blue_brain, hand=blue_hand, **limits)
+    fights = bytearray() if game_log is not None else None
+    forfeit = None
 
     while not game.winner and red_player.has_cards() and blue_player.has_cards():
-        red_card, blue_card = _get_played_cards(
-            red_player, blue_player, game, notify_of_hand
-        )
-        result = game.resolve_fight(red_card, blue_card)
+        try:
+            red_card, blue_card = _get_played_cards(
+                red_player, blue_player, game, notify_of_hand
+            )
+        except TimeBudgetExceeded as e:
+            forfeit = e.color
+            game.forfeit(e.color)
+            if verbose:
+                print("{} forfeits: {}".format(e.color.name.title(), e))
+            break
+        if instrumentation is None:
+            result = game.resolve_fight(red_card, blue_card)
+        else:
+            start = time.perf_counter()
+            result = game.resolve_fight(red_card, blue_card)
+            instrumentation.record_resolve_fight(time.perf_counter() - start)
+        if fights is not None:
+            fights.append(red_card * 8 + blue_card)
         if verbose:
             result_string = "red {} vs. blue {} -> {}"
             print(
@@ -69,6 +122,16 @@ def play_game(
             )
             print(game.score_summary)
 
+    if game_log is not None:
+        game_log.add_game(
+            brain_name(red_brain),
+            brain_name(blue_brain),
+            fights,
+            red_hand=starting_hands[0],
+            blue_hand=starting_hands[1],
+            forfeit=forfeit,
+        )
+
     if verbose:
         if game.winner:
             print(game.winner.name.title(), "wins!")
@@ -79,16 +142,111 @@ def play_game(
     return game
 
 
+def _decide_turns(brains, requests, chosen_cards):
+    """Hands each brain all of its pending requests in one `play_turns` call.
+    :param requests: Color -> [(game index, TurnRequest)]
+    :param chosen_cards: filled in with (game index, Color) -> the card played
+    """
+    for color, color_requests in requests.items():
+        if not color_requests:
+            continue
+        cards = brains[color].play_turns([request for _, request in color_requests])
+        if len(cards) != len(color_requests):
+            raise ValueError(
+                "{} returned {} cards for {} turns".format(brains[color], len(cards), len(color_requests))
+            )
+        for (game_index, request), card in zip(color_requests, cards):
+            chosen_cards[(game_index, color)] = request.player.play_card(card)
+
+
+def play_games_batched(
+    red_brain: Brain,
+    blue_brain: Brain,
+    num_games: int,
+    notify_of_hand=True,
+    compact=False,
+    game_log: GameLogWriter = None,
+    rules: Rules = STANDARD_RULES,
+) -> List[GameStatus]:
+    """Plays `num_games` games side by side, a round at a time. Each round, every decision that doesn't depend on a
+    spied card goes to the brains in one `Brain.play_turns` call per color, then the spies' decisions in another,
+    following the same order as `play_game`.
+    """
+    brains = {Color.red: red_brain, Color.blue: blue_brain}
+    status_class = CompactGameStatus if compact else GameStatus
+    games = [status_class(rules=rules) for _ in range(num_games)]
+    players = [
+        {color: Player(color, brain, list(rules.cards)) for color, brain in brains.items()} for _ in range(num_games)
+    ]
+    fights = [bytearray() for _ in range(num_games)]
+    running = list(range(num_games))
+
+    while running:
+        first_requests: Dict[Color, list] = {Color.red: [], Color.blue: []}
+        spy_requests: Dict[Color, list] = {Color.red: [], Color.blue: []}
+        spies = []
+        for game_index in running:
+            game, game_players = games[game_index], players[game_index]
+            hands = {Color.red: None, Color.blue: None}
+            if notify_of_hand:
+                hands = {color: set(player.hand) for color, player in game_players.items()}
+            first, second, second_sees_first = turn_order(game)
+            first_requests[first].append((game_index, TurnRequest(game_players[first], game, None, hands[second])))
+            if second_sees_first:
+                spies.append((game_index, first, second, hands[first]))
+            else:
+                first_requests[second].append(
+                    (game_index, TurnRequest(game_players[second], game, None, hands[first]))
+                )
+
+        chosen_cards = {}
+        _decide_turns(brains, first_requests, chosen_cards)
+        for game_index, first, second, opponent_hand in spies:
+            spied_card = chosen_cards[(game_index, first)]
+            request = TurnRequest(players[game_index][second], games[game_index], spied_card, opponent_hand)
+            spy_requests[second].append((game_index, request))
+        _decide_turns(brains, spy_requests, chosen_cards)
+
+        still_running = []
+        for game_index in running:
+            red_card, blue_card = chosen_cards[(game_index, Color.red)], chosen_cards[(game_index, Color.blue)]
+            game = games[game_index]
+            game.resolve_fight(red_card, blue_card)
+            fights[game_index].append(red_card * 8 + blue_card)
+            if not game.winner and players[game_index][Color.red].has_cards():
+                still_running.append(game_index)
+        running = still_running
+
+    if game_log is not None:
+        for game_fights in fights:
+            game_log.add_game(
+                brain_name(red_brain),
+                brain_name(blue_brain),
+                game_fights,
+                red_hand=rules.hand_mask,
+                blue_hand=rules.hand_mask,
+            )
+    return games
+
+
 def print_match_summary(games):
-    winners = [game.winner for game in games]
+    stats = MatchStats().consume(games)
     print("Total wins for each player:")
-    win_counter = Counter(winners)
-    for player, wins in win_counter.items():
+    for player, wins in stats.wins.items():
         if player is None:
             print("{} ties".format(wins))
         else:
             print("{} won {} times".format(player.name, wins))
 
+    if stats.margins:
+        print("Final score margins (red - blue), excluding Princess wins:")
+        for margin, count in sorted(stats.margins.items()):
+            print("{:+d}: {}".format(margin, count))
+    if stats.fight_results:
+        print("Fight results:")
+        for result, count in sorted(stats.fight_results.items()):
+            print("{}: {}".format(result.name, count))
+
 
 # `notify_of_hand` tells blue what remains in red's hands and vice versa, since it's trivial
 # to track that if the game starts with known hands, and passing it down is the easiest way
@@ -100,30 +258,81 @@ def play_match(
     verbose=True,
     quiet_games=True,
     notify_of_hand=True,
+    compact=False,
+    instrumentation=None,
+    time_budget=None,
+    overrun_policy=FALLBACK,
+    game_log=None,
+    seed=None,
+    batch_size=1,
+    rules=STANDARD_RULES,
 ):
+    """Plays `num_games` games, yielding each one as it finishes.
+    :param game_log: a GameLogWriter, or the path of a new log file, to record every game in
+    :param seed: if given, seeds `random` before the first game so the match can be replayed
+    :param batch_size: if more than 1, games are played this many at a time with `play_games_batched`, so each
+        brain gets a round's decisions for the whole batch in one `play_turns` call. Games in a batch are yielded
+        once all of them are over. Can't be combined with instrumentation, time budgets or verbose games.
+    :param rules: the rules variant every game is played with (see `components.rules`)
+    """
     if red_brain is None:
         red_brain = HumanBrain()
     if blue_brain is None:
         blue_brain = RandomAI()
+    if batch_size > 1 and (instrumentation is not None or time_budget is not None or not quiet_games):
+        raise ValueError("Batched matches don't support instrumentation, time budgets or verbose games")
+    if seed is not None:
+        random.seed(seed)
+    owns_game_log = isinstance(game_log, str)
+    if owns_game_log:
+        game_log = GameLogWriter(game_log, seed=seed, rules=rules)
+    elif game_log is not None:
+        if (game_log.points_to_win, game_log.house_rules_id) != (rules.points_to_win, rules.house_rules_id):
+            raise ValueError("The game log records games played by different rules")
 
     if verbose:
         sys.stdout.write("\n")
-    for game_index in range(num_games):
-        game = play_game(
-            red_brain=red_brain,
-            blue_brain=blue_brain,
-            verbose=not quiet_games,
-            notify_of_hand=notify_of_hand,
-        )
-        if quiet_games and verbose:
-            # Games are quiet, so print some stuff at this level
-            winner_summary_lookup = {
-                Color.red: redify("r"),
-                Color.blue: blueify("b"),
-                None: "t",
-            }
-            sys.stdout.write(winner_summary_lookup[game.winner])
-        yield game
+    try:
+        for first_game in range(0, num_games, batch_size):
+            if batch_size > 1:
+                batch = play_games_batched(
+                    red_brain,
+                    blue_brain,
+                    min(batch_size, num_games - first_game),
+                    notify_of_hand=notify_of_hand,
+                    compact=compact,
+                    game_log=game_log,
+                    rules=rules,
+                )
+            else:
+                batch = [
+                    play_game(
+                        red_brain=red_brain,
+                        blue_brain=blue_brain,
+                        verbose=not quiet_games,
+                        notify_of_hand=notify_of_hand,
+                        compact=compact,
+                        instrumentation=instrumentation,
+                        time_budget=time_budget,
+                        overrun_policy=overrun_policy,
+                        game_log=game_log,
+                        rules=rules,
+                    )
+                ]
+            for game in batch:
+                if quiet_games and verbose:
+                    # Games are quiet, so print some stuff at this level
+                    winner_summary_lookup = {
+                        Color.red: redify("r"),
+                        Color.blue: blueify("b"),
+                        None: "t",
+                    }
+                    sys.stdout.write(winner_summary_lookup[game.winner])
+                yield game
+    finally:
+        # Also runs if the caller stops early, so the last block of the log still makes it to disk
+        if owns_game_log:
+            game_log.close()
 
     if verbose:
         sys.stdout.write("\n")
@@ -134,12 +343,13 @@ def args_from_match_parser():
     :return: dict of parsed args suitable for passing to play_match()
     """
 
+    registry = default_registry()
     parser = argparse.ArgumentParser(description="Play a match of Brave Rats games")
     parser.add_argument(
-        "-r", "--red-brain", help="Brain function name to use for red player"
+        "-r", "--red-brain", choices=registry.names(), help="Brain name to use for red player"
     )
     parser.add_argument(
-        "-b", "--blue-brain", help="Brain function name to use for blue player"
+        "-b", "--blue-brain", choices=registry.names(), help="Brain name to use for blue player"
     )
     parser.add_argument(
         "-n", "--num-games", type=int, help="Number of games to play in this match"
@@ -151,18 +361,35 @@ def args_from_match_parser():
         default=False,
         help="Set to have only game results (not turn-by-turn details) printed to stdout",
     )
+    parser.add_argument(
+        "--time-budget", type=float, help="Seconds each brain gets per move (default: no limit)"
+    )
+    parser.add_argument(
+        "--overrun-policy",
+        choices=OVERRUN_POLICIES,
+        help="What happens to a brain that goes over its time budget (default: {})".format(FALLBACK),
+    )
+    parser.add_argument("--game-log", help="Record every game in this binary log file")
+    parser.add_argument("-s", "--seed", help="Seed for a reproducible match")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        help="Play this many games at once, handing brains their decisions in batches (implies --quiet-games)",
+    )
+    add_rules_arguments(parser)
     args = vars(parser.parse_args())  # Convert the Namespace to a dict
+    if args["batch_size"] is not None and args["batch_size"] > 1:
+        if args["time_budget"] is not None:
+            parser.error("--batch-size can't be combined with --time-budget")
+        args["quiet_games"] = True  # Batched games are played all at once, so they can't be narrated turn by turn
+    args["rules"] = rules_from_args(args)
     args = {k: v for k, v in list(args.items()) if v is not None}  # Remove None values
 
-    # Look up brains by name
-    class_by_name = {
-        "random": RandomAI,
-        "human": HumanBrain,
-    }
+    # Look up brains by name. Only the modules of the two chosen brains get imported.
     if "red_brain" in args:
-        args["red_brain_fn"] = class_by_name[args.pop("red_brain")]()
+        args["red_brain"] = registry.create(args["red_brain"])
     if "blue_brain" in args:
-        args["blue_brain_fn"] = class_by_name[args.pop("blue_brain")]()
+        args["blue_brain"] = registry.create(args["blue_brain"])
     return args
 
 
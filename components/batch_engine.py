@@ -0,0 +1,211 @@
+"""Plays many independent games in lockstep with NumPy.
+
+Every game in a `BatchGames` lives in a row of a handful of arrays (hands as 8-bit masks, previous cards, points,
+points on hold), and each round is resolved for all still-running games at once by fancy-indexing a dense copy of
+the rules' fight table. Brains for this engine are `brains.vectorized.VectorizedBrain`s, which pick cards for a whole
+set of rows per call.
+"""
+import argparse
+import time
+from typing import Optional
+
+import numpy as np
+
+from components.cards import Card, Color
+from components.compact_state import NO_CARD, PRINCESS_POINTS
+from components.fight import FightResult, successful_spy_color
+from components.player import CheatingException
+from components.rules import STANDARD_RULES, Rules, add_rules_arguments, game_rules, rules_from_args
+
+_CARDS_BY_CODE = [card for card in Card] + [None]
+
+
+def _fight_results(rules: Rules) -> np.ndarray:
+    # FIGHT_TABLE is indexed [prev_red, prev_blue, red, blue], so move the cards just played to the front
+    return np.frombuffer(rules.fight_table, dtype=np.int8).reshape(9, 9, 8, 8).transpose(2, 3, 0, 1).copy()
+
+
+# FIGHT_RESULTS[red_card, blue_card, prev_red_card, prev_blue_card] -> FightResult value, under the standard rules
+FIGHT_RESULTS = _fight_results(STANDARD_RULES)
+
+# SPY_COLORS[prev_red_card, prev_blue_card] -> Color value of the player who gets to spy, or 0
+SPY_COLORS = np.array(
+    [
+        [
+            int(successful_spy_color((_CARDS_BY_CODE[prev_red], _CARDS_BY_CODE[prev_blue])) or 0)
+            for prev_blue in range(9)
+        ]
+        for prev_red in range(9)
+    ],
+    dtype=np.int8,
+)
+
+
+def _result_points(rules: Rules):
+    """Points for (red, blue) indexed by FightResult value, before adding anything on hold"""
+    red_points = np.zeros(len(FightResult) + 1, dtype=np.int32)
+    blue_points = np.zeros(len(FightResult) + 1, dtype=np.int32)
+    for result, (red, blue) in rules.result_points.items():
+        red_points[result], blue_points[result] = red, blue
+    return red_points, blue_points
+
+
+# Rules -> (fight results, red points, blue points) arrays for games played by them
+_TABLES_BY_RULES = {STANDARD_RULES: (FIGHT_RESULTS,) + _result_points(STANDARD_RULES)}
+
+# CARD_BITS[mask] -> the cards in `mask` in ascending order, padded with -1; POPCOUNT[mask] -> how many there are
+CARD_BITS = np.full((256, 8), -1, dtype=np.int8)
+POPCOUNT = np.zeros(256, dtype=np.int8)
+for _mask in range(256):
+    _bits = [code for code in range(8) if _mask >> code & 1]
+    CARD_BITS[_mask, : len(_bits)] = _bits
+    POPCOUNT[_mask] = len(_bits)
+
+NO_SPIED_CARD = -1
+
+
+class BatchGames(object):
+    """`num_games` games played by the same rules.
+    :param red_hand: starting hand mask for every game, all of the rules' cards by default
+    :param rules: defaults to the standard rules played to `points_to_win`
+    """
+
+    def __init__(
+        self,
+        num_games: int,
+        points_to_win: Optional[int] = None,
+        red_hand: Optional[int] = None,
+        blue_hand: Optional[int] = None,
+        rules: Optional[Rules] = None,
+    ):
+        self.num_games = num_games
+        self.rules = game_rules(points_to_win, rules)
+        self.points_to_win = self.rules.points_to_win
+        tables = _TABLES_BY_RULES.get(self.rules)
+        if tables is None:
+            tables = _TABLES_BY_RULES[self.rules] = (_fight_results(self.rules),) + _result_points(self.rules)
+        self.fight_results, self._red_points, self._blue_points = tables
+        full_hand = self.rules.hand_mask
+        self.red_hand = np.full(num_games, full_hand if red_hand is None else red_hand, dtype=np.uint8)
+        self.blue_hand = np.full(num_games, full_hand if blue_hand is None else blue_hand, dtype=np.uint8)
+        self.prev_red = np.full(num_games, NO_CARD, dtype=np.int8)
+        self.prev_blue = np.full(num_games, NO_CARD, dtype=np.int8)
+        self.red_points = np.zeros(num_games, dtype=np.int32)
+        self.blue_points = np.zeros(num_games, dtype=np.int32)
+        self.hold_points = np.zeros(num_games, dtype=np.int32)
+
+    @property
+    def winner(self) -> np.ndarray:
+        """Color value of each game's winner, 0 while there isn't one"""
+        return np.where(
+            self.red_points >= self.points_to_win,
+            int(Color.red),
+            np.where(self.blue_points >= self.points_to_win, int(Color.blue), 0),
+        ).astype(np.int8)
+
+    def active(self) -> np.ndarray:
+        return (self.winner == 0) & (self.red_hand != 0) & (self.blue_hand != 0)
+
+    def spy_color(self, rows: np.ndarray) -> np.ndarray:
+        return SPY_COLORS[self.prev_red[rows], self.prev_blue[rows]]
+
+    def view_for(self, color: Color, rows: np.ndarray):
+        """(own hand, opponent hand, own previous card, opponent previous card) for `rows`, from `color`'s side"""
+        if color == Color.red:
+            return self.red_hand[rows], self.blue_hand[rows], self.prev_red[rows], self.prev_blue[rows]
+        return self.blue_hand[rows], self.red_hand[rows], self.prev_blue[rows], self.prev_red[rows]
+
+    def resolve(self, rows: np.ndarray, red_cards: np.ndarray, blue_cards: np.ndarray) -> np.ndarray:
+        """Vectorized `GameStatus.resolve_fight` for the games in `rows`. Returns the FightResult values."""
+        red_hand, blue_hand = self.red_hand[rows], self.blue_hand[rows]
+        if np.any((red_hand >> red_cards) & 1 == 0) or np.any((blue_hand >> blue_cards) & 1 == 0):
+            raise CheatingException("A brain tried to play a card that is not in its hand")
+
+        results = self.fight_results[red_cards, blue_cards, self.prev_red[rows], self.prev_blue[rows]]
+        self.red_hand[rows] = red_hand & ~(np.uint8(1) << red_cards.astype(np.uint8))
+        self.blue_hand[rows] = blue_hand & ~(np.uint8(1) << blue_cards.astype(np.uint8))
+        self.prev_red[rows] = red_cards
+        self.prev_blue[rows] = blue_cards
+
+        hold = self.hold_points[rows]
+        red_base, blue_base = self._red_points[results], self._blue_points[results]
+        self.red_points[rows] += np.where(red_base > 0, red_base + hold, 0)
+        self.blue_points[rows] += np.where(blue_base > 0, blue_base + hold, 0)
+        self.red_points[rows[results == FightResult.red_wins_game]] = PRINCESS_POINTS
+        self.blue_points[rows[results == FightResult.blue_wins_game]] = PRINCESS_POINTS
+
+        # Two ambassadors on hold are worth an extra point, same as `GameStatus.on_hold_points`
+        both_ambassadors = (red_cards == Card.ambassador) & (blue_cards == Card.ambassador)
+        self.hold_points[rows] = np.where(results == FightResult.on_hold, hold + 1 + both_ambassadors, 0)
+        return results
+
+    def winner_counts(self):
+        winner = self.winner
+        return {
+            Color.red: int(np.count_nonzero(winner == Color.red)),
+            Color.blue: int(np.count_nonzero(winner == Color.blue)),
+            None: int(np.count_nonzero(winner == 0)),
+        }
+
+
+def play_batch(
+    red_brain, blue_brain, num_games: int, points_to_win: Optional[int] = None, rng=None, rules: Optional[Rules] = None
+) -> BatchGames:
+    """Batch equivalent of `play_match`: plays `num_games` games to completion and returns them.
+    Follows the same spy ordering as `brave_rats._get_played_cards`: a spied-on player picks first and the spy
+    picks knowing that card.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    games = BatchGames(num_games, points_to_win, rules=rules)
+
+    while True:
+        rows = np.flatnonzero(games.active())
+        if not rows.size:
+            return games
+        spy_color = games.spy_color(rows)
+        red_cards = np.empty(rows.size, dtype=np.int8)
+        blue_cards = np.empty(rows.size, dtype=np.int8)
+
+        red_first = spy_color != Color.red
+        blue_first = spy_color != Color.blue
+        no_spied_cards = np.full(rows.size, NO_SPIED_CARD, dtype=np.int8)
+        if red_first.any():
+            red_cards[red_first] = red_brain.choose(games, Color.red, rows[red_first], no_spied_cards[red_first], rng)
+        if blue_first.any():
+            blue_cards[blue_first] = blue_brain.choose(
+                games, Color.blue, rows[blue_first], no_spied_cards[blue_first], rng
+            )
+        if not red_first.all():
+            red_spies = ~red_first
+            red_cards[red_spies] = red_brain.choose(games, Color.red, rows[red_spies], blue_cards[red_spies], rng)
+        if not blue_first.all():
+            blue_spies = ~blue_first
+            blue_cards[blue_spies] = blue_brain.choose(games, Color.blue, rows[blue_spies], red_cards[blue_spies], rng)
+
+        games.resolve(rows, red_cards, blue_cards)
+
+
+if __name__ == "__main__":
+    from brains.vectorized import VECTORIZED_BRAINS
+
+    parser = argparse.ArgumentParser(description="Play a match of Brave Rats games with the batch engine")
+    parser.add_argument("-r", "--red-brain", default="random", choices=sorted(VECTORIZED_BRAINS))
+    parser.add_argument("-b", "--blue-brain", default="random", choices=sorted(VECTORIZED_BRAINS))
+    parser.add_argument("-n", "--num-games", type=int, default=100000)
+    parser.add_argument("-s", "--seed", type=int)
+    add_rules_arguments(parser)
+    args = parser.parse_args()
+    batch_rules = rules_from_args(vars(args))
+
+    start = time.time()
+    finished = play_batch(
+        VECTORIZED_BRAINS[args.red_brain](),
+        VECTORIZED_BRAINS[args.blue_brain](),
+        args.num_games,
+        rng=np.random.default_rng(args.seed),
+        rules=batch_rules,
+    )
+    elapsed = time.time() - start
+    counts = finished.winner_counts()
+    print("red won {} times, blue won {} times, {} ties".format(counts[Color.red], counts[Color.blue], counts[None]))
+    print("{} games in {:.2f}s ({:.0f} games/s)".format(args.num_games, elapsed, args.num_games / elapsed))
@@ -0,0 +1,304 @@
+import random
+from typing import Iterable, List, Optional, Tuple
+
+from components.cards import Card, Color
+from components.fight import NO_CARD, FightResult, card_code, successful_spy_color
+from components.game_status import GameStatus
+from components.rules import PRINCESS_POINTS, Rules, game_rules
+
+FULL_HAND = 0xFF
+
+_CARDS_BY_CODE: Tuple[Optional[Card], ...] = tuple(card for card in Card) + (None,)
+
+
+def hand_mask(cards: Iterable[Card]) -> int:
+    """Packs a collection of cards into an 8-bit mask, one bit per card value"""
+    mask = 0
+    for card in cards:
+        mask |= 1 << card
+    return mask
+
+
+def cards_in_mask(mask: int) -> List[Card]:
+    return [card for card in Card if mask >> card & 1]
+
+
+# Color of the player who gets to spy, indexed by `prev_red_code * 9 + prev_blue_code`
+SPY_COLORS: Tuple[Optional[Color], ...] = tuple(
+    successful_spy_color((_CARDS_BY_CODE[pr], _CARDS_BY_CODE[pb])) for pr in range(9) for pb in range(9)
+)
+
+
+class CompactGameStatus(object):
+    """Allocation-free equivalent of `GameStatus`.
+
+    Instead of lists of fights this only keeps what the rules actually look at: the score, the number of
+    points on hold and the most recent fight. Both hands are tracked as 8-bit masks, and the whole state
+    can be packed into a single int with `pack()`. `resolve_fight`, `winner` and `spy_color` behave exactly
+    like their `GameStatus` counterparts, so this can be handed to brains and to `play_game`.
+
+    Hands default to every card in `rules`, and like `GameStatus`, `points_to_win` defaults to the rules' own and
+    has to agree with it if given.
+    """
+
+    __slots__ = (
+        "points_to_win",
+        "red_points",
+        "blue_points",
+        "hold_points",
+        "prev_red",
+        "prev_blue",
+        "red_hand",
+        "blue_hand",
+        "rules",
+    )
+
+    def __init__(
+        self,
+        points_to_win: Optional[int] = None,
+        red_points: int = 0,
+        blue_points: int = 0,
+        hold_points: int = 0,
+        prev_red: int = NO_CARD,
+        prev_blue: int = NO_CARD,
+        red_hand: Optional[int] = None,
+        blue_hand: Optional[int] = None,
+        rules: Optional[Rules] = None,
+    ):
+        self.rules = rules = game_rules(points_to_win, rules)
+        self.points_to_win = rules.points_to_win
+        self.red_points, self.blue_points = red_points, blue_points
+        self.hold_points = hold_points
+        # Card codes of the most recent fight, NO_CARD before the first one
+        self.prev_red, self.prev_blue = prev_red, prev_blue
+        self.red_hand = rules.hand_mask if red_hand is None else red_hand
+        self.blue_hand = rules.hand_mask if blue_hand is None else blue_hand
+
+    @classmethod
+    def from_game_status(
+        cls, game: GameStatus, red_hand: Iterable[Card] = None, blue_hand: Iterable[Card] = None
+    ) -> "CompactGameStatus":
+        prev_red, prev_blue = game.most_recent_fight
+        return cls(
+            game.points_to_win,
+            game.red_points,
+            game.blue_points,
+            game.on_hold_points,
+            card_code(prev_red),
+            card_code(prev_blue),
+            None if red_hand is None else hand_mask(red_hand),
+            None if blue_hand is None else hand_mask(blue_hand),
+            game.rules,
+        )
+
+    def __str__(self):
+        return f"r: {self.red_points} b: {self.blue_points}, held: {self.hold_points}"
+
+    def clone(self):
+        return CompactGameStatus(
+            self.points_to_win,
+            self.red_points,
+            self.blue_points,
+            self.hold_points,
+            self.prev_red,
+            self.prev_blue,
+            self.red_hand,
+            self.blue_hand,
+            self.rules,
+        )
+
+    def pack(self) -> int:
+        """Packs hands, capped score, hold points and most recent fight into one int (`points_to_win` excluded)"""
+        return (
+            self.red_hand
+            | self.blue_hand << 8
+            | self.prev_red << 16
+            | self.prev_blue << 20
+            | min(self.hold_points, 15) << 24
+            | min(self.red_points, 15) << 28
+            | min(self.blue_points, 15) << 32
+        )
+
+    @classmethod
+    def unpack(
+        cls, packed: int, points_to_win: Optional[int] = None, rules: Optional[Rules] = None
+    ) -> "CompactGameStatus":
+        return cls(
+            points_to_win,
+            packed >> 28 & 0xF,
+            packed >> 32 & 0xF,
+            packed >> 24 & 0xF,
+            packed >> 16 & 0xF,
+            packed >> 20 & 0xF,
+            packed & 0xFF,
+            packed >> 8 & 0xFF,
+            rules,
+        )
+
+    @property
+    def on_hold_points(self):
+        return self.hold_points
+
+    @property
+    def winner(self):
+        if self.red_points >= self.points_to_win:
+            return Color.red
+        if self.blue_points >= self.points_to_win:
+            return Color.blue
+        return None
+
+    @property
+    def most_recent_fight(self):
+        return _CARDS_BY_CODE[self.prev_red], _CARDS_BY_CODE[self.prev_blue]
+
+    # Like `most_recent_fight`, but always (your_card, opponent_card)
+    def recent_fight_for(self, color: Color):
+        rec = self.most_recent_fight
+        return rec if color == Color.red else reversed(rec)
+
+    @property
+    def score_summary(self):
+        player_scores = "points: red {} to blue {}".format(self.red_points, self.blue_points)
+        if self.hold_points:
+            return player_scores + " with {} points on hold".format(self.hold_points)
+        return player_scores
+
+    def spy_color(self) -> Optional[Color]:
+        return SPY_COLORS[self.prev_red * 9 + self.prev_blue]
+
+    def resolve_fight(self, red_card, blue_card):
+        """Same as `GameStatus.resolve_fight`, but also removes the played cards from the tracked hands"""
+        result = self.rules.payoff_matrices[self.prev_red * 9 + self.prev_blue][red_card][blue_card]
+        self.prev_red, self.prev_blue = int(red_card), int(blue_card)
+        self.red_hand &= ~(1 << red_card)
+        self.blue_hand &= ~(1 << blue_card)
+
+        if result is FightResult.on_hold:
+            # Two ambassadors on hold are worth an extra point, same as `GameStatus.on_hold_points`
+            self.hold_points += 2 if red_card == blue_card == Card.ambassador else 1
+        else:
+            if result is FightResult.red_wins_game:
+                self.red_points = PRINCESS_POINTS
+            elif result is FightResult.blue_wins_game:
+                self.blue_points = PRINCESS_POINTS
+            else:
+                red_delta, blue_delta = self.rules.result_points[result]
+                if red_delta:
+                    self.red_points += red_delta + self.hold_points
+                else:
+                    self.blue_points += blue_delta + self.hold_points
+            self.hold_points = 0
+
+        return result
+
+    def forfeit(self, color: Color):
+        """Same as `GameStatus.forfeit`"""
+        if color == Color.red:
+            self.blue_points = PRINCESS_POINTS
+        else:
+            self.red_points = PRINCESS_POINTS
+
+
+def _zobrist_keys(count: int, rng: random.Random) -> Tuple[int, ...]:
+    return tuple(rng.getrandbits(64) for _ in range(count))
+
+
+# Fixed seed so hashes are stable across processes and runs, and can be stored alongside solved values
+_zobrist_rng = random.Random(0xB4A7E)
+_RED_CARD_KEYS = _zobrist_keys(8, _zobrist_rng)
+_BLUE_CARD_KEYS = _zobrist_keys(8, _zobrist_rng)
+# Points are capped at 15 for hashing, which covers the Princess sentinel
+_RED_POINT_KEYS = _zobrist_keys(16, _zobrist_rng)
+_BLUE_POINT_KEYS = _zobrist_keys(16, _zobrist_rng)
+_HOLD_KEYS = _zobrist_keys(16, _zobrist_rng)
+# Indexed by `prev_red_code * 9 + prev_blue_code`
+_PREV_FIGHT_KEYS = _zobrist_keys(81, _zobrist_rng)
+
+
+def hand_zobrist(color: Color, mask: int) -> int:
+    """The part of `SearchGameStatus.zobrist` contributed by one player's hand"""
+    keys = _RED_CARD_KEYS if color == Color.red else _BLUE_CARD_KEYS
+    zobrist = 0
+    for code in range(8):
+        if mask >> code & 1:
+            zobrist ^= keys[code]
+    return zobrist
+
+
+class SearchGameStatus(CompactGameStatus):
+    """A CompactGameStatus for tree searches: fights are applied with `push` and undone with `pop` in place, and
+    `zobrist` is a 64-bit hash of hands, score, points on hold and previous fight kept up to date along the way.
+    """
+
+    __slots__ = ("zobrist", "_undo")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._undo: List[Tuple[int, int, int, int, int, int]] = []
+        self.zobrist = self.compute_zobrist()
+
+    def clone(self):
+        return SearchGameStatus(
+            self.points_to_win,
+            self.red_points,
+            self.blue_points,
+            self.hold_points,
+            self.prev_red,
+            self.prev_blue,
+            self.red_hand,
+            self.blue_hand,
+            self.rules,
+        )
+
+    def compute_zobrist(self) -> int:
+        """Hash from scratch. Needed after assigning to the state's fields directly."""
+        zobrist = (
+            _RED_POINT_KEYS[min(self.red_points, 15)]
+            ^ _BLUE_POINT_KEYS[min(self.blue_points, 15)]
+            ^ _HOLD_KEYS[min(self.hold_points, 15)]
+            ^ _PREV_FIGHT_KEYS[self.prev_red * 9 + self.prev_blue]
+        )
+        return zobrist ^ hand_zobrist(Color.red, self.red_hand) ^ hand_zobrist(Color.blue, self.blue_hand)
+
+    def push(self, red_card, blue_card) -> FightResult:
+        """`resolve_fight`, remembering enough to `pop` it again"""
+        red_points, blue_points, hold_points = self.red_points, self.blue_points, self.hold_points
+        prev_red, prev_blue = self.prev_red, self.prev_blue
+        self._undo.append((red_points, blue_points, hold_points, prev_red, prev_blue, self.zobrist))
+
+        result = self.resolve_fight(red_card, blue_card)
+
+        zobrist = (
+            self.zobrist
+            ^ _RED_CARD_KEYS[red_card]
+            ^ _BLUE_CARD_KEYS[blue_card]
+            ^ _PREV_FIGHT_KEYS[prev_red * 9 + prev_blue]
+            ^ _PREV_FIGHT_KEYS[self.prev_red * 9 + self.prev_blue]
+        )
+        if self.red_points != red_points:
+            zobrist ^= _RED_POINT_KEYS[min(red_points, 15)] ^ _RED_POINT_KEYS[min(self.red_points, 15)]
+        if self.blue_points != blue_points:
+            zobrist ^= _BLUE_POINT_KEYS[min(blue_points, 15)] ^ _BLUE_POINT_KEYS[min(self.blue_points, 15)]
+        if self.hold_points != hold_points:
+            zobrist ^= _HOLD_KEYS[min(hold_points, 15)] ^ _HOLD_KEYS[min(self.hold_points, 15)]
+        self.zobrist = zobrist
+        return result
+
+    def pop(self):
+        """Undoes the most recent `push`"""
+        # The cards of the fight being undone are always the most recent fight
+        self.red_hand |= 1 << self.prev_red
+        self.blue_hand |= 1 << self.prev_blue
+        (
+            self.red_points,
+            self.blue_points,
+            self.hold_points,
+            self.prev_red,
+            self.prev_blue,
+            self.zobrist,
+        ) = self._undo.pop()
+
+    @property
+    def depth(self) -> int:
+        """Number of fights that can currently be popped"""
+        return len(self._undo)
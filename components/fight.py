@@ -23,8 +23,10 @@ def _short_format_result(fight_result_):
     }[fight_result_]
 
 
-def fight_result(red_card, blue_card, prev_red_card, prev_blue_card):
+def fight_result(red_card, blue_card, prev_red_card, prev_blue_card, general_bonus=2, princess_wins_game=True):
     """The main game engine. Figures out what the result of played cards should be.
+    :param general_bonus: strength added to a card played right after a General
+    :param princess_wins_game: if False, the Princess beating the Prince only wins the round
     :return: a FightResult
     """
     # 5. Wizard - nullifies opponent's power
@@ -39,9 +41,9 @@ def fight_result(red_card, blue_card, prev_red_card, prev_blue_card):
 
     # 1. Princess - wins against prince
     if red_has_power and red_card == Card.princess and blue_card == Card.prince:
-        return FightResult.red_wins_game
+        return FightResult.red_wins_game if princess_wins_game else FightResult.red_wins
     if blue_has_power and blue_card == Card.princess and red_card == Card.prince:
-        return FightResult.blue_wins_game
+        return FightResult.blue_wins_game if princess_wins_game else FightResult.blue_wins
 
     # 7. Prince - you win the round
     if red_has_power and red_card == Card.prince and blue_card != Card.prince:
@@ -54,14 +56,14 @@ def fight_result(red_card, blue_card, prev_red_card, prev_blue_card):
         Card.wizard,
         Card.musician,
     ]:
-        red_value = red_card.value + 2
+        red_value = red_card.value + general_bonus
     else:
         red_value = red_card.value
     if prev_blue_card == Card.general and prev_red_card not in [
         Card.wizard,
         Card.musician,
     ]:
-        blue_value = blue_card.value + 2
+        blue_value = blue_card.value + general_bonus
     else:
         blue_value = blue_card.value
 
@@ -87,9 +89,75 @@ def fight_result(red_card, blue_card, prev_red_card, prev_blue_card):
         return FightResult.on_hold
 
 
-# Cache off all possible values of fight_result for a fetch-speed gain
+# Integer code used for "no previous card" in the tables below. Real cards use their own value.
+NO_CARD = 8
+
+_CARDS_BY_CODE = tuple(card for card in Card) + (None,)
+_RESULTS_BY_VALUE = (None,) + tuple(FightResult)
+
+
+def card_code(card) -> int:
+    return NO_CARD if card is None else int(card)
+
+
+def fight_context(prev_red_card, prev_blue_card) -> int:
+    """Index of a previous fight, 0 to 80, for `PAYOFF_MATRICES`. Takes Cards, card codes or None."""
+    return card_code(prev_red_card) * 9 + card_code(prev_blue_card)
+
+
+def fight_index(red_code: int, blue_code: int, prev_red_code: int, prev_blue_code: int) -> int:
+    """Index into `FIGHT_TABLE`. Each previous fight's 8x8 block of results is contiguous."""
+    return ((prev_red_code * 9 + prev_blue_code) * 8 + red_code) * 8 + blue_code
+
+
+def compile_fight_table(general_bonus: int = 2, princess_wins_game: bool = True) -> bytes:
+    """Every `fight_result` under the given rules, as a flat table of FightResult values indexed by `fight_index`"""
+    return bytes(
+        fight_result(
+            Card(red),
+            Card(blue),
+            _CARDS_BY_CODE[prev_red],
+            _CARDS_BY_CODE[prev_blue],
+            general_bonus,
+            princess_wins_game,
+        )
+        for prev_red in range(9)
+        for prev_blue in range(9)
+        for red in range(8)
+        for blue in range(8)
+    )
+
+
+def compile_payoff_matrices(fight_table: bytes):
+    """A fight table as one [red_code][blue_code] matrix of FightResults per `fight_context`"""
+    return tuple(
+        tuple(
+            tuple(_RESULTS_BY_VALUE[fight_table[(context * 8 + red) * 8 + blue]] for blue in range(8))
+            for red in range(8)
+        )
+        for context in range(81)
+    )
+
+
+# FIGHT_TABLE[fight_index(...)] -> FightResult value, one byte for each of the 8 * 8 * 9 * 9 possible fights
+FIGHT_TABLE = compile_fight_table()
+
+# PAYOFF_MATRICES[fight_context(prev_red, prev_blue)][red_code][blue_code] -> FightResult
+PAYOFF_MATRICES = compile_payoff_matrices(FIGHT_TABLE)
+
+
+def resolve(red_card, blue_card, prev_red_card=None, prev_blue_card=None) -> FightResult:
+    """Same as `fight_result`, as a table lookup. Cards can be given as Cards or card codes, and previous cards
+    as None when there wasn't a previous fight."""
+    return PAYOFF_MATRICES[
+        (NO_CARD if prev_red_card is None else prev_red_card) * 9
+        + (NO_CARD if prev_blue_card is None else prev_blue_card)
+    ][red_card][blue_card]
+
+
+# Every value of fight_result, keyed by (red_card, blue_card, prev_red_card, prev_blue_card)
 QUICK_FIGHT_RESULT = {
-    cards_: fight_result(*cards_)
+    cards_: resolve(*cards_)
     for cards_ in itertools.product(
         *[[card for card in Card]] * 2 + [[card for card in Card] + [None]] * 2
     )
@@ -0,0 +1,68 @@
+"""Fight contexts: the previous fight boiled down to what it changes about the next one.
+
+The previous fight only matters through General bonuses and spies, so most (prev_red, prev_blue) pairs behave
+identically. They're collapsed into a handful of context ids that share a fight table and spy color, which is how
+`experiments.equilibrium_solver` states, tablebases and the CFR policy describe the previous fight.
+"""
+import itertools
+from typing import List
+
+from components.cards import Card
+from components.fight import NO_CARD, PAYOFF_MATRICES, successful_spy_color
+
+_CARDS_BY_CODE = [card for card in Card] + [None]
+
+
+def _context_signature(payoff_matrices, prev_red_code: int, prev_blue_code: int):
+    results = tuple(itertools.chain.from_iterable(payoff_matrices[prev_red_code * 9 + prev_blue_code]))
+    return results, successful_spy_color((_CARDS_BY_CODE[prev_red_code], _CARDS_BY_CODE[prev_blue_code]))
+
+
+def build_contexts(payoff_matrices=PAYOFF_MATRICES):
+    """Context ids for a fight table, as (context by prev, results by context, spy color by context). See
+    `CONTEXT_BY_PREV`, `CONTEXT_RESULTS` and `CONTEXT_SPY_COLOR`."""
+    signatures: List = []
+    context_by_prev = [0] * 81
+    for prev_red_code, prev_blue_code in itertools.product(range(9), range(9)):
+        signature = _context_signature(payoff_matrices, prev_red_code, prev_blue_code)
+        if signature not in signatures:
+            signatures.append(signature)
+        context_by_prev[prev_red_code * 9 + prev_blue_code] = signatures.index(signature)
+    return context_by_prev, [results for results, _ in signatures], [spy for _, spy in signatures]
+
+
+# CONTEXT_BY_PREV[prev_red_code * 9 + prev_blue_code] -> context id
+# CONTEXT_RESULTS[context][red_code * 8 + blue_code] -> FightResult
+# CONTEXT_SPY_COLOR[context] -> Color that gets to spy this round, if any
+CONTEXT_BY_PREV, CONTEXT_RESULTS, CONTEXT_SPY_COLOR = build_contexts()
+INITIAL_CONTEXT = CONTEXT_BY_PREV[NO_CARD * 9 + NO_CARD]
+
+
+def build_mirror_contexts(context_by_prev=CONTEXT_BY_PREV):
+    """The rules don't care which player is red, so swapping colors maps each context onto another one"""
+    mirror = [None] * (max(context_by_prev) + 1)
+    for prev_red_code, prev_blue_code in itertools.product(range(9), range(9)):
+        context = context_by_prev[prev_red_code * 9 + prev_blue_code]
+        mirrored = context_by_prev[prev_blue_code * 9 + prev_red_code]
+        if mirror[context] not in (None, mirrored):
+            raise AssertionError("Context {} has no consistent mirror image".format(context))
+        mirror[context] = mirrored
+    return mirror
+
+
+# MIRROR_CONTEXT[context] -> the context seen with red and blue swapped
+MIRROR_CONTEXT = build_mirror_contexts()
+
+
+def rules_contexts(payoff_matrices):
+    """(context by prev, results by context, spy color by context, mirror by context) for a fight table, reusing
+    the module's tables for the standard one. Context ids of other tables only mean something to one another."""
+    if payoff_matrices is PAYOFF_MATRICES:
+        return CONTEXT_BY_PREV, CONTEXT_RESULTS, CONTEXT_SPY_COLOR, MIRROR_CONTEXT
+    contexts = build_contexts(payoff_matrices)
+    return contexts + (build_mirror_contexts(contexts[0]),)
+
+
+def state_key(red_hand: int, blue_hand: int, red_points: int, blue_points: int, hold: int, context: int) -> int:
+    """A position packed into one int: hand masks, score, points on hold and context"""
+    return red_hand | blue_hand << 8 | red_points << 16 | blue_points << 20 | hold << 24 | context << 28
@@ -0,0 +1,213 @@
+"""Compact, append-only binary log of played games.
+
+File layout:
+    header:  magic, version, points to win, seed length, house rules id (see `Rules.house_rules_id`), then the seed
+             (UTF-8, empty if the run wasn't seeded). Version 1 logs have no house rules id and only hold games
+             played by the standard rules.
+    records: a stream of
+        brain name: 0xFF, brain id, name length, UTF-8 name. Written the first time a brain shows up in the file.
+        game:       status byte (number of fights in the low nibble, Color value of a forfeiting player above it),
+                    red brain id, blue brain id, red starting hand mask, blue starting hand mask,
+                    then one byte per fight: red card * 8 + blue card
+
+A full game is 5 + (number of fights) bytes; everything else about it (points, who won) comes from replaying the
+fights under the rules in the header; the card set isn't recorded, since each game's starting hands are. Writers
+buffer records in memory and hand them to the file in large blocks, so logging tens of millions of
+games costs a few hundred MB and very little time.
+"""
+import struct
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+from components.cards import Card, Color
+from components.compact_state import FULL_HAND, CompactGameStatus
+from components.rules import Rules, game_rules
+
+_MAGIC = b"BRGLOG\0\0"
+_VERSION = 2
+# Version 1 headers stop after the seed length
+_HEADER_V1 = struct.Struct("=8sHBH")
+_HOUSE_RULES = struct.Struct("=H")
+_NAME_RECORD = 0xFF
+_MAX_BRAINS = 255
+
+DEFAULT_BUFFER_SIZE = 1 << 22
+
+
+def brain_name(brain) -> str:
+    """Registry name of a brain if it has one, otherwise its class name"""
+    return getattr(brain, "name", None) or type(brain).__name__
+
+
+class LoggedGame(NamedTuple):
+    red_brain: str
+    blue_brain: str
+    red_hand: int
+    blue_hand: int
+    # (red card, blue card) per fight, in order
+    fights: List[Tuple[Card, Card]]
+    # Color that forfeited (e.g. by going over its time budget), or None
+    forfeit: Optional[Color]
+    # Rules the game was played by, as recorded in the log header (the standard rules if None)
+    rules: Optional[Rules] = None
+
+    def replay(self, points_to_win: Optional[int] = None, rules: Optional[Rules] = None) -> CompactGameStatus:
+        """Final state of the game, recomputed from its fights by the rules it was played by
+        :param points_to_win: overrides the points needed to win, with the standard rules
+        :param rules: overrides the rules the game is replayed by
+        """
+        if points_to_win is None and rules is None:
+            rules = self.rules
+        rules = game_rules(points_to_win, rules)
+        game = CompactGameStatus(red_hand=self.red_hand, blue_hand=self.blue_hand, rules=rules)
+        for red_card, blue_card in self.fights:
+            game.resolve_fight(red_card, blue_card)
+        if self.forfeit is not None:
+            game.forfeit(self.forfeit)
+        return game
+
+
+class GameLogWriter(object):
+    """Writes games to a new log file at `path`. Use as a context manager, or call `close` to flush the last block.
+
+    :param seed: seed of the run, if any, to record in the header
+    :param buffer_size: bytes to collect before each write to the file
+    :param rules: the rules the games are played by, defaults to the standard rules played to `points_to_win`
+    """
+
+    def __init__(
+        self,
+        path: str,
+        seed=None,
+        points_to_win: Optional[int] = None,
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+        rules: Optional[Rules] = None,
+    ):
+        self.path = path
+        rules = game_rules(points_to_win, rules)
+        self.points_to_win = rules.points_to_win
+        self.house_rules_id = rules.house_rules_id
+        self.buffer_size = buffer_size
+        self.num_games = 0
+        self._brain_ids = {}
+        self._file = open(path, "wb")
+        seed_bytes = b"" if seed is None else str(seed).encode()
+        self._buffer = bytearray(
+            _HEADER_V1.pack(_MAGIC, _VERSION, self.points_to_win, len(seed_bytes))
+            + _HOUSE_RULES.pack(self.house_rules_id)
+            + seed_bytes
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _brain_id(self, name: str) -> int:
+        brain_id = self._brain_ids.get(name)
+        if brain_id is None:
+            if len(self._brain_ids) >= _MAX_BRAINS:
+                raise ValueError("A game log can hold at most {} brains".format(_MAX_BRAINS))
+            brain_id = self._brain_ids[name] = len(self._brain_ids)
+            encoded = name.encode()
+            self._buffer += bytes((_NAME_RECORD, brain_id, len(encoded))) + encoded
+        return brain_id
+
+    def add_game(
+        self,
+        red_brain: str,
+        blue_brain: str,
+        fights: bytes,
+        red_hand: int = FULL_HAND,
+        blue_hand: int = FULL_HAND,
+        forfeit: Optional[Color] = None,
+    ):
+        """Appends one game.
+        :param fights: one byte per fight, red card * 8 + blue card
+        """
+        status = len(fights) | (0 if forfeit is None else int(forfeit) << 4)
+        self._buffer += bytes(
+            (status, self._brain_id(red_brain), self._brain_id(blue_brain), red_hand, blue_hand)
+        )
+        self._buffer += fights
+        self.num_games += 1
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self._file.write(self._buffer)
+        self._buffer = bytearray()
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+
+class GameLogReader(object):
+    """Reads back a log written by GameLogWriter. Iterating yields LoggedGames in the order they were written.
+    `rules` are the rules they were played by, over the full set of cards. Raises ValueError for logs of house
+    rules this version doesn't know."""
+
+    def __init__(self, path: str, chunk_size: int = DEFAULT_BUFFER_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+        with open(path, "rb") as f:
+            header = f.read(_HEADER_V1.size)
+            if len(header) < _HEADER_V1.size:
+                raise ValueError("{} is not a game log".format(path))
+            magic, version, self.points_to_win, seed_length = _HEADER_V1.unpack(header)
+            if magic != _MAGIC or version not in (1, _VERSION):
+                raise ValueError("{} is not a version 1 or {} game log".format(path, _VERSION))
+            self.house_rules_id = 0
+            if version > 1:
+                house_rules = f.read(_HOUSE_RULES.size)
+                if len(house_rules) < _HOUSE_RULES.size:
+                    raise ValueError("{} is not a game log".format(path))
+                (self.house_rules_id,) = _HOUSE_RULES.unpack(house_rules)
+            self.seed = f.read(seed_length).decode() or None
+            self._records_start = f.tell()
+        self.rules = Rules.from_house_rules_id(self.house_rules_id, self.points_to_win)
+
+    def raw_games(self) -> Iterator[Tuple[str, str, int, int, int, bytes]]:
+        """Games as (red brain, blue brain, red hand, blue hand, status byte, fight bytes), without building Cards.
+        Much cheaper than iterating over LoggedGames when converting or counting big logs."""
+        names = {}
+        with open(self.path, "rb") as f:
+            f.seek(self._records_start)
+            data = b""
+            position = 0
+            while True:
+                # Keep at least one full record (at most 258 bytes) ahead of `position`
+                if len(data) - position < 258:
+                    chunk = f.read(self.chunk_size)
+                    data = data[position:] + chunk
+                    position = 0
+                    if not data:
+                        return
+                status = data[position]
+                if status == _NAME_RECORD:
+                    brain_id, length = data[position + 1], data[position + 2]
+                    names[brain_id] = data[position + 3 : position + 3 + length].decode()
+                    position += 3 + length
+                    continue
+
+                num_fights = status & 0xF
+                red_id, blue_id, red_hand, blue_hand = data[position + 1 : position + 5]
+                fights = data[position + 5 : position + 5 + num_fights]
+                if len(fights) < num_fights:
+                    raise ValueError("{} ends in the middle of a game".format(self.path))
+                yield names[red_id], names[blue_id], red_hand, blue_hand, status, fights
+                position += 5 + num_fights
+
+    def __iter__(self) -> Iterator[LoggedGame]:
+        for red_brain, blue_brain, red_hand, blue_hand, status, fights in self.raw_games():
+            yield LoggedGame(
+                red_brain,
+                blue_brain,
+                red_hand,
+                blue_hand,
+                [(Card(fight >> 3), Card(fight & 7)) for fight in fights],
+                Color(status >> 4) if status >> 4 else None,
+                self.rules,
+            )
@@ -0,0 +1,218 @@
+"""Columnar, memory-mapped store of played games for bulk analysis.
+
+A store is a directory holding one flat file per column plus `meta.json` (version, number of games, points to
+win, house rules id and the brain name table). Every game in a store was played by the same rules. Every column
+has one row per game:
+
+    red_brain, blue_brain  uint8 index into the brain name table
+    red_hand, blue_hand    uint8 starting hand masks
+    num_fights             uint8
+    forfeit                uint8 Color value of a player who forfeited, or 0
+    fights                 uint8 x 8, red card * 8 + blue card per fight, padded with NO_FIGHT
+
+Columns are opened with `np.memmap`, so a store can be much bigger than RAM: `GameRecords.chunks` hands out
+consecutive slices and only the pages being worked on are read in.
+"""
+import json
+import os
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from components.game_log import GameLogReader
+from components.rules import Rules, game_rules
+
+_VERSION = 1
+_META_FILE = "meta.json"
+MAX_FIGHTS = 8
+NO_FIGHT = 0xFF
+# Brain columns are uint8 indexes into the brain name table
+MAX_BRAINS = 0x100
+
+# Column name -> values per game
+COLUMNS = {
+    "red_brain": 1,
+    "blue_brain": 1,
+    "red_hand": 1,
+    "blue_hand": 1,
+    "num_fights": 1,
+    "forfeit": 1,
+    "fights": MAX_FIGHTS,
+}
+
+_ROW_SIZE = sum(COLUMNS.values())
+_PADDING = [bytes([NO_FIGHT]) * (MAX_FIGHTS - num_fights) for num_fights in range(MAX_FIGHTS + 1)]
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+
+def _column_path(directory: str, column: str) -> str:
+    return os.path.join(directory, column + ".u8")
+
+
+def _read_meta(directory: str) -> dict:
+    with open(os.path.join(directory, _META_FILE)) as f:
+        meta = json.load(f)
+    if meta.get("version") != _VERSION:
+        raise ValueError("{} is not a version {} game record store".format(directory, _VERSION))
+    # Stores made before house rules were recorded only hold games played by the standard rules
+    meta.setdefault("house_rules_id", 0)
+    return meta
+
+
+def _describe_rules(points_to_win: int, house_rules_id: int) -> str:
+    return "games to {} points under house rules {}".format(points_to_win, house_rules_id)
+
+
+class GameRecordWriter(object):
+    """Appends games to the store in `directory`, creating it if needed. Use as a context manager, or call
+    `close` so the last block and the game count make it to disk.
+
+    :param rules: the rules the games were played by, defaults to the standard rules played to `points_to_win`
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        points_to_win: Optional[int] = None,
+        block_size: int = 1 << 16,
+        rules: Optional[Rules] = None,
+    ):
+        self.directory = directory
+        self.block_size = block_size
+        rules = game_rules(points_to_win, rules)
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(os.path.join(directory, _META_FILE)):
+            meta = _read_meta(directory)
+            stored = (meta["points_to_win"], meta["house_rules_id"])
+            if stored != (rules.points_to_win, rules.house_rules_id):
+                raise ValueError(
+                    "{} holds {}, not {}".format(
+                        directory, _describe_rules(*stored), _describe_rules(rules.points_to_win, rules.house_rules_id)
+                    )
+                )
+        else:
+            meta = {
+                "version": _VERSION,
+                "num_games": 0,
+                "points_to_win": rules.points_to_win,
+                "house_rules_id": rules.house_rules_id,
+                "brains": [],
+            }
+        self.meta = meta
+        self._brain_ids = {name: brain_id for brain_id, name in enumerate(meta["brains"])}
+        for column, width in COLUMNS.items():
+            # Drop any rows a crashed writer got onto disk without counting them in the metadata
+            path = _column_path(directory, column)
+            if os.path.exists(path):
+                os.truncate(path, meta["num_games"] * width)
+        self._files = {column: open(_column_path(directory, column), "ab") for column in COLUMNS}
+        # Rows are collected as bytes, all columns side by side, and split into columns on flush
+        self._block = bytearray()
+        self._block_rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def num_games(self) -> int:
+        return self.meta["num_games"] + self._block_rows
+
+    def _brain_id(self, name: str) -> int:
+        brain_id = self._brain_ids.get(name)
+        if brain_id is None:
+            brain_id = len(self.meta["brains"])
+            if brain_id >= MAX_BRAINS:
+                raise ValueError("A game record store can hold at most {} brains".format(MAX_BRAINS))
+            self._brain_ids[name] = brain_id
+            self.meta["brains"].append(name)
+        return brain_id
+
+    def add_game(self, red_brain: str, blue_brain: str, red_hand: int, blue_hand: int, status: int, fights: bytes):
+        """Appends one game, in the form `GameLogReader.raw_games` yields them"""
+        self._block += bytes(
+            (self._brain_id(red_brain), self._brain_id(blue_brain), red_hand, blue_hand, status & 0xF, status >> 4)
+        )
+        self._block += fights
+        self._block += _PADDING[len(fights)]
+        self._block_rows += 1
+        if self._block_rows == self.block_size:
+            self.flush()
+
+    def add_log(self, log: GameLogReader):
+        if (log.points_to_win, log.house_rules_id) != (self.meta["points_to_win"], self.meta["house_rules_id"]):
+            raise ValueError("{} holds {}".format(log.path, _describe_rules(log.points_to_win, log.house_rules_id)))
+        for game in log.raw_games():
+            self.add_game(*game)
+
+    def flush(self):
+        block = np.frombuffer(self._block, dtype=np.uint8).reshape(self._block_rows, _ROW_SIZE)
+        start = 0
+        for column, width in COLUMNS.items():
+            self._files[column].write(np.ascontiguousarray(block[:, start : start + width]).tobytes())
+            start += width
+        self.meta["num_games"] += self._block_rows
+        self._block = bytearray()
+        self._block_rows = 0
+
+    def close(self):
+        if self._files:
+            self.flush()
+            for f in self._files.values():
+                f.close()
+            self._files = {}
+            # The game count is only updated once the columns are on disk, so a crash never leaves the metadata
+            # claiming rows that aren't there
+            tmp_path = os.path.join(self.directory, _META_FILE + ".tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(self.meta, f)
+            os.replace(tmp_path, os.path.join(self.directory, _META_FILE))
+
+
+def convert_logs(log_paths: Iterable[str], directory: str) -> int:
+    """Appends every game in the given game logs to the store in `directory`. Returns the number of games added."""
+    added = 0
+    writer = None
+    try:
+        for path in log_paths:
+            log = GameLogReader(path)
+            if writer is None:
+                writer = GameRecordWriter(directory, rules=log.rules)
+            before = writer.num_games
+            writer.add_log(log)
+            added += writer.num_games - before
+    finally:
+        if writer is not None:
+            writer.close()
+    return added
+
+
+class GameRecords(object):
+    """Read-only view of a store. Each column is an `np.memmap` of shape (num_games,), or (num_games, 8) for
+    `fights`. Raises ValueError if the games were played by house rules this version doesn't know."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        meta = _read_meta(directory)
+        self.num_games: int = meta["num_games"]
+        self.points_to_win: int = meta["points_to_win"]
+        self.rules = Rules.from_house_rules_id(meta["house_rules_id"], self.points_to_win)
+        self.brains: List[str] = meta["brains"]
+        self.columns: Dict[str, np.ndarray] = {}
+        for column, width in COLUMNS.items():
+            if self.num_games:
+                shape = (self.num_games, width) if width > 1 else (self.num_games,)
+                self.columns[column] = np.memmap(_column_path(directory, column), np.uint8, "r", shape=shape)
+            else:
+                self.columns[column] = np.zeros((0, width) if width > 1 else 0, dtype=np.uint8)
+
+    def __len__(self):
+        return self.num_games
+
+    def chunks(self, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Dict[str, np.ndarray]]:
+        """Consecutive slices of every column, `chunk_size` games at a time"""
+        for start in range(0, self.num_games, chunk_size):
+            yield {column: values[start : start + chunk_size] for column, values in self.columns.items()}
@@ -4,19 +4,27 @@ from components.cards import Card, Color
 
 # Game ends when players have played all of their cards, so the max number of rounds
 # in the game is the size of the players' initial hand.
-from components.fight import QUICK_FIGHT_RESULT, FightResult, successful_spy_color
+from components.fight import NO_CARD, FightResult, successful_spy_color
+from components.rules import PRINCESS_POINTS, Rules, game_rules
 
 
 class GameStatus(object):
     def __init__(
         self,
-        points_to_win: int = 4,
+        points_to_win: Optional[int] = None,
         red_points: int = 0,
         blue_points: int = 0,
         resolved_fights: List[Tuple] = None,
         on_hold_fights: List[Tuple] = None,
+        rules: Optional[Rules] = None,
     ):
-        self.points_to_win = points_to_win
+        """
+        :param points_to_win: defaults to `rules.points_to_win`. Passing a different number than the rules play to
+            raises ValueError.
+        :param rules: the rules to play by, the standard ones to `points_to_win` if not given
+        """
+        self.rules = game_rules(points_to_win, rules)
+        self.points_to_win = self.rules.points_to_win
         self.red_points, self.blue_points = red_points, blue_points
 
         # List of tuples of (red_card, blue_card)
@@ -29,7 +37,12 @@ class GameStatus(object):
 
     def clone(self):
         return GameStatus(
-            self.points_to_win, self.red_points, self.blue_points, self.resolved_fights, self.on_hold_fights
+            self.points_to_win,
+            self.red_points,
+            self.blue_points,
+            self.resolved_fights,
+            self.on_hold_fights,
+            self.rules,
         )
 
     @property
@@ -82,32 +95,42 @@ class GameStatus(object):
         """
         previous_red_card, previous_blue_card = self.most_recent_fight
 
-        # Using QUICK_FIGHT_RESULT is equivalent to this, but all the answers have been cached off
+        # Same as `fight.resolve` with the rules' own table, inlined, and equivalent to this, but all the answers
+        # have been cached off
         # result = fight_result(red_card, blue_card, previous_red_card, previous_blue_card)
-        result = QUICK_FIGHT_RESULT[
-            (red_card, blue_card, previous_red_card, previous_blue_card)
-        ]
+        result = self.rules.payoff_matrices[
+            (NO_CARD if previous_red_card is None else previous_red_card) * 9
+            + (NO_CARD if previous_blue_card is None else previous_blue_card)
+        ][red_card][blue_card]
 
         if result is FightResult.on_hold:
             self.on_hold_fights.append((red_card, blue_card))
-        else:
-            self.resolved_fights.extend(self.on_hold_fights)
-            self.resolved_fights.append((red_card, blue_card))
-            points_from_on_hold = self.on_hold_points
-            self.on_hold_fights = []
-
-        if result in {FightResult.red_wins, FightResult.red_wins_2}:
-            extra_point = 1 if result is FightResult.red_wins_2 else 0
-            self.red_points += 1 + points_from_on_hold + extra_point
+            return result
 
-        if result in {FightResult.blue_wins, FightResult.blue_wins_2}:
-            extra_point = 1 if result is FightResult.blue_wins_2 else 0
-            self.blue_points += 1 + points_from_on_hold + extra_point
+        points_from_on_hold = self.on_hold_points
+        self.resolved_fights.extend(self.on_hold_fights)
+        self.resolved_fights.append((red_card, blue_card))
+        self.on_hold_fights = []
 
         # If you win by princess, just max out the scoreboard
-        if result == FightResult.red_wins_game:
-            self.red_points = 999999
-        if result == FightResult.blue_wins_game:
-            self.blue_points = 999999
+        if result is FightResult.red_wins_game:
+            self.red_points = PRINCESS_POINTS
+        elif result is FightResult.blue_wins_game:
+            self.blue_points = PRINCESS_POINTS
+        else:
+            red_points, blue_points = self.rules.result_points[result]
+            if red_points:
+                self.red_points += red_points + points_from_on_hold
+            else:
+                self.blue_points += blue_points + points_from_on_hold
 
         return result
+
+    def forfeit(self, color: Color):
+        """Ends the game with a loss for `color`, e.g. because their brain ran out of time.
+        Like a Princess win, the opponent's side of the scoreboard is just maxed out.
+        """
+        if color == Color.red:
+            self.blue_points = PRINCESS_POINTS
+        else:
+            self.red_points = PRINCESS_POINTS
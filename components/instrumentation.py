@@ -0,0 +1,140 @@
+import bisect
+import json
+from collections import Counter, defaultdict
+from typing import Dict, Tuple
+
+# Upper edges of the latency histogram buckets, in seconds. Anything slower lands in a final overflow bucket.
+BUCKET_EDGES = [scale * 10.0 ** exponent for exponent in range(-7, 1) for scale in (1, 2, 5)]
+
+# Kinds of turn a decision can be made on
+NORMAL_TURN = "normal"
+SPYING_TURN = "spying"  # the brain was shown its opponent's card
+SPIED_ON_TURN = "spied_on"  # the brain has to commit first because its opponent spied
+
+
+class LatencyHistogram(object):
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        # Bucket index (into BUCKET_EDGES, or len(BUCKET_EDGES) for overflow) -> count
+        self.buckets = Counter()
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.buckets[bisect.bisect_left(BUCKET_EDGES, seconds)] += 1
+
+    def merge(self, other: "LatencyHistogram"):
+        self.count += other.count
+        self.total_seconds += other.total_seconds
+        self.max_seconds = max(self.max_seconds, other.max_seconds)
+        self.buckets.update(other.buckets)
+
+    @property
+    def mean_seconds(self) -> float:
+        return self.total_seconds / self.count if self.count else 0.0
+
+    def percentile(self, fraction: float) -> float:
+        """Upper edge of the bucket holding the given fraction of samples, so an upper bound on the real value"""
+        target = fraction * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= target:
+                return BUCKET_EDGES[index] if index < len(BUCKET_EDGES) else self.max_seconds
+        return self.max_seconds
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total_seconds": self.total_seconds,
+            "max_seconds": self.max_seconds,
+            "buckets": {
+                ("le_{:g}".format(BUCKET_EDGES[index]) if index < len(BUCKET_EDGES) else "overflow"): count
+                for index, count in sorted(self.buckets.items())
+            },
+        }
+
+
+class Instrumentation(object):
+    """Opt-in timing for the game loop.
+
+    Pass one to `play_game`/`play_match` and it records how long every `Brain.play_turn` call took, keyed by
+    brain class, turn number (0-based, per player) and kind of turn, plus the number of `resolve_fight` calls and
+    the time spent in them. Instances from separate runs or processes can be combined with `merge`.
+    """
+
+    def __init__(self):
+        self.decisions: Dict[Tuple[str, int, str], LatencyHistogram] = defaultdict(LatencyHistogram)
+        self.resolve_fight_calls = 0
+        self.resolve_fight_seconds = 0.0
+        # Brain class name -> number of moves that went over their time budget
+        self.overruns = Counter()
+
+    def record_decision(self, brain_name: str, turn: int, turn_kind: str, seconds: float):
+        self.decisions[(brain_name, turn, turn_kind)].add(seconds)
+
+    def record_overrun(self, brain_name: str):
+        self.overruns[brain_name] += 1
+
+    def record_resolve_fight(self, seconds: float):
+        self.resolve_fight_calls += 1
+        self.resolve_fight_seconds += seconds
+
+    def merge(self, other: "Instrumentation") -> "Instrumentation":
+        for key, histogram in other.decisions.items():
+            self.decisions[key].merge(histogram)
+        self.resolve_fight_calls += other.resolve_fight_calls
+        self.resolve_fight_seconds += other.resolve_fight_seconds
+        self.overruns.update(other.overruns)
+        return self
+
+    def by_brain(self) -> Dict[str, LatencyHistogram]:
+        totals: Dict[str, LatencyHistogram] = defaultdict(LatencyHistogram)
+        for (brain_name, _, _), histogram in self.decisions.items():
+            totals[brain_name].merge(histogram)
+        return totals
+
+    def summary_table(self) -> str:
+        header = "{:30} {:>9} {:>12} {:>12} {:>12} {:>12}".format(
+            "brain / turn / kind", "calls", "total s", "mean us", "p99 us", "max us"
+        )
+        lines = [header, "-" * len(header)]
+
+        def row(label, histogram):
+            return "{:30} {:>9} {:>12.3f} {:>12.1f} {:>12.1f} {:>12.1f}".format(
+                label,
+                histogram.count,
+                histogram.total_seconds,
+                histogram.mean_seconds * 1e6,
+                histogram.percentile(0.99) * 1e6,
+                histogram.max_seconds * 1e6,
+            )
+
+        for brain_name, total in sorted(self.by_brain().items(), key=lambda item: -item[1].total_seconds):
+            lines.append(row(brain_name, total))
+            for (name, turn, turn_kind), histogram in sorted(self.decisions.items()):
+                if name == brain_name:
+                    lines.append(row("  turn {} {}".format(turn, turn_kind), histogram))
+        lines.append(
+            "resolve_fight: {} calls, {:.3f}s".format(self.resolve_fight_calls, self.resolve_fight_seconds)
+        )
+        for brain_name, count in sorted(self.overruns.items()):
+            lines.append("{} went over its time budget {} times".format(brain_name, count))
+        return "\n".join(lines)
+
+    def to_dict(self):
+        return {
+            "decisions": [
+                {"brain": brain_name, "turn": turn, "turn_kind": turn_kind, **histogram.to_dict()}
+                for (brain_name, turn, turn_kind), histogram in sorted(self.decisions.items())
+            ],
+            "resolve_fight": {"calls": self.resolve_fight_calls, "total_seconds": self.resolve_fight_seconds},
+            "overruns": dict(self.overruns),
+        }
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
@@ -0,0 +1,106 @@
+"""Read-only, memory-mapped lookup tables keyed by 64-bit ints.
+
+File layout (native byte order):
+    header: magic, version, record count, value typecode, values per record
+    keys:   `count` sorted unsigned 64-bit ints
+    values: `count * width` values of the given `array` typecode
+
+Opening a table only maps the file, so startup cost doesn't depend on its size, and every process that opens the
+same file shares one copy of it in the page cache.
+"""
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+_MAGIC = b"BRTABLE\0"
+_VERSION = 1
+_HEADER = struct.Struct("=8sIQcB")
+_HEADER_SIZE = 32  # _HEADER.size rounded up so the key array is 8-byte aligned
+
+Value = Union[float, int, Tuple]
+
+
+class MappedTable(object):
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, typecode, width = _HEADER.unpack_from(self._mmap)
+        if magic != _MAGIC or version != _VERSION:
+            self._mmap.close()
+            raise ValueError("{} is not a version {} table file".format(path, _VERSION))
+
+        self.typecode = typecode.decode()
+        self.width = width
+        view = memoryview(self._mmap)
+        keys_end = _HEADER_SIZE + 8 * count
+        self._keys = view[_HEADER_SIZE:keys_end].cast("Q")
+        item_size = array(self.typecode).itemsize
+        self._values = view[keys_end : keys_end + item_size * width * count].cast(self.typecode)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key: int):
+        return self._index(key) is not None
+
+    def _index(self, key: int) -> Optional[int]:
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return i
+        return None
+
+    def _value_at(self, i: int) -> Value:
+        if self.width == 1:
+            return self._values[i]
+        return tuple(self._values[i * self.width : (i + 1) * self.width])
+
+    def get(self, key: int, default: Optional[Value] = None) -> Optional[Value]:
+        i = self._index(key)
+        return default if i is None else self._value_at(i)
+
+    def get_many(self, keys: Sequence[int], default: Optional[Value] = None) -> List[Optional[Value]]:
+        """`get` for each of `keys`, looking up each distinct key only once"""
+        found = {key: self.get(key, default) for key in set(keys)}
+        return [found[key] for key in keys]
+
+    def items(self) -> Iterator[Tuple[int, Value]]:
+        for i, key in enumerate(self._keys):
+            yield key, self._value_at(i)
+
+    def close(self):
+        self._keys.release()
+        self._values.release()
+        self._mmap.close()
+
+
+def write_table(path: str, records: Dict[int, Value], typecode: str = "d", width: int = 1):
+    """Writes `records` to `path` as a table file. Goes through a temp file so open readers are never left
+    looking at a half-written table."""
+    keys = array("Q", sorted(records))
+    values = array(typecode)
+    for key in keys:
+        value = records[key]
+        if width == 1:
+            values.append(value)
+        else:
+            values.extend(value)
+
+    tmp_path = "{}.tmp{}".format(path, os.getpid())
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, len(keys), typecode.encode(), width).ljust(_HEADER_SIZE, b"\0"))
+        keys.tofile(f)
+        values.tofile(f)
+    os.replace(tmp_path, path)
+
+
+def merged_records(*sources: Optional[Union[MappedTable, Dict[int, Value]]]) -> Dict[int, Value]:
+    """All records from `sources`; later sources win when keys collide"""
+    merged: Dict[int, Value] = {}
+    for source in sources:
+        if source is not None:
+            merged.update(source.items())
+    return merged
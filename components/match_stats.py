@@ -0,0 +1,139 @@
+import math
+from collections import Counter
+from enum import Enum
+from statistics import NormalDist
+from typing import Iterable, Optional, Tuple
+
+from components.cards import Color
+from components.compact_state import PRINCESS_POINTS
+from components.game_status import GameStatus
+
+
+class MatchStats(object):
+    """Running totals over a stream of finished games.
+
+    Feed it games one at a time (or hand `consume` a generator such as `play_match`) and nothing but the counters
+    is kept, so memory use doesn't grow with the number of games. Stats from separate runs can be combined with
+    `merge`.
+    """
+
+    def __init__(self):
+        self.num_games = 0
+        # Color of the winner, or None for ties -> count
+        self.wins = Counter()
+        # red points - blue points -> count. Games won with the Princess aren't included, since their score is
+        # a sentinel rather than a real margin.
+        self.margins = Counter()
+        # FightResult -> count, over every fight of every game
+        self.fight_results = Counter()
+
+    def add_game(self, game: GameStatus):
+        self.num_games += 1
+        self.wins[game.winner] += 1
+
+        if max(game.red_points, game.blue_points) < PRINCESS_POINTS:
+            self.margins[game.red_points - game.blue_points] += 1
+
+        # CompactGameStatus doesn't keep its fights, so only GameStatus games contribute fight results
+        if isinstance(game, GameStatus):
+            previous_fight = (None, None)
+            for fight in game.resolved_fights + game.on_hold_fights:
+                self.fight_results[game.rules.resolve(*fight, *previous_fight)] += 1
+                previous_fight = fight
+
+    def consume(self, games: Iterable[GameStatus]) -> "MatchStats":
+        for game in games:
+            self.add_game(game)
+        return self
+
+    def merge(self, other: "MatchStats") -> "MatchStats":
+        self.num_games += other.num_games
+        self.wins.update(other.wins)
+        self.margins.update(other.margins)
+        self.fight_results.update(other.fight_results)
+        return self
+
+    @property
+    def red_wins(self):
+        return self.wins[Color.red]
+
+    @property
+    def blue_wins(self):
+        return self.wins[Color.blue]
+
+    @property
+    def ties(self):
+        return self.wins[None]
+
+    @property
+    def red_score(self) -> float:
+        """Red's average result per game, counting a win as 1 and a tie as 0.5"""
+        if not self.num_games:
+            return 0.5
+        return (self.red_wins + 0.5 * self.ties) / self.num_games
+
+    @property
+    def score_variance(self) -> float:
+        """Variance of red's result in a single game"""
+        if not self.num_games:
+            return 0.25
+        return (self.red_wins + 0.25 * self.ties) / self.num_games - self.red_score ** 2
+
+    def score_interval(self, confidence: float = 0.95) -> Tuple[float, float]:
+        """Normal-approximation confidence interval for `red_score`"""
+        if not self.num_games:
+            return 0.0, 1.0
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        half_width = z * math.sqrt(self.score_variance / self.num_games)
+        return max(self.red_score - half_width, 0.0), min(self.red_score + half_width, 1.0)
+
+
+class Verdict(Enum):
+    red_stronger = 1
+    blue_stronger = 2
+    even = 3
+
+
+class SequentialTest(object):
+    """Sequential probability ratio tests on a matchup's results, so a match can stop as soon as it's clear how the
+    two brains compare instead of playing out a fixed number of games.
+
+    Two tests run side by side on red's score (see `MatchStats.red_score`), each using the normal approximation to
+    the log-likelihood ratio: an even score against red scoring 0.5 + margin, and an even score against red
+    scoring 0.5 - margin. Either one accepting its alternative settles which brain is stronger; both accepting an
+    even score settles the matchup as even. Scores between those points can take a long time to settle, so
+    callers should still cap the number of games.
+
+    :param margin: how far from an even score counts as one brain being stronger
+    :param error_rate: chance of each test accepting the wrong hypothesis
+    :param min_games: games to play before the test is allowed to stop a match
+    """
+
+    def __init__(self, margin: float = 0.05, error_rate: float = 0.05, min_games: int = 50):
+        self.margin = margin
+        self.error_rate = error_rate
+        self.min_games = min_games
+        self.upper_bound = math.log((1 - error_rate) / error_rate)
+        self.lower_bound = -self.upper_bound
+
+    def log_likelihood_ratios(self, stats: MatchStats) -> Tuple[float, float]:
+        """Evidence for red scoring 0.5 + margin over 0.5, and for red scoring 0.5 - margin over 0.5"""
+        if not stats.num_games:
+            return 0.0, 0.0
+        # Every game going the same way leaves no variance to estimate; a tiny floor makes that decisive
+        scale = self.margin * stats.num_games / max(stats.score_variance, 1e-9)
+        excess = stats.red_score - 0.5
+        return scale * (excess - self.margin / 2), scale * (-excess - self.margin / 2)
+
+    def decide(self, stats: MatchStats) -> Optional[Verdict]:
+        """How the brains compare once the tests have settled, otherwise None"""
+        if stats.num_games < self.min_games:
+            return None
+        red_llr, blue_llr = self.log_likelihood_ratios(stats)
+        if red_llr >= self.upper_bound:
+            return Verdict.red_stronger
+        if blue_llr >= self.upper_bound:
+            return Verdict.blue_stronger
+        if red_llr <= self.lower_bound and blue_llr <= self.lower_bound:
+            return Verdict.even
+        return None
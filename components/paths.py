@@ -0,0 +1,11 @@
+"""Where generated files live by default. This module imports nothing from the repo, so scripts can look the paths
+up without importing the code that reads or writes the files."""
+import os
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Where `experiments.cfr` writes its policy by default, and where `cfrPolicy` looks for it
+DEFAULT_POLICY_PATH = os.path.join(REPO_ROOT, "cfr_policy.brt")
+
+# Where `python -m experiments.tablebase` writes its tablebase by default, and where `ismcts` looks for one
+DEFAULT_TABLEBASE_PATH = os.path.join(REPO_ROOT, "endgame.brt")
@@ -1,17 +1,97 @@
+import queue
+import random
+import threading
+import time
+import weakref
 from typing import Optional, Set, List
 
 from brains.Brain import Brain
 from components import cards
 from components.cards import Card, Color
 from components.game_status import GameStatus
+from components.instrumentation import NORMAL_TURN, SPIED_ON_TURN, SPYING_TURN, Instrumentation
+
+
+# What happens when a brain takes longer than its time budget to pick a card
+FALLBACK = "fallback"  # its pick is thrown away and a random card from its hand is played instead
+FORFEIT = "forfeit"  # it loses the game
+OVERRUN_POLICIES = (FALLBACK, FORFEIT)
+
+
+
+class _Move(object):
+    """One move handed to a _BrainWorker. `finished` is held until the worker is done with it, for the player to
+    wait on."""
+
+    def __init__(self, function, args, kwargs):
+        self.function, self.args, self.kwargs = function, args, kwargs
+        self.card: Optional[Card] = None
+        self.error: Optional[BaseException] = None
+        self.is_done = False
+        self.finished = threading.Lock()
+        self.finished.acquire()
+
+
+class _BrainWorker(object):
+    """A daemon thread that runs one brain's moves, one at a time, for as long as the brain is around. Being a
+    daemon, a brain stuck for good doesn't keep the process alive after the games are over."""
+
+    def __init__(self, brain: Brain):
+        self._calls = queue.SimpleQueue()
+        self.current: Optional[_Move] = None
+        threading.Thread(target=self._run, args=(self._calls,), name="{} worker".format(brain), daemon=True).start()
+        # The thread doesn't hold on to the brain between moves, so this runs once the brain is done with
+        weakref.finalize(brain, self.stop)
+
+    @staticmethod
+    def _run(calls: queue.SimpleQueue):
+        while True:
+            move = calls.get()
+            if move is None:
+                return
+            try:
+                move.card = move.function(*move.args, **move.kwargs)
+            except BaseException as e:
+                move.error = e
+            move.function = move.args = move.kwargs = None
+            move.is_done = True
+            move.finished.release()
+            del move
+
+    def submit(self, function, *args, **kwargs) -> _Move:
+        self.current = _Move(function, args, kwargs)
+        self._calls.put(self.current)
+        return self.current
+
+    def stop(self):
+        """Lets the thread end once it's done with the move it's on, if any"""
+        self._calls.put(None)
+
+
+# Brain -> the worker that runs its moves when they have a time budget
+_WORKERS = weakref.WeakKeyDictionary()
 
 
 class CheatingException(Exception):
     pass
 
 
+class TimeBudgetExceeded(Exception):
+    def __init__(self, color: Color, message: str):
+        super().__init__(message)
+        self.color = color
+
+
 class Player(object):
-    def __init__(self, color: Color, brain: Brain, hand: List[Card] = None):
+    def __init__(
+        self,
+        color: Color,
+        brain: Brain,
+        hand: List[Card] = None,
+        instrumentation: Optional[Instrumentation] = None,
+        time_budget: Optional[float] = None,
+        overrun_policy: str = FALLBACK,
+    ):
         """
         :param color: a Color enum value indicating which color this player is playing for
         :param game: a GameStatus object
@@ -25,10 +105,20 @@ class Player(object):
             Should return a card from its hand to play. Can harbor hidden powers; should be expected to be called
                 exactly once per round.
         :param hand_str: string of card values in initial hand (eg. '0123456' to play without Prince)
+        :param instrumentation: if given, every call to the brain is timed and recorded in it
+        :param time_budget: seconds the brain gets per move. Brains with `supports_deadline` are told when their
+            time is up. Every move is run on a worker thread, and once the budget is up the game moves on without
+            it, dealing with the brain according to `overrun_policy`.
         """
+        if overrun_policy not in OVERRUN_POLICIES:
+            raise ValueError("overrun_policy must be one of {}".format(OVERRUN_POLICIES))
         self.hand = hand if hand else [card for card in Card]
         self.color = color
         self.brain = brain
+        self.instrumentation = instrumentation
+        self.time_budget = time_budget
+        self.overrun_policy = overrun_policy
+        self.cards_played = 0
 
     def has_cards(self) -> bool:
         return bool(len(self.hand))
@@ -39,12 +129,80 @@ class Player(object):
         spied_card: Optional[Card] = None,
         opponent_hand: Optional[Set[Card]] = None,
     ) -> Card:
-        card = self.brain.play_turn(self, game, spied_card, opponent_hand)
+        if self.instrumentation is None and self.time_budget is None:
+            card = self.brain.play_turn(self, game, spied_card, opponent_hand)
+        else:
+            card = self._timed_play_turn(game, spied_card, opponent_hand)
+        return self.play_card(card)
+
+    def check_card(self, card: Card):
+        """Raises CheatingException unless `card` is in the hand"""
         if card not in self.hand:
             raise CheatingException(
                 "{} tried to play card {} which is not in hand {}".format(
                     self.brain, card, self.hand
                 )
             )
+
+    def play_card(self, card: Card) -> Card:
+        """Takes a card the brain chose out of the hand"""
+        self.check_card(card)
         self.hand.remove(card)
+        self.cards_played += 1
+        return card
+
+    def _play_turn_in_thread(
+        self, game: GameStatus, spied_card: Optional[Card], opponent_hand: Optional[Set[Card]], deadline: float
+    ) -> Optional[Card]:
+        """Runs the brain on its worker thread until `deadline`. Returns its card, or None if it's still thinking.
+        The brain gets copies of the game and the hand, since the game goes on without it if it overruns."""
+        worker = _WORKERS.get(self.brain)
+        if worker is None or not worker.current.is_done:
+            # Threads can't be stopped, so a worker stuck on a move that overran is left to finish it on its own
+            if worker is not None:
+                worker.stop()
+            worker = _WORKERS[self.brain] = _BrainWorker(self.brain)
+
+        player = Player(self.color, self.brain, list(self.hand))
+        player.cards_played = self.cards_played
+        kwargs = dict(deadline=deadline) if self.brain.supports_deadline else {}
+        move = worker.submit(self.brain.play_turn, player, game.clone(), spied_card, opponent_hand, **kwargs)
+        if not move.finished.acquire(timeout=max(deadline - time.perf_counter(), 0)):
+            return None
+        if move.error is not None:
+            raise move.error
+        return move.card
+
+    def _timed_play_turn(
+        self, game: GameStatus, spied_card: Optional[Card], opponent_hand: Optional[Set[Card]]
+    ) -> Card:
+        brain_name = type(self.brain).__name__
+        start = time.perf_counter()
+        if self.time_budget is not None:
+            card = self._play_turn_in_thread(game, spied_card, opponent_hand, start + self.time_budget)
+        else:
+            card = self.brain.play_turn(self, game, spied_card, opponent_hand)
+        elapsed = time.perf_counter() - start
+
+        if self.instrumentation is not None:
+            if spied_card is not None:
+                turn_kind = SPYING_TURN
+            elif game.spy_color() not in (None, self.color):
+                turn_kind = SPIED_ON_TURN
+            else:
+                turn_kind = NORMAL_TURN
+            self.instrumentation.record_decision(brain_name, self.cards_played, turn_kind, elapsed)
+
+        if self.time_budget is not None and (card is None or elapsed > self.time_budget):
+            if card is not None:
+                # Even a card that came too late has to be one the brain could have played
+                self.check_card(card)
+            if self.instrumentation is not None:
+                self.instrumentation.record_overrun(brain_name)
+            if self.overrun_policy == FORFEIT:
+                raise TimeBudgetExceeded(
+                    self.color,
+                    "{} didn't pick a card within its {:.3f}s budget".format(self.brain, self.time_budget),
+                )
+            return random.choice(self.hand)
         return card
@@ -0,0 +1,187 @@
+"""Rules variants: which cards are dealt, how many points win, and a few house rules.
+
+A `Rules` compiles its fight table and scoring once, when it's constructed, so the same object can be handed to
+any number of games (and pickled to worker processes, which recompile it) without re-deriving anything per game.
+
+    rules = Rules(cards=[card for card in Card if card != Card.prince], points_to_win=3, general_bonus=3)
+    games = play_match(red_brain, blue_brain, 1000, rules=rules)
+"""
+import argparse
+from typing import Dict, Iterable, Optional, Tuple
+
+from components.cards import Card
+from components.fight import (
+    FIGHT_TABLE,
+    NO_CARD,
+    PAYOFF_MATRICES,
+    FightResult,
+    compile_fight_table,
+    compile_payoff_matrices,
+)
+
+# Points a player is given for winning the game outright, with the Princess or because the opponent forfeited
+PRINCESS_POINTS = 999999
+
+DEFAULT_GENERAL_BONUS = 2
+DEFAULT_AMBASSADOR_POINTS = 2
+
+
+class Rules(object):
+    """
+    :param cards: the cards each player starts with
+    :param points_to_win: points needed to win the game
+    :param general_bonus: strength added to a card played right after a General
+    :param ambassador_points: points for winning a fight with the Ambassador
+    :param princess_wins_game: if False, the Princess beating the Prince only wins the round
+    """
+
+    def __init__(
+        self,
+        cards: Iterable[Card] = tuple(Card),
+        points_to_win: int = 4,
+        general_bonus: int = DEFAULT_GENERAL_BONUS,
+        ambassador_points: int = DEFAULT_AMBASSADOR_POINTS,
+        princess_wins_game: bool = True,
+    ):
+        self.cards: Tuple[Card, ...] = tuple(sorted(set(cards)))
+        if not self.cards:
+            raise ValueError("Players need at least one card")
+        if not 1 <= points_to_win <= 15:
+            raise ValueError("points_to_win must be between 1 and 15")
+        if not 0 <= general_bonus <= 15:
+            raise ValueError("general_bonus must be between 0 and 15")
+        if not 1 <= ambassador_points <= 15:
+            raise ValueError("ambassador_points must be between 1 and 15")
+        self.points_to_win = points_to_win
+        self.general_bonus = general_bonus
+        self.ambassador_points = ambassador_points
+        self.princess_wins_game = princess_wins_game
+
+        self.hand_mask = 0
+        for card in self.cards:
+            self.hand_mask |= 1 << card
+
+        if general_bonus == DEFAULT_GENERAL_BONUS and princess_wins_game:
+            # Share the module-level tables rather than building identical copies
+            self.fight_table, self.payoff_matrices = FIGHT_TABLE, PAYOFF_MATRICES
+        else:
+            self.fight_table = compile_fight_table(general_bonus, princess_wins_game)
+            self.payoff_matrices = compile_payoff_matrices(self.fight_table)
+
+        # Points (red, blue) awarded by a result before adding whatever was on hold
+        self.result_points: Dict[FightResult, Tuple[int, int]] = {
+            FightResult.red_wins: (1, 0),
+            FightResult.red_wins_2: (ambassador_points, 0),
+            FightResult.blue_wins: (0, 1),
+            FightResult.blue_wins_2: (0, ambassador_points),
+        }
+
+    def resolve(self, red_card, blue_card, prev_red_card=None, prev_blue_card=None) -> FightResult:
+        """`fight.resolve` under these rules"""
+        return self.payoff_matrices[
+            (NO_CARD if prev_red_card is None else prev_red_card) * 9
+            + (NO_CARD if prev_blue_card is None else prev_blue_card)
+        ][red_card][blue_card]
+
+    @property
+    def house_rules_id(self) -> int:
+        """Small int that tells apart the house rules that change fight results or scores, 0 for the standard
+        ones. The card set and `points_to_win` aren't included."""
+        return (
+            (self.general_bonus ^ DEFAULT_GENERAL_BONUS)
+            | (self.ambassador_points ^ DEFAULT_AMBASSADOR_POINTS) << 4
+            | (not self.princess_wins_game) << 8
+        )
+
+    @classmethod
+    def from_house_rules_id(cls, house_rules_id: int, points_to_win: int = 4, cards: Iterable[Card] = tuple(Card)):
+        """The rules whose `house_rules_id` is `house_rules_id`. Raises ValueError if no rules have that id."""
+        if house_rules_id >> 9:
+            raise ValueError("Unknown house rules id {}".format(house_rules_id))
+        return cls(
+            cards,
+            points_to_win,
+            general_bonus=(house_rules_id & 0xF) ^ DEFAULT_GENERAL_BONUS,
+            ambassador_points=(house_rules_id >> 4 & 0xF) ^ DEFAULT_AMBASSADOR_POINTS,
+            princess_wins_game=not house_rules_id >> 8,
+        )
+
+    def _arguments(self):
+        return self.cards, self.points_to_win, self.general_bonus, self.ambassador_points, self.princess_wins_game
+
+    def __reduce__(self):
+        # Only the arguments are pickled; the tables are compiled again on the other side
+        return Rules, self._arguments()
+
+    def __eq__(self, other):
+        return isinstance(other, Rules) and self._arguments() == other._arguments()
+
+    def __hash__(self):
+        return hash(self._arguments())
+
+    def __repr__(self):
+        return (
+            "Rules(cards={}, points_to_win={}, general_bonus={}, ambassador_points={}, princess_wins_game={})".format(
+                "".join(str(int(card)) for card in self.cards), *self._arguments()[1:]
+            )
+        )
+
+
+STANDARD_RULES = Rules()
+_STANDARD_RULES_BY_POINTS = {STANDARD_RULES.points_to_win: STANDARD_RULES}
+
+
+def standard_rules(points_to_win: int = 4) -> Rules:
+    """The standard rules played to `points_to_win`, made once per target so games can ask for them freely"""
+    rules = _STANDARD_RULES_BY_POINTS.get(points_to_win)
+    if rules is None:
+        rules = _STANDARD_RULES_BY_POINTS[points_to_win] = Rules(points_to_win=points_to_win)
+    return rules
+
+
+def game_rules(points_to_win: Optional[int], rules: Optional[Rules]) -> Rules:
+    """The rules a game created with these arguments plays by: `rules`, or else the standard rules played to
+    `points_to_win` (4 if neither is given). Raises ValueError if both are given and disagree."""
+    if rules is None:
+        return standard_rules(4 if points_to_win is None else points_to_win)
+    if points_to_win is not None and points_to_win != rules.points_to_win:
+        raise ValueError("points_to_win is {} but the rules play to {}".format(points_to_win, rules.points_to_win))
+    return rules
+
+
+# Names of the options `add_rules_arguments` adds, as they appear in the parsed args
+_RULES_ARGUMENTS = ("cards", "points_to_win", "general_bonus", "ambassador_points", "princess_wins_game")
+
+
+def add_rules_arguments(parser: argparse.ArgumentParser, *points_to_win_flags: str):
+    """Adds options for picking a rules variant to a command line parser. See `rules_from_args`.
+    :param points_to_win_flags: flags for the points to win option, if not just --points-to-win
+    """
+    group = parser.add_argument_group("rules variant")
+    group.add_argument("--cards", help="Values of the cards each player starts with (default: 01234567)")
+    group.add_argument(
+        *(points_to_win_flags or ("--points-to-win",)),
+        dest="points_to_win",
+        type=int,
+        help="Points needed to win the game (default: 4)",
+    )
+    group.add_argument("--general-bonus", type=int, help="Strength added after playing a General (default: 2)")
+    group.add_argument("--ambassador-points", type=int, help="Points for winning with the Ambassador (default: 2)")
+    group.add_argument(
+        "--no-princess-win",
+        dest="princess_wins_game",
+        action="store_false",
+        default=None,
+        help="The Princess beating the Prince only wins the round",
+    )
+
+
+def rules_from_args(args: Dict) -> Rules:
+    """Builds the Rules chosen with `add_rules_arguments` options, removing them from the parsed `args` dict"""
+    options = {name: args.pop(name) for name in _RULES_ARGUMENTS if name in args}
+    options = {name: value for name, value in options.items() if value is not None}
+    if not options:
+        return STANDARD_RULES
+    if "cards" in options:
+        options["cards"] = [Card.get_from_int(int(value)) for value in options["cards"]]
+    return Rules(**options)
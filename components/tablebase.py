@@ -0,0 +1,223 @@
+"""Reader for endgame tablebases: exact values of every position with only a few cards left in each hand. They're
+built by `experiments.tablebase`.
+
+Values are stored in one flat array with no keys. A position's index is computed directly from the rank of each
+hand among the hands of its size, and from its (red points, blue points, points on hold, context) "situation",
+numbered densely within each hand size. Slots for a pair of hands in a situation it can never come up in hold
+NaN. The file (native byte order) is:
+
+    header:     magic, version, max cards, dealt cards mask, points to win, the house rules, red reveals first,
+                number of contexts
+    situations: int32 situation number, or -1, for every (hand size, red points, blue points, hold, context)
+    values:     float64 red value of every (hand size, red hand rank, blue hand rank, situation)
+
+and is memory-mapped when opened, like `components.mapped_table` files. Search brains and solvers probe it to
+finish off the last few fights of a line with one lookup instead of searching them again on every call.
+"""
+import mmap
+import os
+import struct
+from array import array
+from itertools import combinations
+from math import comb
+from typing import Iterable, List, Optional, Sequence
+
+from components.cards import Card, Color
+from components.compact_state import CompactGameStatus, hand_mask
+from components.fight_contexts import rules_contexts
+from components.game_status import GameStatus
+from components.rules import Rules
+
+_MAGIC = b"BRTBASE\0"
+_VERSION = 1
+_HEADER = struct.Struct("=8sIBBBBBBBB")
+_HEADER_SIZE = 24  # _HEADER.size rounded up to keep both arrays aligned
+
+# _HAND_SIZES[mask] -> number of cards in the hand
+_HAND_SIZES = [bin(mask).count("1") for mask in range(256)]
+
+
+def hand_ranks(cards: Sequence[Card]) -> List[int]:
+    """Rank of every hand made of `cards` among the hands of the same size (colexicographic order), -1 for
+    masks holding any other card"""
+    ranks = [-1] * 256
+    for size in range(len(cards) + 1):
+        for rank, hand in enumerate(combinations(cards, size)):
+            ranks[hand_mask(hand)] = rank
+    return ranks
+
+
+class Tablebase(object):
+    """Values, for red, of the positions with at most `max_cards` cards per hand. Open a saved one with
+    `Tablebase.open`, or make one with `experiments.tablebase.build_tablebase`.
+
+    :param red_reveals_first: if True, simultaneous fights were valued as if red had to show their card first (the
+        model `solveable_games` uses) rather than as matrix games. Fights after a spy are sequential either way.
+    :param situations: situation numbers, see the module docstring
+    :param values: red values, see the module docstring
+    """
+
+    def __init__(
+        self, rules: Rules, max_cards: int, red_reveals_first: bool, situations: Sequence[int], values: Sequence[float]
+    ):
+        self.rules = rules
+        self.max_cards = max_cards
+        self.red_reveals_first = red_reveals_first
+        self.context_by_prev, context_results, _, _ = rules_contexts(rules.payoff_matrices)
+        self._points_to_win = points_to_win = rules.points_to_win
+        self._num_contexts = len(context_results)
+        self._situations = situations
+        self._values = values
+        self._hand_ranks = hand_ranks(rules.cards)
+
+        # Per hand size: number of hands, where its values start and how many situations it has
+        situations_per_size = points_to_win ** 3 * self._num_contexts
+        self._hand_counts = [comb(len(rules.cards), size) for size in range(max_cards + 1)]
+        self._size_base = [0] * (max_cards + 1)
+        self._situation_counts = [0] * (max_cards + 1)
+        self.num_slots = 0
+        for size in range(1, max_cards + 1):
+            first = (size - 1) * situations_per_size
+            count = max(situations[first : first + situations_per_size], default=-1) + 1
+            self._size_base[size], self._situation_counts[size] = self.num_slots, count
+            self.num_slots += self._hand_counts[size] ** 2 * count
+
+    @classmethod
+    def open(cls, path: str) -> "Tablebase":
+        """Memory-maps a tablebase file written by `save`"""
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (
+            magic,
+            version,
+            max_cards,
+            cards,
+            points_to_win,
+            general_bonus,
+            ambassador_points,
+            princess_wins_game,
+            red_reveals_first,
+            num_contexts,
+        ) = _HEADER.unpack_from(mapped)
+        if magic != _MAGIC or version != _VERSION:
+            mapped.close()
+            raise ValueError("{} is not a version {} tablebase file".format(path, _VERSION))
+
+        rules = Rules(
+            [card for card in Card if cards >> card & 1],
+            points_to_win,
+            general_bonus,
+            ambassador_points,
+            bool(princess_wins_game),
+        )
+        view = memoryview(mapped)
+        situations_end = _HEADER_SIZE + 4 * max_cards * points_to_win ** 3 * num_contexts
+        situations = view[_HEADER_SIZE:situations_end].cast("i")
+        values_start = situations_end + -situations_end % 8
+        tablebase = cls(rules, max_cards, bool(red_reveals_first), situations, view[values_start:].cast("d"))
+        tablebase._mmap = mapped
+        if tablebase._num_contexts != num_contexts:
+            tablebase.close()
+            raise ValueError("{} was built with different fight contexts".format(path))
+        return tablebase
+
+    def save(self, path: str):
+        """Writes the tablebase to `path`, through a temp file so open readers never see half of it"""
+        rules = self.rules
+        header = _HEADER.pack(
+            _MAGIC,
+            _VERSION,
+            self.max_cards,
+            rules.hand_mask,
+            rules.points_to_win,
+            rules.general_bonus,
+            rules.ambassador_points,
+            rules.princess_wins_game,
+            self.red_reveals_first,
+            self._num_contexts,
+        )
+        tmp_path = "{}.tmp{}".format(path, os.getpid())
+        with open(tmp_path, "wb") as f:
+            f.write(header.ljust(_HEADER_SIZE, b"\0"))
+            situations = array("i", self._situations)
+            situations.tofile(f)
+            f.write(b"\0" * (-(_HEADER_SIZE + 4 * len(situations)) % 8))
+            array("d", self._values).tofile(f)
+        os.replace(tmp_path, path)
+
+    def close(self):
+        mapped = getattr(self, "_mmap", None)
+        if mapped is not None:
+            self._situations.release()
+            self._values.release()
+            mapped.close()
+
+    def covers(self, rules: Rules, points_to_win: int) -> bool:
+        """Whether this tablebase was built for games played under `rules` to `points_to_win`"""
+        return (
+            points_to_win == self._points_to_win
+            and rules.cards == self.rules.cards
+            and rules.house_rules_id == self.rules.house_rules_id
+        )
+
+    def _index(self, red_hand, blue_hand, red_points, blue_points, hold, context) -> int:
+        """Position of a state's value in the values array, or -1 if it isn't in the table"""
+        size = _HAND_SIZES[red_hand]
+        points_to_win = self._points_to_win
+        if (
+            not 0 < size <= self.max_cards
+            or _HAND_SIZES[blue_hand] != size
+            or red_points >= points_to_win
+            or blue_points >= points_to_win
+        ):
+            return -1
+        red_rank, blue_rank = self._hand_ranks[red_hand], self._hand_ranks[blue_hand]
+        if red_rank < 0 or blue_rank < 0:
+            return -1
+        # Anything on hold past points_to_win - 1 is enough to win the game with the next fight won, so it's all
+        # the same from there on
+        hold = min(hold, points_to_win - 1)
+        situation = self._situations[
+            ((((size - 1) * points_to_win + red_points) * points_to_win + blue_points) * points_to_win + hold)
+            * self._num_contexts
+            + context
+        ]
+        if situation < 0:
+            return -1
+        return (
+            self._size_base[size]
+            + (red_rank * self._hand_counts[size] + blue_rank) * self._situation_counts[size]
+            + situation
+        )
+
+    def value(
+        self, red_hand: int, blue_hand: int, red_points: int, blue_points: int, hold: int, context: int
+    ) -> Optional[float]:
+        """Red's value of an `EquilibriumSolver` state, or None if it's not in the table"""
+        if not red_hand or not blue_hand:
+            return 0.5
+        index = self._index(red_hand, blue_hand, red_points, blue_points, hold, context)
+        if index < 0:
+            return None
+        val = self._values[index]
+        return None if val != val else val
+
+    def value_of(self, state: CompactGameStatus) -> Optional[float]:
+        """Red's value of a CompactGameStatus with both hands set, or None if it's not in the table"""
+        winner = state.winner
+        if winner:
+            return 1.0 if winner == Color.red else 0.0
+        return self.value(
+            state.red_hand,
+            state.blue_hand,
+            state.red_points,
+            state.blue_points,
+            state.hold_points,
+            self.context_by_prev[state.prev_red * 9 + state.prev_blue],
+        )
+
+    def probe(self, red_hand: Iterable[Card], blue_hand: Iterable[Card], game: GameStatus) -> Optional[float]:
+        """Red's value of `game` with the given hands left to play, or None if it's not in the table"""
+        state = CompactGameStatus.from_game_status(game)
+        state.red_hand, state.blue_hand = hand_mask(red_hand), hand_mask(blue_hand)
+        return self.value_of(state)
@@ -0,0 +1,302 @@
+"""Counterfactual regret minimization (CFR+) by self-play over the whole game, writing a policy for `cfrPolicy`.
+
+    python -m experiments.cfr -i 2000 -o cfr_policy.brt
+
+Each player decides on an information set made of what they can see: both hands, the score, the points on hold,
+the previous fight (as an `equilibrium_solver` context) and, after a spy, the opponent's revealed card. Those are
+exactly the equilibrium solver's states, so the game is unrolled once into a DAG of them, grouped into layers by
+the number of fights played, and each iteration is a handful of numpy passes over flat arrays:
+
+    * regret matching turns the accumulated regrets into the current strategy for every infoset at once
+    * a forward pass, layer by layer, adds up how likely each player makes it to every state
+    * a backward pass computes every state's value for red under the current strategies
+    * counterfactual values of every action, and the regret and average strategy updates, are whole-array sums
+
+Red and blue take turns updating, as usual for CFR+.
+
+The average strategy is written as a `components.mapped_table` file holding one record of card probabilities per
+infoset. Every `--report-every` iterations the trainer prints how much a best responder would win against the
+average strategy; that gap shrinks towards 0 as it approaches an equilibrium.
+"""
+import argparse
+import time
+from typing import List, Tuple
+
+import numpy as np
+
+from brains.cfr_policy import DEFAULT_POLICY_PATH, policy_key
+from components.cards import Color
+from components.compact_state import FULL_HAND, NO_CARD
+from components.fight_contexts import CONTEXT_SPY_COLOR, INITIAL_CONTEXT, state_key
+from components.mapped_table import write_table
+from experiments.equilibrium_solver import EquilibriumSolver
+
+# Hand mask -> card codes in it
+_CARD_CODES = [tuple(code for code in range(8) if mask >> code & 1) for mask in range(256)]
+
+
+class CfrTrainer(object):
+    """Runs CFR+ with linear strategy averaging on the unrolled game.
+
+    Infosets get consecutive ids in state order, and each one owns a run of consecutive "slots", one per card in
+    the acting player's hand. Every (state, red card, blue card) edge points at the red slot and blue slot it
+    takes, so per-slot sums are `np.bincount` calls over the edges.
+    """
+
+    def __init__(self, points_to_win: int = 4):
+        self.points_to_win = points_to_win
+        self._build()
+        num_slots = len(self.slot_infoset)
+        self.regrets = np.zeros(num_slots)
+        self.strategy_sum = np.zeros(num_slots)
+        self.iterations = 0
+
+    def _build(self):
+        solver = EquilibriumSolver(self.points_to_win)
+        root = (FULL_HAND, FULL_HAND, 0, 0, 0, INITIAL_CONTEXT)
+        state_ids = {root: 0}
+        states: List[Tuple] = [root]
+        # Infosets: (state id, Color, spied card code or NO_CARD)
+        infosets: List[Tuple[int, Color, int]] = []
+        slot_infoset, slot_card = [], []
+        edge_state, edge_red_slot, edge_blue_slot, edge_child, edge_value = [], [], [], [], []
+        # Index of the first state / edge / infoset / slot of each layer, plus one past the end
+        layer_starts = [(0, 0, 0, 0)]
+        layer_size = len(_CARD_CODES[FULL_HAND])
+
+        def add_infoset(state_id: int, color: Color, spied_code: int, codes) -> int:
+            infosets.append((state_id, color, spied_code))
+            first_slot = len(slot_infoset)
+            slot_infoset.extend([len(infosets) - 1] * len(codes))
+            slot_card.extend(codes)
+            return first_slot
+
+        # States are expanded in breadth-first order, so each layer's states (and everything allocated for them)
+        # are contiguous and come before the next layer's
+        for state_id, state in enumerate(states):
+            red_hand, blue_hand = state[0], state[1]
+            if len(_CARD_CODES[red_hand]) != layer_size:
+                layer_size -= 1
+                layer_starts.append((state_id, len(edge_state), len(infosets), len(slot_infoset)))
+            red_codes, blue_codes = _CARD_CODES[red_hand], _CARD_CODES[blue_hand]
+            spy_color = CONTEXT_SPY_COLOR[state[5]]
+            # First slot of the infoset each player acts in, depending on the opponent's card if they spied it
+            if spy_color == Color.red:
+                blue_slot = add_infoset(state_id, Color.blue, NO_CARD, blue_codes)
+                red_slots = {code: add_infoset(state_id, Color.red, code, red_codes) for code in blue_codes}
+            else:
+                red_slot = add_infoset(state_id, Color.red, NO_CARD, red_codes)
+                if spy_color == Color.blue:
+                    blue_slots = {code: add_infoset(state_id, Color.blue, code, blue_codes) for code in red_codes}
+                else:
+                    blue_slot = add_infoset(state_id, Color.blue, NO_CARD, blue_codes)
+
+            for red_index, red_code in enumerate(red_codes):
+                for blue_index, blue_code in enumerate(blue_codes):
+                    child = solver.child_state(*state, red_code, blue_code)
+                    if isinstance(child, tuple) and not child[0]:
+                        # Both hands ran out without a winner
+                        child = 0.5
+                    if isinstance(child, float):
+                        edge_child.append(-1)
+                        edge_value.append(child)
+                    else:
+                        child_id = state_ids.get(child)
+                        if child_id is None:
+                            child_id = state_ids[child] = len(states)
+                            states.append(child)
+                        edge_child.append(child_id)
+                        edge_value.append(0.0)
+                    edge_state.append(state_id)
+                    red_first = red_slots[blue_code] if spy_color == Color.red else red_slot
+                    blue_first = blue_slots[red_code] if spy_color == Color.blue else blue_slot
+                    edge_red_slot.append(red_first + red_index)
+                    edge_blue_slot.append(blue_first + blue_index)
+        layer_starts.append((len(states), len(edge_state), len(infosets), len(slot_infoset)))
+
+        self.states = states
+        self.infosets = infosets
+        self.layer_starts = layer_starts
+        self.infoset_state = np.array([state_id for state_id, _, _ in infosets])
+        self.infoset_is_red = np.array([color == Color.red for _, color, _ in infosets])
+        self.slot_infoset = np.array(slot_infoset)
+        self.slot_card = np.array(slot_card)
+        self.slot_state = self.infoset_state[self.slot_infoset]
+        self.slot_is_red = self.infoset_is_red[self.slot_infoset]
+        self.infoset_first_slot = np.searchsorted(self.slot_infoset, np.arange(len(infosets)))
+        self.actions_per_slot = np.bincount(self.slot_infoset)[self.slot_infoset]
+        self.edge_state = np.array(edge_state)
+        self.edge_red_slot = np.array(edge_red_slot)
+        self.edge_blue_slot = np.array(edge_blue_slot)
+        self.edge_child = np.array(edge_child)
+        self.edge_value = np.array(edge_value)
+
+    def _normalized(self, weights: np.ndarray) -> np.ndarray:
+        """Per-infoset normalization of non-negative slot weights; infosets with no weight play uniformly"""
+        totals = np.bincount(self.slot_infoset, weights)[self.slot_infoset]
+        uniform = 1.0 / self.actions_per_slot
+        return np.divide(weights, totals, out=uniform, where=totals > 0)
+
+    def current_strategy(self) -> np.ndarray:
+        return self._normalized(self.regrets)
+
+    def average_strategy(self) -> np.ndarray:
+        return self._normalized(self.strategy_sum)
+
+    def _edge_values(self, state_values: np.ndarray, start: int, end: int) -> np.ndarray:
+        """Red's value after each edge in [start, end): the terminal value or the value of the child state"""
+        children = self.edge_child[start:end]
+        return np.where(children < 0, self.edge_value[start:end], state_values[children])
+
+    def _reaches(self, strategy: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """How likely red's and blue's own choices are to lead to each state, summed over every way to get there"""
+        num_states = len(self.states)
+        red_reach, blue_reach = np.zeros(num_states), np.zeros(num_states)
+        red_reach[0] = blue_reach[0] = 1.0
+        for (_, edge_start, _, _), (state_end, edge_end, _, _) in zip(self.layer_starts, self.layer_starts[1:]):
+            children = self.edge_child[edge_start:edge_end]
+            parents = self.edge_state[edge_start:edge_end]
+            live = children >= 0
+            # Children all sit in the next layer, which starts at `state_end`
+            offsets = children[live] - state_end
+            if not len(offsets):
+                continue
+            next_size = offsets.max() + 1
+            red_step = red_reach[parents[live]] * strategy[self.edge_red_slot[edge_start:edge_end][live]]
+            blue_step = blue_reach[parents[live]] * strategy[self.edge_blue_slot[edge_start:edge_end][live]]
+            red_reach[state_end : state_end + next_size] += np.bincount(offsets, red_step, next_size)
+            blue_reach[state_end : state_end + next_size] += np.bincount(offsets, blue_step, next_size)
+        return red_reach, blue_reach
+
+    def _state_values(self, strategy: np.ndarray) -> np.ndarray:
+        """Red's expected result from every state when both players follow `strategy`"""
+        values = np.zeros(len(self.states))
+        for (state_start, edge_start, _, _), (state_end, edge_end, _, _) in reversed(
+            list(zip(self.layer_starts, self.layer_starts[1:]))
+        ):
+            probability = (
+                strategy[self.edge_red_slot[edge_start:edge_end]] * strategy[self.edge_blue_slot[edge_start:edge_end]]
+            )
+            contributions = probability * self._edge_values(values, edge_start, edge_end)
+            values[state_start:state_end] = np.bincount(
+                self.edge_state[edge_start:edge_end] - state_start, contributions, state_end - state_start
+            )
+        return values
+
+    def _update(self, red: bool):
+        """Regret and average strategy updates for one player against the current strategies"""
+        strategy = self.current_strategy()
+        red_reach, blue_reach = self._reaches(strategy)
+        edge_values = self._edge_values(self._state_values(strategy), 0, len(self.edge_state))
+        parents = self.edge_state
+        # Counterfactual value of each action: the value after it, weighted by the opponent's chance of getting
+        # there and of picking their half of the edge
+        if red:
+            weights = blue_reach[parents] * strategy[self.edge_blue_slot] * edge_values
+            action_values = np.bincount(self.edge_red_slot, weights, len(self.slot_infoset))
+        else:
+            weights = red_reach[parents] * strategy[self.edge_red_slot] * (1.0 - edge_values)
+            action_values = np.bincount(self.edge_blue_slot, weights, len(self.slot_infoset))
+        infoset_values = np.bincount(self.slot_infoset, strategy * action_values)[self.slot_infoset]
+
+        slots = self.slot_is_red if red else ~self.slot_is_red
+        regrets = np.maximum(self.regrets + action_values - infoset_values, 0.0)
+        self.regrets[slots] = regrets[slots]
+        own_reach = (red_reach if red else blue_reach)[self.slot_state]
+        self.strategy_sum[slots] += (self.iterations * own_reach * strategy)[slots]
+
+    def iterate(self):
+        """One CFR+ iteration. Updates alternate, so blue's regrets are against red's freshly updated strategy,
+        which converges about twice as fast per unit of work as updating both at once."""
+        self.iterations += 1
+        self._update(red=True)
+        self._update(red=False)
+
+    def best_response_values(self, strategy: np.ndarray) -> Tuple[float, float]:
+        """Red's value when red best-responds to blue's half of `strategy`, and when blue best-responds to red's"""
+        results = []
+        for responder_is_red in (True, False):
+            best = np.maximum if responder_is_red else np.minimum
+            responder_slots = self.edge_red_slot if responder_is_red else self.edge_blue_slot
+            fixed_slots = self.edge_blue_slot if responder_is_red else self.edge_red_slot
+            values = np.zeros(len(self.states))
+            for bounds, next_bounds in reversed(list(zip(self.layer_starts, self.layer_starts[1:]))):
+                state_start, edge_start, infoset_start, slot_start = bounds
+                state_end, edge_end, infoset_end, slot_end = next_bounds
+                # Value of each responder action: the fixed player's expected result against it
+                contributions = strategy[fixed_slots[edge_start:edge_end]] * self._edge_values(
+                    values, edge_start, edge_end
+                )
+                slot_values = np.bincount(
+                    responder_slots[edge_start:edge_end] - slot_start, contributions, slot_end - slot_start
+                )
+                # The responder takes the best action in each of their infosets...
+                first_slots = self.infoset_first_slot[infoset_start:infoset_end] - slot_start
+                infoset_values = best.reduceat(slot_values, first_slots)
+                # ...and a state is worth the sum over their infosets in it, which are per spied card if they spied
+                responder = self.infoset_is_red[infoset_start:infoset_end] == responder_is_red
+                values[state_start:state_end] = np.bincount(
+                    self.infoset_state[infoset_start:infoset_end][responder] - state_start,
+                    infoset_values[responder],
+                    state_end - state_start,
+                )
+            results.append(values[0])
+        return results[0], results[1]
+
+    def exploitability(self) -> Tuple[float, float]:
+        """How much a best responder wins beyond the 0.5 equilibrium value against the average strategy's red and
+        blue halves"""
+        red_best_value, blue_best_value = self.best_response_values(self.average_strategy())
+        return 0.5 - blue_best_value, red_best_value - 0.5
+
+    def policy_records(self):
+        """The average strategy as `cfrPolicy` table records: 8 probabilities per infoset, indexed by card code.
+        Infosets with a single card to play are left out since there's nothing to decide."""
+        strategy = self.average_strategy()
+        records = {}
+        for infoset_id, (state_id, color, spied_code) in enumerate(self.infosets):
+            first_slot = self.infoset_first_slot[infoset_id]
+            state = self.states[state_id]
+            num_actions = len(_CARD_CODES[state[0] if color == Color.red else state[1]])
+            if num_actions == 1:
+                continue
+            probabilities = [0.0] * 8
+            for slot in range(first_slot, first_slot + num_actions):
+                probabilities[self.slot_card[slot]] = strategy[slot]
+            key = state_key(*state)
+            records[policy_key(key, color, spied_code, self.points_to_win)] = probabilities
+        return records
+
+    def save(self, path: str):
+        write_table(path, self.policy_records(), typecode="f", width=8)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train a CFR policy for the cfrPolicy brain")
+    parser.add_argument("-i", "--iterations", type=int, default=1000, help="CFR iterations to run")
+    parser.add_argument("-o", "--output", default=DEFAULT_POLICY_PATH, help="Policy file to write")
+    parser.add_argument("-p", "--points-to-win", type=int, default=4, help="Points needed to win the game")
+    parser.add_argument(
+        "--report-every", type=int, default=100, help="Print the average strategy's exploitability this often"
+    )
+    args = parser.parse_args()
+
+    start = time.time()
+    trainer = CfrTrainer(args.points_to_win)
+    print(
+        "Unrolled {} states, {} infosets, {} edges in {:.1f}s".format(
+            len(trainer.states), len(trainer.infosets), len(trainer.edge_state), time.time() - start
+        )
+    )
+    start = time.time()
+    for _ in range(args.iterations):
+        trainer.iterate()
+        if trainer.iterations % args.report_every == 0 or trainer.iterations == args.iterations:
+            red_exploitability, blue_exploitability = trainer.exploitability()
+            print(
+                "Iteration {}: exploitable by {:.5f} as red, {:.5f} as blue ({:.1f}s)".format(
+                    trainer.iterations, red_exploitability, blue_exploitability, time.time() - start
+                )
+            )
+    trainer.save(args.output)
+    print("Wrote {}".format(args.output))
@@ -0,0 +1,328 @@
+"""Exact solver for the simultaneous-move Brave Rats game.
+
+Unlike `solveable_games.play_a_round`, which pretends red commits to a card first, every normal round here is
+treated as the matrix game it really is: the value of a node is the mixed-strategy value of the matrix of child
+values, found with a small simplex solve. Rounds after a successful spy are sequential, since the spied player
+has to reveal their card first.
+
+Values are always from red's point of view: 1.0 for a red win, 0.0 for a blue win and 0.5 for a tie.
+"""
+import argparse
+import itertools
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from components.cards import Card, Color
+from components.compact_state import CompactGameStatus, hand_mask
+from components.fight import NO_CARD, FightResult
+from components.fight_contexts import rules_contexts, state_key
+from components.game_status import GameStatus
+from components.mapped_table import MappedTable, merged_records, write_table
+from components.rules import Rules, add_rules_arguments, game_rules, rules_from_args
+
+_EPSILON = 1e-12
+
+
+def solve_matrix_game(matrix: Sequence[Sequence[float]]) -> Tuple[float, List[float], List[float]]:
+    """Solves a zero-sum matrix game where the row player maximizes.
+    :return: (value, row player's mixed strategy, column player's mixed strategy)
+    """
+    num_rows, num_cols = len(matrix), len(matrix[0])
+
+    # Cheap and common: a pure saddle point
+    row_mins = [min(row) for row in matrix]
+    col_maxes = [max(matrix[i][j] for i in range(num_rows)) for j in range(num_cols)]
+    maximin, minimax = max(row_mins), min(col_maxes)
+    if maximin >= minimax - _EPSILON:
+        best_row, best_col = row_mins.index(maximin), col_maxes.index(minimax)
+        row_strategy = [0.0] * num_rows
+        col_strategy = [0.0] * num_cols
+        row_strategy[best_row] = col_strategy[best_col] = 1.0
+        return maximin, row_strategy, col_strategy
+
+    # Shift every entry to be >= 1 so the game value is positive, then solve the column player's LP
+    #   maximize sum(y)  s.t.  matrix' y <= 1, y >= 0
+    # whose optimum is 1 / value. The row player's strategy falls out of the slack columns' reduced costs.
+    shift = 1.0 - min(min(row) for row in matrix)
+    width = num_cols + num_rows + 1
+    tableau = []
+    for i, row in enumerate(matrix):
+        tableau_row = [entry + shift for entry in row] + [0.0] * num_rows + [1.0]
+        tableau_row[num_cols + i] = 1.0
+        tableau.append(tableau_row)
+    objective = [-1.0] * num_cols + [0.0] * (num_rows + 1)
+    basis = [num_cols + i for i in range(num_rows)]
+
+    while True:
+        # Bland's rule: lowest index with a negative reduced cost, which rules out cycling
+        entering = next((j for j in range(width - 1) if objective[j] < -_EPSILON), None)
+        if entering is None:
+            break
+        pivot_row, best_ratio = None, None
+        for i in range(num_rows):
+            coefficient = tableau[i][entering]
+            if coefficient > _EPSILON:
+                ratio = tableau[i][-1] / coefficient
+                # Ties go to the lowest-index basic variable, completing Bland's rule
+                if (
+                    best_ratio is None
+                    or ratio < best_ratio - _EPSILON
+                    or (ratio < best_ratio + _EPSILON and basis[i] < basis[pivot_row])
+                ):
+                    pivot_row, best_ratio = i, ratio
+        pivot = tableau[pivot_row]
+        pivot_value = pivot[entering]
+        for j in range(width):
+            pivot[j] /= pivot_value
+        for row in itertools.chain(tableau, [objective]):
+            if row is not pivot:
+                factor = row[entering]
+                if factor:
+                    for j in range(width):
+                        row[j] -= factor * pivot[j]
+        basis[pivot_row] = entering
+
+    total = objective[-1]
+    col_strategy = [0.0] * num_cols
+    for i, variable in enumerate(basis):
+        if variable < num_cols:
+            col_strategy[variable] = tableau[i][-1] / total
+    row_strategy = [objective[num_cols + i] / total for i in range(num_rows)]
+    return 1.0 / total - shift, row_strategy, col_strategy
+
+
+def _cards(mask: int) -> List[int]:
+    return [code for code in range(8) if mask >> code & 1]
+
+
+class EquilibriumSolver(object):
+    """Computes exact game values with a memo table keyed on a packed canonical state.
+
+    A state is (red hand mask, blue hand mask, red points, blue points, points on hold, context), where the
+    context stands in for the previous fight (see `components.fight_contexts`). Scores are always below `points_to_win`
+    in a stored state, since anything else is terminal. `points_to_win` and `Rules.house_rules_id` are folded
+    into the key too, so one cache file can hold values for several targets and rules variants.
+
+    A state and its color-swapped mirror image have values v and 1 - v, so only the one with the smaller key is
+    stored (see `canonical_key`), which halves the table and the number of states that need solving.
+
+    :param cache_path: optional table file (see `components.mapped_table`) holding previously solved states. It
+        is memory-mapped rather than loaded, and `save_cache` writes newly solved states back into it.
+    :param rules: rules variant to solve, in place of the standard rules to `points_to_win` (which has to agree
+        with the variant's if both are given). Its contexts are built from its own fight table, so context ids
+        only mean something to the solver that made them.
+    :param tablebase: a `components.tablebase.Tablebase` for the same rules. States small enough to be in it are
+        looked up there instead of being solved or stored.
+    """
+
+    def __init__(
+        self,
+        points_to_win: Optional[int] = None,
+        cache_path: Optional[str] = None,
+        rules: Optional[Rules] = None,
+        tablebase=None,
+    ):
+        self.rules = game_rules(points_to_win, rules)
+        self.points_to_win = points_to_win = self.rules.points_to_win
+        (
+            self.context_by_prev,
+            self.context_results,
+            self.context_spy_color,
+            self.mirror_context,
+        ) = rules_contexts(self.rules.payoff_matrices)
+        if len(self.context_results) > 16:
+            raise ValueError("Too many distinct previous fights to pack into a state key")
+        self.initial_context = self.context_by_prev[NO_CARD * 9 + NO_CARD]
+        self._ambassador_points = self.rules.ambassador_points
+        # States solved by this instance that aren't in `cache` yet
+        self.table: Dict[int, float] = {}
+        self.cache_path = cache_path
+        self.cache: Optional[MappedTable] = None
+        # (inode, mtime) of the cache file when it was mapped
+        self._cache_stamp = None
+        self.refresh_cache()
+        self._key_base = points_to_win << 32 | self.rules.house_rules_id << 36
+        if tablebase is not None and (tablebase.red_reveals_first or not tablebase.covers(self.rules, points_to_win)):
+            raise ValueError("The tablebase wasn't built for these rules, or doesn't hold equilibrium values")
+        self.tablebase = tablebase
+        self.lookups = 0
+        self.hits = 0
+
+    def canonical_key(
+        self, red_hand: int, blue_hand: int, red_points: int, blue_points: int, hold: int, context: int
+    ) -> Tuple[int, bool]:
+        """(key, whether it's the key of the color-swapped state). Values stored under a swapped key are for the
+        swapped state, so from the original red's point of view they need flipping to 1 - value."""
+        key = state_key(red_hand, blue_hand, red_points, blue_points, hold, context)
+        mirror_key = state_key(blue_hand, red_hand, blue_points, red_points, hold, self.mirror_context[context])
+        return (mirror_key, True) if mirror_key < key else (key, False)
+
+    def save_cache(self, path: Optional[str] = None):
+        """Merges everything solved so far into the cache file and remaps it"""
+        path = path or self.cache_path
+        write_table(path, merged_records(self.cache, self.table))
+        self.cache_path = path
+        self.refresh_cache()
+        self.table = {}
+
+    def refresh_cache(self) -> bool:
+        """Maps the cache file again if it has been rewritten since it was mapped (by another process, say), so
+        states solved elsewhere become visible. Returns whether it was."""
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return False
+        stat = os.stat(self.cache_path)
+        stamp = stat.st_ino, stat.st_mtime_ns
+        if stamp == self._cache_stamp:
+            return False
+        if self.cache is not None:
+            self.cache.close()
+        self.cache = MappedTable(self.cache_path)
+        self._cache_stamp = stamp
+        return True
+
+    def child_state(self, red_hand, blue_hand, red_points, blue_points, hold, context, red_code, blue_code):
+        """Where playing `red_code` against `blue_code` leads: red's final value if that ends the game, otherwise
+        the next state as a (red hand, blue hand, red points, blue points, hold, context) tuple"""
+        result = self.context_results[context][red_code * 8 + blue_code]
+        if result is FightResult.on_hold:
+            hold += 2 if red_code == blue_code == Card.ambassador else 1
+        elif result is FightResult.red_wins_game:
+            return 1.0
+        elif result is FightResult.blue_wins_game:
+            return 0.0
+        else:
+            if result is FightResult.red_wins:
+                red_points += 1 + hold
+            elif result is FightResult.red_wins_2:
+                red_points += self._ambassador_points + hold
+            elif result is FightResult.blue_wins:
+                blue_points += 1 + hold
+            else:
+                blue_points += self._ambassador_points + hold
+            hold = 0
+            if red_points >= self.points_to_win:
+                return 1.0
+            if blue_points >= self.points_to_win:
+                return 0.0
+        return (
+            red_hand & ~(1 << red_code),
+            blue_hand & ~(1 << blue_code),
+            red_points,
+            blue_points,
+            hold,
+            self.context_by_prev[red_code * 9 + blue_code],
+        )
+
+    def _child(self, red_hand, blue_hand, red_points, blue_points, hold, context, red_code, blue_code) -> float:
+        child = self.child_state(red_hand, blue_hand, red_points, blue_points, hold, context, red_code, blue_code)
+        return child if isinstance(child, float) else self.value(*child)
+
+    def child_matrix(self, red_hand, blue_hand, red_points, blue_points, hold, context) -> List[List[float]]:
+        """Values of every (red card, blue card) pair from this state, rows are red's cards in ascending order"""
+        return [
+            [
+                self._child(red_hand, blue_hand, red_points, blue_points, hold, context, red_code, blue_code)
+                for blue_code in _cards(blue_hand)
+            ]
+            for red_code in _cards(red_hand)
+        ]
+
+    def value(self, red_hand: int, blue_hand: int, red_points: int, blue_points: int, hold: int, context: int) -> float:
+        if not red_hand or not blue_hand:
+            return 0.5
+        if self.tablebase is not None:
+            val = self.tablebase.value(red_hand, blue_hand, red_points, blue_points, hold, context)
+            if val is not None:
+                return val
+
+        key, mirrored = self.canonical_key(red_hand, blue_hand, red_points, blue_points, hold, context)
+        key |= self._key_base
+        self.lookups += 1
+        cached = self.table.get(key)
+        if cached is None and self.cache is not None:
+            cached = self.cache.get(key)
+        if cached is not None:
+            self.hits += 1
+            return 1.0 - cached if mirrored else cached
+
+        matrix = self.child_matrix(red_hand, blue_hand, red_points, blue_points, hold, context)
+        spy_color = self.context_spy_color[context]
+        if spy_color == Color.red:
+            # Blue reveals first, red responds
+            val = min(max(column) for column in zip(*matrix))
+        elif spy_color == Color.blue:
+            # Red reveals first, blue responds
+            val = max(min(row) for row in matrix)
+        else:
+            val, _, _ = solve_matrix_game(matrix)
+
+        self.table[key] = 1.0 - val if mirrored else val
+        return val
+
+    def strategies(
+        self, red_hand: int, blue_hand: int, red_points: int, blue_points: int, hold: int, context: int
+    ) -> Tuple[float, Dict[Card, float], Dict[Card, float]]:
+        """Equilibrium mixed strategies at a simultaneous node. Spy nodes should use `child_matrix` directly."""
+        matrix = self.child_matrix(red_hand, blue_hand, red_points, blue_points, hold, context)
+        val, red_strategy, blue_strategy = solve_matrix_game(matrix)
+        return (
+            val,
+            {Card(code): prob for code, prob in zip(_cards(red_hand), red_strategy)},
+            {Card(code): prob for code, prob in zip(_cards(blue_hand), blue_strategy)},
+        )
+
+    def solve_game(self, red_hand: Iterable[Card], blue_hand: Iterable[Card], game: GameStatus) -> float:
+        """Value of `game` with the given hands left to play"""
+        state = (
+            game if isinstance(game, CompactGameStatus) else CompactGameStatus.from_game_status(game)
+        )
+        if state.winner:
+            return 1.0 if state.winner == Color.red else 0.0
+        return self.value(
+            hand_mask(red_hand),
+            hand_mask(blue_hand),
+            state.red_points,
+            state.blue_points,
+            state.hold_points,
+            self.context_by_prev[state.prev_red * 9 + state.prev_blue],
+        )
+
+
+def solve_full_game(
+    points_to_win: Optional[int] = None, solver: Optional[EquilibriumSolver] = None, rules: Optional[Rules] = None
+) -> float:
+    """Value of a whole game, with both players starting with every card in the rules"""
+    solver = solver or EquilibriumSolver(points_to_win, rules=rules)
+    cards = list(solver.rules.cards)
+    return solver.solve_game(cards, cards, GameStatus(rules=solver.rules))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve the full Brave Rats game")
+    parser.add_argument("-c", "--cache", help="Solver cache file to read from and save newly solved states to")
+    parser.add_argument("-t", "--tablebase", help="Endgame tablebase (see experiments.tablebase) to probe")
+    add_rules_arguments(parser, "-p", "--points-to-win")
+    args = vars(parser.parse_args())
+    full_game_rules = rules_from_args(args)
+
+    start = time.time()
+    full_game_tablebase = None
+    if args["tablebase"]:
+        from experiments.tablebase import Tablebase
+
+        full_game_tablebase = Tablebase.open(args["tablebase"])
+    full_game_solver = EquilibriumSolver(cache_path=args["cache"], rules=full_game_rules, tablebase=full_game_tablebase)
+    game_value = solve_full_game(solver=full_game_solver)
+    print(f"Value of the full game for red: {game_value:.6f}")
+    print(
+        f"Solved {len(full_game_solver.table)} new states in {time.time() - start:.1f}s "
+        f"({full_game_solver.hits}/{full_game_solver.lookups} memo hits)"
+    )
+    if args["cache"] and full_game_solver.table:
+        full_game_solver.save_cache()
+    hands = full_game_rules.hand_mask
+    val, red_strategy, blue_strategy = full_game_solver.strategies(
+        hands, hands, 0, 0, 0, full_game_solver.initial_context
+    )
+    print("Opening strategy:", {card.name: round(prob, 4) for card, prob in red_strategy.items() if prob > 1e-9})
@@ -0,0 +1,242 @@
+"""How much a perfect opponent can win against a brain, computed exactly over the whole game tree.
+
+    python -m experiments.exploitability randomBestOutcome
+
+The best responder knows the brain's strategy (from `Brain.action_distribution`) and sees everything the brain
+does: both hands, the score and the previous fight. In a normal round it picks the card with the best expected
+value against the brain's distribution; after a spy, whoever spied gets to react to the revealed card. Values are
+memoized on the packed CompactGameStatus, so every position is expanded once.
+
+Brains only get to see a CompactGameStatus here, so their choices have to depend on the current position rather
+than the full fight history, which is true of every brain that implements `action_distribution`. Brains that
+don't implement it can be approximated with `--samples`, which estimates the distribution from repeated
+`play_turn` calls.
+"""
+import argparse
+import time
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+from brains.Brain import Brain
+from brains.registry import default_registry
+from components.cards import Card, Color
+from components.compact_state import SPY_COLORS, CompactGameStatus, cards_in_mask
+from components.fight import FightResult
+from components.player import Player
+from components.rules import Rules, add_rules_arguments, game_rules, rules_from_args
+
+# Value of the game for either player when both play perfectly
+EQUILIBRIUM_VALUE = 0.5
+
+# Hand mask -> card codes / Cards in it
+_CARD_CODES = [tuple(code for code in range(8) if mask >> code & 1) for mask in range(256)]
+_CARDS = [tuple(cards_in_mask(mask)) for mask in range(256)]
+_RED_WINS_GAME = "red_wins_game"
+_BLUE_WINS_GAME = "blue_wins_game"
+
+
+def _transition(rules: Rules, result: FightResult, red_code: int, blue_code: int):
+    """What a fight does to the score: a game-ending marker, or (red points, blue points, points put on hold)"""
+    if result is FightResult.red_wins_game:
+        return _RED_WINS_GAME
+    if result is FightResult.blue_wins_game:
+        return _BLUE_WINS_GAME
+    if result is FightResult.on_hold:
+        # Two ambassadors on hold are worth an extra point, same as `GameStatus.on_hold_points`
+        return 0, 0, 2 if red_code == blue_code == Card.ambassador else 1
+    return rules.result_points[result] + (0,)
+
+
+def _transitions(rules: Rules):
+    """`_transition` for every fight under `rules`, with the same indexing as `fight.FIGHT_TABLE`"""
+    return tuple(
+        _transition(rules, FightResult(result), index // 8 % 8, index % 8)
+        for index, result in enumerate(rules.fight_table)
+    )
+
+
+class BestResponse(object):
+    """Exact best response to `brain` playing `brain_color`.
+
+    :param notify_of_hand: whether the brain is told its opponent's remaining cards, as in `play_match`
+    :param samples: if the brain doesn't implement `action_distribution`, estimate it from this many `play_turn`
+        calls per position instead of failing
+    :param rules: defaults to the standard rules played to `points_to_win`
+    """
+
+    def __init__(
+        self,
+        brain: Brain,
+        brain_color: Color,
+        points_to_win: Optional[int] = None,
+        notify_of_hand: bool = True,
+        samples: Optional[int] = None,
+        rules: Optional[Rules] = None,
+    ):
+        self.brain = brain
+        self.brain_color = brain_color
+        self.responder_color = Color.blue if brain_color == Color.red else Color.red
+        self.rules = game_rules(points_to_win, rules)
+        self.points_to_win = self.rules.points_to_win
+        self._transitions = _transitions(self.rules)
+        self.notify_of_hand = notify_of_hand
+        self.samples = samples
+        # Packed position -> value for the best responder
+        self.values: Dict[int, float] = {}
+        # (packed position, spied card code or -1) -> the brain's distribution over card codes
+        self.distributions: Dict[Tuple[int, int], Dict[int, float]] = {}
+
+    def _brain_distribution(self, packed: int, spied_card: Optional[Card]) -> Dict[int, float]:
+        key = (packed, -1 if spied_card is None else int(spied_card))
+        distribution = self.distributions.get(key)
+        if distribution is not None:
+            return distribution
+
+        game = CompactGameStatus.unpack(packed, rules=self.rules)
+        brain_is_red = self.brain_color == Color.red
+        hand = _CARDS[game.red_hand if brain_is_red else game.blue_hand]
+        opponent_hand = set(_CARDS[game.blue_hand if brain_is_red else game.red_hand]) if self.notify_of_hand else None
+        player = Player(self.brain_color, self.brain, list(hand))
+        try:
+            card_probabilities = self.brain.action_distribution(player, game, spied_card, opponent_hand)
+        except NotImplementedError:
+            if not self.samples:
+                raise
+            counts = Counter(
+                self.brain.play_turn(Player(self.brain_color, self.brain, list(hand)), game, spied_card, opponent_hand)
+                for _ in range(self.samples)
+            )
+            card_probabilities = {card: count / self.samples for card, count in counts.items()}
+
+        distribution = self.distributions[key] = {
+            int(card): probability for card, probability in card_probabilities.items() if probability > 0
+        }
+        return distribution
+
+    def value(self, game: CompactGameStatus) -> float:
+        """Expected result for the best responder from `game`: 1 for a win, 0 for a loss, 0.5 for a tie"""
+        winner = game.winner
+        if winner is not None:
+            return 1.0 if winner == self.responder_color else 0.0
+        return self._value(game.pack())
+
+    def _value(self, key: int) -> float:
+        """`value` of the non-terminal position packed into `key` (see `CompactGameStatus.pack`). Positions are
+        only unpacked into a CompactGameStatus when the brain has to be asked for its move."""
+        val = self.values.get(key)
+        if val is not None:
+            return val
+        red_hand, blue_hand = key & 0xFF, key >> 8 & 0xFF
+        if not red_hand or not blue_hand:
+            return 0.5
+
+        prev_red, prev_blue = key >> 16 & 0xF, key >> 20 & 0xF
+        hold, red_points, blue_points = key >> 24 & 0xF, key >> 28 & 0xF, key >> 32 & 0xF
+        brain_is_red = self.brain_color == Color.red
+        responder_codes = _CARD_CODES[blue_hand if brain_is_red else red_hand]
+        points_to_win = self.points_to_win
+        transitions = self._transitions
+
+        def child(red_code: int, blue_code: int) -> float:
+            transition = transitions[((prev_red * 9 + prev_blue) * 8 + red_code) * 8 + blue_code]
+            if transition is _RED_WINS_GAME:
+                return 0.0 if brain_is_red else 1.0
+            if transition is _BLUE_WINS_GAME:
+                return 1.0 if brain_is_red else 0.0
+            red_gain, blue_gain, new_hold = transition
+            if new_hold:
+                child_hold, child_red, child_blue = hold + new_hold, red_points, blue_points
+            else:
+                child_hold = 0
+                child_red = red_points + (red_gain + hold if red_gain else 0)
+                child_blue = blue_points + (blue_gain + hold if blue_gain else 0)
+                if child_red >= points_to_win:
+                    return 0.0 if brain_is_red else 1.0
+                if child_blue >= points_to_win:
+                    return 1.0 if brain_is_red else 0.0
+            return self._value(
+                (red_hand & ~(1 << red_code))
+                | (blue_hand & ~(1 << blue_code)) << 8
+                | red_code << 16
+                | blue_code << 20
+                | child_hold << 24
+                | child_red << 28
+                | child_blue << 32
+            )
+
+        def outcome(responder_code: int, brain_code: int) -> float:
+            return child(brain_code, responder_code) if brain_is_red else child(responder_code, brain_code)
+
+        spy_color = SPY_COLORS[prev_red * 9 + prev_blue]
+        if spy_color == self.responder_color:
+            # The brain reveals its card and we answer it
+            val = sum(
+                probability * max(outcome(code, brain_code) for code in responder_codes)
+                for brain_code, probability in self._brain_distribution(key, None).items()
+            )
+        elif spy_color == self.brain_color:
+            # We reveal our card and the brain answers it
+            val = max(
+                sum(
+                    probability * outcome(code, brain_code)
+                    for brain_code, probability in self._brain_distribution(key, Card(code)).items()
+                )
+                for code in responder_codes
+            )
+        else:
+            distribution = self._brain_distribution(key, None).items()
+            val = max(
+                sum(probability * outcome(code, brain_code) for brain_code, probability in distribution)
+                for code in responder_codes
+            )
+
+        self.values[key] = val
+        return val
+
+    def best_response_value(self, red_hand: Optional[int] = None, blue_hand: Optional[int] = None) -> float:
+        """:param red_hand: starting hand mask, all of the rules' cards by default"""
+        full_hand = self.rules.hand_mask
+        return self.value(
+            CompactGameStatus(
+                red_hand=full_hand if red_hand is None else red_hand,
+                blue_hand=full_hand if blue_hand is None else blue_hand,
+                rules=self.rules,
+            )
+        )
+
+
+def exploitability(
+    brain: Brain, points_to_win: Optional[int] = None, samples: Optional[int] = None, rules: Optional[Rules] = None
+) -> Dict[Color, float]:
+    """How much more than the equilibrium value a best responder gets against `brain`, with the brain playing
+    each color. 0 means the brain can't be exploited; 0.5 means it always loses to the right opponent.
+    Equilibrium values of variants aren't necessarily 0.5, so for those this is only comparable between brains."""
+    return {
+        color: BestResponse(brain, color, points_to_win, samples=samples, rules=rules).best_response_value()
+        - EQUILIBRIUM_VALUE
+        for color in (Color.red, Color.blue)
+    }
+
+
+if __name__ == "__main__":
+    registry = default_registry()
+    parser = argparse.ArgumentParser(description="Compute how exploitable a brain is")
+    parser.add_argument("brains", nargs="+", choices=registry.names(), metavar="BRAIN", help="Brain names")
+    parser.add_argument(
+        "-s",
+        "--samples",
+        type=int,
+        help="Estimate distributions from this many play_turn calls for brains without action_distribution",
+    )
+    add_rules_arguments(parser, "-p", "--points-to-win")
+    args = parser.parse_args()
+    exploitability_rules = rules_from_args(vars(args))
+
+    for brain_name in args.brains:
+        start = time.time()
+        results = exploitability(registry.create(brain_name), samples=args.samples, rules=exploitability_rules)
+        print(
+            "{}: exploitable by {:.4f} as red, {:.4f} as blue ({:.1f}s)".format(
+                brain_name, results[Color.red], results[Color.blue], time.time() - start
+            )
+        )
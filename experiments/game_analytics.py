@@ -0,0 +1,204 @@
+"""Statistics over recorded games, computed a chunk of games at a time straight from the columnar store.
+
+    python -m experiments.game_analytics convert LOG [LOG ...] -d STORE
+    python -m experiments.game_analytics analyze -d STORE [-o stats.json]
+
+Each chunk is replayed for all of its games at once with `BatchGames`, so no GameStatus is ever built, and memory
+use depends on the chunk size rather than the size of the store.
+"""
+import argparse
+import json
+from collections import Counter
+from typing import Dict, Optional
+
+import numpy as np
+
+from components.batch_engine import BatchGames
+from components.cards import Card, Color
+from components.compact_state import PRINCESS_POINTS
+from components.fight import FightResult
+from components.game_records import DEFAULT_CHUNK_SIZE, MAX_FIGHTS, GameRecords, convert_logs
+from components.rules import Rules, game_rules
+
+# Outcomes of a fight from the point of view of whoever played a card
+WON, LOST, HELD = range(3)
+OUTCOME_NAMES = ("won", "lost", "held")
+
+
+class GameAnalytics(object):
+    """Running totals over chunks of recorded games
+    :param rules: the rules the games were played by, defaults to the standard rules played to `points_to_win`
+    """
+
+    def __init__(self, brains, points_to_win: Optional[int] = None, rules: Optional[Rules] = None):
+        self.brains = brains
+        self.rules = game_rules(points_to_win, rules)
+        self.points_to_win = self.rules.points_to_win
+        self.num_games = 0
+        num_brains = max(len(brains), 1)
+        # [red brain, blue brain, Color value of the winner or 0 for a tie] -> games
+        self.pair_results = np.zeros((num_brains, num_brains, 3), dtype=np.int64)
+        # [card, WON/LOST/HELD] -> fights, from the point of view of whoever played the card
+        self.card_outcomes = np.zeros((len(Card), 3), dtype=np.int64)
+        # [card] -> points scored by whoever played the card in the fights it won, including points on hold.
+        # Princess wins end the game rather than score points, so they only show up in `card_outcomes`.
+        self.card_points = np.zeros(len(Card), dtype=np.int64)
+        # [card, round] -> times the card was played in that round, by either player
+        self.card_usage = np.zeros((len(Card), MAX_FIGHTS), dtype=np.int64)
+        # Number of fights in a row put on hold -> how often that happened
+        self.hold_stacks = np.zeros(MAX_FIGHTS + 1, dtype=np.int64)
+        # red points - blue points -> games, excluding games won by the Princess or by forfeit
+        self.margins = Counter()
+
+    def add_chunk(self, chunk: Dict[str, np.ndarray]):
+        num_games = len(chunk["num_fights"])
+        num_fights = np.asarray(chunk["num_fights"])
+        fights = np.asarray(chunk["fights"])
+        games = BatchGames(num_games, rules=self.rules)
+        games.red_hand[:] = chunk["red_hand"]
+        games.blue_hand[:] = chunk["blue_hand"]
+        hold_stack = np.zeros(num_games, dtype=np.int64)
+
+        for fight_index in range(MAX_FIGHTS):
+            rows = np.flatnonzero(num_fights > fight_index)
+            if not rows.size:
+                break
+            red_cards = (fights[rows, fight_index] >> 3).astype(np.int8)
+            blue_cards = (fights[rows, fight_index] & 7).astype(np.int8)
+            red_before, blue_before = games.red_points[rows], games.blue_points[rows]
+            results = games.resolve(rows, red_cards, blue_cards)
+
+            red_outcomes = np.where(
+                results > FightResult.on_hold, WON, np.where(results < FightResult.on_hold, LOST, HELD)
+            )
+            blue_outcomes = np.where(red_outcomes == HELD, HELD, 1 - red_outcomes)
+            np.add.at(self.card_outcomes, (red_cards, red_outcomes), 1)
+            np.add.at(self.card_outcomes, (blue_cards, blue_outcomes), 1)
+            red_gained, blue_gained = games.red_points[rows] - red_before, games.blue_points[rows] - blue_before
+            np.add.at(self.card_points, red_cards, np.where(results == FightResult.red_wins_game, 0, red_gained))
+            np.add.at(self.card_points, blue_cards, np.where(results == FightResult.blue_wins_game, 0, blue_gained))
+            self.card_usage[:, fight_index] += np.bincount(red_cards, minlength=len(Card))
+            self.card_usage[:, fight_index] += np.bincount(blue_cards, minlength=len(Card))
+
+            held = results == FightResult.on_hold
+            hold_stack[rows[held]] += 1
+            released = rows[~held]
+            self.hold_stacks += np.bincount(hold_stack[released], minlength=MAX_FIGHTS + 1)
+            hold_stack[released] = 0
+        # Games that ran out of cards with fights still on hold
+        self.hold_stacks[1:] += np.bincount(hold_stack, minlength=MAX_FIGHTS + 1)[1:]
+
+        forfeit = np.asarray(chunk["forfeit"])
+        games.blue_points[forfeit == Color.red] = PRINCESS_POINTS
+        games.red_points[forfeit == Color.blue] = PRINCESS_POINTS
+        winner = games.winner
+        np.add.at(self.pair_results, (np.asarray(chunk["red_brain"]), np.asarray(chunk["blue_brain"]), winner), 1)
+
+        scored = (games.red_points < PRINCESS_POINTS) & (games.blue_points < PRINCESS_POINTS)
+        margins, counts = np.unique(games.red_points[scored] - games.blue_points[scored], return_counts=True)
+        self.margins.update(dict(zip(margins.tolist(), counts.tolist())))
+        self.num_games += num_games
+
+    def to_dict(self):
+        return {
+            "num_games": self.num_games,
+            "brain_pairs": [
+                {
+                    "red": red_brain,
+                    "blue": blue_brain,
+                    "games": int(self.pair_results[red_id, blue_id].sum()),
+                    "red_wins": int(self.pair_results[red_id, blue_id, Color.red]),
+                    "blue_wins": int(self.pair_results[red_id, blue_id, Color.blue]),
+                    "ties": int(self.pair_results[red_id, blue_id, 0]),
+                }
+                for red_id, red_brain in enumerate(self.brains)
+                for blue_id, blue_brain in enumerate(self.brains)
+                if self.pair_results[red_id, blue_id].any()
+            ],
+            "cards": {
+                card.name: {
+                    **{name: int(self.card_outcomes[card, outcome]) for outcome, name in enumerate(OUTCOME_NAMES)},
+                    "points": int(self.card_points[card]),
+                    "usage_by_round": self.card_usage[card].tolist(),
+                }
+                for card in Card
+            },
+            "hold_stacks": {length: int(count) for length, count in enumerate(self.hold_stacks) if length and count},
+            "margins": {margin: count for margin, count in sorted(self.margins.items())},
+        }
+
+    def print_report(self):
+        print("{} games".format(self.num_games))
+        print()
+        print("Win rates by brain pair (red vs. blue):")
+        for pair in self.to_dict()["brain_pairs"]:
+            print(
+                "  {} vs. {}: red {:.1%}, blue {:.1%}, ties {:.1%} over {} games".format(
+                    pair["red"],
+                    pair["blue"],
+                    pair["red_wins"] / pair["games"],
+                    pair["blue_wins"] / pair["games"],
+                    pair["ties"] / pair["games"],
+                    pair["games"],
+                )
+            )
+        print()
+        total_plays = max(int(self.card_usage.sum()), 1)
+        print(
+            "{:12} {:>8} {:>7} {:>7} {:>7} {:>8}   plays by round".format(
+                "card", "played", "won", "lost", "held", "points"
+            )
+        )
+        for card in Card:
+            plays = max(int(self.card_outcomes[card].sum()), 1)
+            print(
+                "{:12} {:>8.1%} {:>7.1%} {:>7.1%} {:>7.1%} {:>8}   {}".format(
+                    card.name,
+                    self.card_usage[card].sum() / total_plays,
+                    self.card_outcomes[card, WON] / plays,
+                    self.card_outcomes[card, LOST] / plays,
+                    self.card_outcomes[card, HELD] / plays,
+                    int(self.card_points[card]),
+                    " ".join(str(count) for count in self.card_usage[card]),
+                )
+            )
+        print()
+        hold_stacks = ", ".join(
+            "{}: {}".format(length, int(count)) for length, count in enumerate(self.hold_stacks) if length and count
+        )
+        print("Fights on hold in a row: " + hold_stacks)
+        print("Final score margins (red - blue), excluding Princess wins and forfeits:")
+        for margin, count in sorted(self.margins.items()):
+            print("  {:+d}: {}".format(margin, count))
+
+
+def analyze(directory: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> GameAnalytics:
+    records = GameRecords(directory)
+    analytics = GameAnalytics(records.brains, rules=records.rules)
+    for chunk in records.chunks(chunk_size):
+        analytics.add_chunk(chunk)
+    return analytics
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze recorded Brave Rats games")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser("convert", help="Append game logs to a columnar store")
+    convert_parser.add_argument("logs", nargs="+", help="Game log files, as written with --game-log")
+    convert_parser.add_argument("-d", "--directory", required=True, help="Store directory, created if needed")
+    analyze_parser = subparsers.add_parser("analyze", help="Print statistics over every game in a store")
+    analyze_parser.add_argument("-d", "--directory", required=True, help="Store directory")
+    analyze_parser.add_argument("-o", "--output", help="Also save the statistics to this JSON file")
+    analyze_parser.add_argument(
+        "--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Games to load and process at a time"
+    )
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        print("Added {} games to {}".format(convert_logs(args.logs, args.directory), args.directory))
+    else:
+        results = analyze(args.directory, args.chunk_size)
+        results.print_report()
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results.to_dict(), f, indent=2)
@@ -0,0 +1,173 @@
+"""Value of every k-card starting hand against every other, solved exactly across a process pool.
+
+    python -m experiments.hand_matrix -k 4 -o hands4 -c solver_cache.brt
+
+writes `hands4.npy`, an (n, n) float64 array where entry [i, j] is red's equilibrium value holding hand i against
+blue holding hand j, and `hands4.json` with the hands in row/column order. Entries that haven't been solved yet are
+NaN, and the matrix is saved every so often, so rerunning the same command after an interruption picks up where it
+left off.
+
+Workers share solved states through the memory-mapped solver cache given with `-c`. States they solve are
+collected and merged back into it at each checkpoint, and workers map it again before their next row once it has
+been rewritten, so they pick up each other's work as the run goes on, and later runs and other values of k start
+warm.
+"""
+import argparse
+import itertools
+import json
+import os
+import time
+from multiprocessing import Pool
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from components.cards import Card
+from components.compact_state import hand_mask
+from components.fight_contexts import INITIAL_CONTEXT
+from components.mapped_table import MappedTable, merged_records, write_table
+from experiments.equilibrium_solver import EquilibriumSolver
+
+# Rows of the matrix to solve between checkpoints
+DEFAULT_CHECKPOINT_ROWS = 8
+
+
+def starting_hands(k: int) -> List[Tuple[Card, ...]]:
+    """Every k-card hand, in `itertools.combinations` order (the row/column order of the matrix)"""
+    return list(itertools.combinations(Card, k))
+
+
+def _metadata(k: int, points_to_win: int, hands) -> dict:
+    return {
+        "k": k,
+        "points_to_win": points_to_win,
+        "hands": [[card.name for card in hand] for hand in hands],
+        "masks": [hand_mask(hand) for hand in hands],
+    }
+
+
+def _save_matrix(output: str, matrix: np.ndarray):
+    tmp_path = "{}.tmp{}.npy".format(output, os.getpid())
+    np.save(tmp_path, matrix)
+    os.replace(tmp_path, output + ".npy")
+
+
+class _ReportingTable(dict):
+    """A solver memo table that also lists the states added to it since they were last reported"""
+
+    def __init__(self):
+        super().__init__()
+        self.unreported: List[int] = []
+
+    def __setitem__(self, key: int, value: float):
+        super().__setitem__(key, value)
+        self.unreported.append(key)
+
+    def report(self) -> Dict[int, float]:
+        new_states = {key: self[key] for key in self.unreported}
+        self.unreported = []
+        return new_states
+
+
+# Each worker keeps one solver for its whole life, so its memo table carries over from row to row
+_worker_solver: Optional[EquilibriumSolver] = None
+
+
+def _init_worker(points_to_win: int, cache_path: Optional[str]):
+    global _worker_solver
+    _worker_solver = EquilibriumSolver(points_to_win, cache_path=cache_path)
+    _worker_solver.table = _ReportingTable()
+
+
+def _solve_row(task) -> Tuple[int, List[int], List[float], Dict[int, float]]:
+    """Solves hand `row` against the hands in `columns`. Also returns the states this worker solved since its
+    last report, so the parent can add them to the shared cache."""
+    row, masks, columns = task
+    # Pick up whatever the last checkpoint added to the cache
+    _worker_solver.refresh_cache()
+    values = [_worker_solver.value(masks[row], masks[column], 0, 0, 0, INITIAL_CONTEXT) for column in columns]
+    return row, columns, values, _worker_solver.table.report()
+
+
+def compute_hand_matrix(
+    k: int,
+    output: str,
+    points_to_win: Optional[int] = None,
+    processes: int = 1,
+    cache_path: Optional[str] = None,
+    checkpoint_rows: int = DEFAULT_CHECKPOINT_ROWS,
+) -> np.ndarray:
+    """Solves (or finishes solving) the k-card hand matrix saved at `output`.npy/.json.
+
+    Swapping colors turns hand i vs. hand j into hand j vs. hand i with value 1 - v, so only the upper triangle
+    is solved and the rest is filled in from it.
+
+    :param points_to_win: defaults to a majority of the k fights, like `solveable_games.foo`
+    """
+    points_to_win = points_to_win if points_to_win is not None else k // 2 + 1
+    hands = starting_hands(k)
+    metadata = _metadata(k, points_to_win, hands)
+    masks = metadata["masks"]
+
+    if os.path.exists(output + ".npy"):
+        with open(output + ".json") as f:
+            if json.load(f) != metadata:
+                raise ValueError("{}.npy holds a different hand matrix; pick another output".format(output))
+        matrix = np.load(output + ".npy")
+        # Anything known on one side of the diagonal gives the other side
+        mirrored = np.isnan(matrix) & ~np.isnan(matrix.T)
+        matrix[mirrored] = 1.0 - matrix.T[mirrored]
+    else:
+        matrix = np.full((len(hands), len(hands)), np.nan)
+        with open(output + ".json", "w") as f:
+            json.dump(metadata, f, indent=1)
+        _save_matrix(output, matrix)
+
+    tasks = []
+    for row in range(len(hands)):
+        columns = [column for column in range(row, len(hands)) if np.isnan(matrix[row, column])]
+        if columns:
+            tasks.append((row, masks, columns))
+
+    new_states: Dict[int, float] = {}
+
+    def checkpoint():
+        _save_matrix(output, matrix)
+        if cache_path and new_states:
+            cache = MappedTable(cache_path) if os.path.exists(cache_path) else None
+            records = merged_records(cache, new_states)
+            if cache is not None:
+                cache.close()
+            write_table(cache_path, records)
+            new_states.clear()
+
+    with Pool(processes, initializer=_init_worker, initargs=(points_to_win, cache_path)) as pool:
+        for solved, (row, columns, values, states) in enumerate(pool.imap_unordered(_solve_row, tasks), 1):
+            matrix[columns, row] = 1.0 - np.array(values)
+            matrix[row, columns] = values
+            new_states.update(states)
+            if solved % checkpoint_rows == 0:
+                checkpoint()
+    checkpoint()
+    return matrix
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve every k-card starting hand against every other")
+    parser.add_argument("-k", "--cards", type=int, required=True, help="Cards in each starting hand")
+    parser.add_argument("-o", "--output", required=True, help="Output path, without the .npy/.json extension")
+    parser.add_argument("-p", "--points-to-win", type=int, help="Points needed to win (default: a majority of k)")
+    parser.add_argument("-j", "--processes", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument("-c", "--cache", help="Solver cache file shared by the workers and updated as they go")
+    parser.add_argument(
+        "--checkpoint-rows", type=int, default=DEFAULT_CHECKPOINT_ROWS, help="Rows to solve between saves"
+    )
+    args = parser.parse_args()
+
+    start = time.time()
+    hand_matrix = compute_hand_matrix(
+        args.cards, args.output, args.points_to_win, args.processes, args.cache, args.checkpoint_rows
+    )
+    print("{0}x{0} hand matrix solved in {1:.1f}s".format(len(hand_matrix), time.time() - start))
+    good_for_red = np.argwhere(hand_matrix >= 0.9)
+    print("{} hand pairs give red a value of at least 0.9".format(len(good_for_red)))
@@ -4,6 +4,8 @@ from typing import List, Dict, Tuple, FrozenSet, Optional
 
 from components.cards import Card, Color
 from components.game_status import GameStatus
+from components.rules import Rules
+from experiments.tablebase import Tablebase, build_tablebase
 
 ALL_CARDS = [card for card in Card]
 
@@ -15,9 +17,24 @@ class MemoizableState:
     red_points: int
     blue_points: int
     on_hold_fights: Tuple[Tuple]
+    # Decides who spies and who has a General bonus this round
+    most_recent_fight: Tuple[Optional[Card], Optional[Card]]
 
 
 cached_res: Dict[MemoizableState, Tuple] = {}
+# Lookup/hit counters for `cached_res`, for benchmarking
+cache_stats = {"lookups": 0, "hits": 0}
+# Endgame tablebase built with red_reveals_first=True, to look up positions near the end instead of searching them
+tablebase: Optional[Tablebase] = None
+
+
+def child_value(red_hand: List[Card], blue_hand: List[Card], game: GameStatus) -> float:
+    """Value of the position after a fight, from `tablebase` when it has it"""
+    if tablebase is not None and tablebase.covers(game.rules, game.points_to_win):
+        val = tablebase.probe(red_hand, blue_hand, game)
+        if val is not None:
+            return val
+    return play_a_round(red_hand, blue_hand, game)[0]
 
 
 def play_a_spied_round(red_hand: List[Card], blue_hand: List[Card], blue_plays: Card, game: GameStatus) -> Tuple[float, Optional[Card]]:
@@ -33,7 +50,7 @@ def play_a_spied_round(red_hand: List[Card], blue_hand: List[Card], blue_plays:
         new_blue_hand.remove(blue_plays)
         new_game = game.clone()
         new_game.resolve_fight(red_plays, blue_plays)
-        val, played_from_here = play_a_round(new_red_hand, new_blue_hand, new_game)
+        val = child_value(new_red_hand, new_blue_hand, new_game)
         if val >= best_red_score:
             best_red_score = val
             best_red_response = red_plays
@@ -42,8 +59,17 @@ def play_a_spied_round(red_hand: List[Card], blue_hand: List[Card], blue_plays:
 
 
 def play_a_round(red_hand: List[Card], blue_hand: List[Card], game: GameStatus) -> Tuple[float, Optional[Card]]:
-    ms = MemoizableState(frozenset(red_hand), frozenset(blue_hand), game.red_points, game.blue_points, tuple(game.on_hold_fights))
+    ms = MemoizableState(
+        frozenset(red_hand),
+        frozenset(blue_hand),
+        game.red_points,
+        game.blue_points,
+        tuple(game.on_hold_fights),
+        tuple(game.most_recent_fight),
+    )
+    cache_stats["lookups"] += 1
     if ms in cached_res:
+        cache_stats["hits"] += 1
         return cached_res[ms]
     if game.winner:
         return (1.0, None) if game.winner == Color.red else (0.0, None)
@@ -73,8 +99,7 @@ def play_a_round(red_hand: List[Card], blue_hand: List[Card], game: GameStatus)
             new_blue_hand.remove(blue_plays)
             new_game = game.clone()
             new_game.resolve_fight(red_plays, blue_plays)
-            val, played_from_here = play_a_round(new_red_hand, new_blue_hand, new_game)
-            scores.append(val)
+            scores.append(child_value(new_red_hand, new_blue_hand, new_game))
         min_by_red_card[red_plays] = min(scores)
 
     best_card = None
@@ -131,9 +156,12 @@ def play_it_forward(game: GameStatus, red_hand: List[Card], blue_hand: List[Card
 
 
 def foo():
+    global tablebase
     cards_to_play = 4
     # Make it so you need to win a best-of the remaining rounds. Possibly instead want to allow splitting for evens
     points_to_win = (cards_to_play // 2) + 1
+    # Everything after the first fight gets looked up rather than searched
+    tablebase = build_tablebase(Rules(points_to_win=points_to_win), cards_to_play - 1, red_reveals_first=True)
     initial_game_state = GameStatus(points_to_win=points_to_win)
     all_hands = list(itertools.combinations(ALL_CARDS, cards_to_play))
     winning_count = 0
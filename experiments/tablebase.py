@@ -0,0 +1,255 @@
+"""Retrograde endgame tablebase: exact values of every position with only a few cards left in each hand.
+
+    python -m experiments.tablebase -k 4
+
+The builder first walks forward from every deal where both players hold the same number of cards (the full game,
+and the smaller deals `solveable_games` and `hand_matrix` start from), collecting each reachable position with at
+most `max_cards` cards per hand: both hands, the score, the points on hold and the previous fight (as an
+`equilibrium_solver` context, which is also what decides who gets to spy). It then solves those positions
+backward, one card at a time starting from single-card hands, so every position's children are already in the
+table when it's reached.
+
+The table is a `components.tablebase.Tablebase`, which is also where its file format is described.
+"""
+import argparse
+import os
+import time
+import warnings
+from array import array
+from itertools import combinations
+from math import comb
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from components.cards import Card, Color
+from components.compact_state import FULL_HAND, hand_mask
+from components.paths import DEFAULT_TABLEBASE_PATH
+from components.rules import Rules, add_rules_arguments, rules_from_args
+from components.tablebase import Tablebase, hand_ranks
+from experiments.equilibrium_solver import EquilibriumSolver, solve_matrix_game
+
+
+DEFAULT_MAX_CARDS = 4
+
+# Points away from a pure saddle point that a matrix is still treated as having one, like `solve_matrix_game` does
+_SADDLE_EPSILON = 1e-12
+
+# (red points, blue points, hold, context): everything about a position but the hands
+Situation = Tuple[int, int, int, int]
+
+
+class _Level(object):
+    """The hands of one size, and which situations each pair of them can come up in.
+
+    Pairs of hands are numbered `red rank * len(hands) + blue rank`, and `reachable[situation number]` is a bool
+    array over those pair numbers.
+    """
+
+    def __init__(self, cards: Sequence[Card], size: int):
+        self.hands = np.array([hand_mask(hand) for hand in combinations(cards, size)])
+        num_hands = len(self.hands)
+        self.red_hands = np.repeat(self.hands, num_hands)
+        self.blue_hands = np.tile(self.hands, num_hands)
+        self.situations: List[Situation] = []
+        self.situation_numbers: Dict[Situation, int] = {}
+        self.reachable: List[np.ndarray] = []
+
+    def add(self, situation: Situation) -> np.ndarray:
+        """The reachable pairs array of `situation`, adding it first if it's new"""
+        number = self.situation_numbers.get(situation)
+        if number is None:
+            number = self.situation_numbers[situation] = len(self.situations)
+            self.situations.append(situation)
+            self.reachable.append(np.zeros(len(self.red_hands), dtype=bool))
+        return self.reachable[number]
+
+    def sort(self):
+        """Renumbers the situations in sorted order"""
+        order = sorted(range(len(self.situations)), key=self.situations.__getitem__)
+        self.situations = [self.situations[number] for number in order]
+        self.reachable = [self.reachable[number] for number in order]
+        self.situation_numbers = {situation: number for number, situation in enumerate(self.situations)}
+
+
+def _child_pairs(parent: _Level, num_child_hands: int, ranks: List[int], red_code: int, blue_code: int) -> np.ndarray:
+    """Pair number, one card smaller, of every pair in `parent` after playing `red_code` against `blue_code`, -1
+    for pairs that don't hold those cards"""
+    hand_ranks = np.array(ranks)
+    red_children = hand_ranks[parent.red_hands & ~(1 << red_code)]
+    blue_children = hand_ranks[parent.blue_hands & ~(1 << blue_code)]
+    holds_both = (parent.red_hands >> red_code & 1).astype(bool) & (parent.blue_hands >> blue_code & 1).astype(bool)
+    return np.where(holds_both, red_children * num_child_hands + blue_children, -1)
+
+
+def _levels(solver: EquilibriumSolver, ranks: List[int], max_cards: int) -> List[Optional[_Level]]:
+    """Walks forward from every deal of equal hands of `solver.rules` cards, to find the situations each pair
+    of hands with at most `max_cards` cards can come up in. Indexed by hand size."""
+    cards = solver.rules.cards
+    codes = [int(card) for card in cards]
+    max_hold = solver.points_to_win - 1
+    levels: List[Optional[_Level]] = [None] * (len(cards) + 1)
+    levels[len(cards)] = _Level(cards, len(cards))
+    for size in range(len(cards), 1, -1):
+        level, child = levels[size], _Level(cards, size - 1)
+        levels[size - 1] = child
+        level.add((0, 0, 0, solver.initial_context))[:] = True
+        child_pairs = {
+            (red, blue): _child_pairs(level, len(child.hands), ranks, red, blue) for red in codes for blue in codes
+        }
+        for situation, reachable in zip(list(level.situations), list(level.reachable)):
+            for (red_code, blue_code), pairs in child_pairs.items():
+                child_state = solver.child_state(FULL_HAND, FULL_HAND, *situation, red_code, blue_code)
+                if isinstance(child_state, float):
+                    continue
+                targets = pairs[reachable & (pairs >= 0)]
+                if len(targets):
+                    red_points, blue_points, hold, context = child_state[2:]
+                    child.add((red_points, blue_points, min(hold, max_hold), context))[targets] = True
+    levels[1].add((0, 0, 0, solver.initial_context))[:] = True
+    for level in levels[1 : max_cards + 1]:
+        level.sort()
+    return levels[: max_cards + 1]
+
+
+def _solve_situation(
+    solver: EquilibriumSolver,
+    level: _Level,
+    child: Optional[_Level],
+    child_values: Optional[np.ndarray],
+    child_pairs: Dict[Tuple[int, int], np.ndarray],
+    situation: Situation,
+    reachable: np.ndarray,
+    red_reveals_first: bool,
+) -> np.ndarray:
+    """Red values of `situation` for every reachable pair of hands in `level`, NaN for the rest"""
+    pairs = np.flatnonzero(reachable)
+    max_hold = solver.points_to_win - 1
+    # matrices[i, red card, blue card] -> value of playing those cards from pair i, NaN for cards not in hand
+    matrices = np.full((len(pairs), 8, 8), np.nan)
+    for (red_code, blue_code), all_child_pairs in child_pairs.items():
+        child_pair = all_child_pairs[pairs]
+        holds_both = child_pair >= 0
+        if not holds_both.any():
+            continue
+        child_state = solver.child_state(FULL_HAND, FULL_HAND, *situation, red_code, blue_code)
+        if isinstance(child_state, float):
+            matrices[holds_both, red_code, blue_code] = child_state
+        elif child is None:
+            # Both hands are empty after this fight
+            matrices[holds_both, red_code, blue_code] = 0.5
+        else:
+            red_points, blue_points, hold, context = child_state[2:]
+            number = child.situation_numbers[(red_points, blue_points, min(hold, max_hold), context)]
+            matrices[holds_both, red_code, blue_code] = child_values[child_pair[holds_both], number]
+
+    with warnings.catch_warnings():
+        # Rows and columns of cards that aren't in hand are all NaN, which the nan- reductions warn about
+        warnings.simplefilter("ignore", RuntimeWarning)
+        maximin = np.nanmax(np.nanmin(matrices, axis=2), axis=1)
+        minimax = np.nanmin(np.nanmax(matrices, axis=1), axis=1)
+    spy_color = solver.context_spy_color[situation[3]]
+    if spy_color == Color.red:
+        # Blue reveals first, red responds
+        pair_values = minimax
+    elif spy_color == Color.blue or red_reveals_first:
+        # Red reveals first, blue responds
+        pair_values = maximin
+    else:
+        pair_values = maximin.copy()
+        # Matrices without a pure saddle point need solving as mixed-strategy games
+        for i in np.flatnonzero(maximin < minimax - _SADDLE_EPSILON):
+            red_codes = np.flatnonzero(level.red_hands[pairs[i]] >> np.arange(8) & 1)
+            blue_codes = np.flatnonzero(level.blue_hands[pairs[i]] >> np.arange(8) & 1)
+            pair_values[i], _, _ = solve_matrix_game(matrices[i][np.ix_(red_codes, blue_codes)].tolist())
+
+    values = np.full(len(reachable), np.nan)
+    values[pairs] = pair_values
+    return values
+
+
+def build_tablebase(
+    rules: Rules,
+    max_cards: int = DEFAULT_MAX_CARDS,
+    red_reveals_first: bool = False,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> Tablebase:
+    """Solves every reachable state with at most `max_cards` cards per hand, fewest cards first. Positions with
+    the same situation are solved together: their matrices of child values are gathered for every pair of hands at
+    once, and only the ones without a pure saddle point are solved one by one.
+    :param red_reveals_first: see `Tablebase`
+    :param progress: called with (hand size, number of states) as each hand size is finished
+    """
+    if not 1 <= max_cards <= len(rules.cards):
+        raise ValueError("max_cards must be between 1 and the number of cards dealt")
+    solver = EquilibriumSolver(rules=rules)
+    ranks = hand_ranks(rules.cards)
+    levels = _levels(solver, ranks, max_cards)
+    codes = [int(card) for card in rules.cards]
+    points_to_win, num_contexts = rules.points_to_win, len(solver.context_results)
+
+    situation_numbers = array("i", [-1]) * (max_cards * points_to_win ** 3 * num_contexts)
+    blocks = []
+    child, child_values = None, None
+    for size in range(1, max_cards + 1):
+        level = levels[size]
+        for number, (red_points, blue_points, hold, context) in enumerate(level.situations):
+            slot = (((size - 1) * points_to_win + red_points) * points_to_win + blue_points) * points_to_win + hold
+            situation_numbers[slot * num_contexts + context] = number
+        num_child_hands = comb(len(codes), size - 1)
+        child_pairs = {
+            (red, blue): _child_pairs(level, num_child_hands, ranks, red, blue) for red in codes for blue in codes
+        }
+        # swapped[pair number] -> number of the same pair with the hands the other way around
+        num_hands = len(level.hands)
+        swapped = np.arange(num_hands ** 2) % num_hands * num_hands + np.arange(num_hands ** 2) // num_hands
+        columns = []
+        for situation, reachable in zip(level.situations, level.reachable):
+            red_points, blue_points, hold, context = situation
+            mirror_number = level.situation_numbers[(blue_points, red_points, hold, solver.mirror_context[context])]
+            if not red_reveals_first and mirror_number < len(columns):
+                # Swapping colors turns a value v into 1 - v, so mirror images only need solving once
+                columns.append(1.0 - columns[mirror_number][swapped])
+            else:
+                columns.append(
+                    _solve_situation(
+                        solver, level, child, child_values, child_pairs, situation, reachable, red_reveals_first
+                    )
+                )
+        # values[pair number, situation number]
+        values = np.stack(columns, axis=1)
+        blocks.append(values.ravel())
+        child, child_values = level, values
+        if progress is not None:
+            progress(size, int(sum(reachable.sum() for reachable in level.reachable)))
+
+    values = array("d", np.concatenate(blocks).tobytes())
+    return Tablebase(rules, max_cards, red_reveals_first, situation_numbers, values)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build an endgame tablebase")
+    parser.add_argument(
+        "-k", "--max-cards", type=int, default=DEFAULT_MAX_CARDS, help="Most cards left per hand to solve"
+    )
+    parser.add_argument("-o", "--output", default=DEFAULT_TABLEBASE_PATH, help="Tablebase file to write")
+    parser.add_argument(
+        "--red-reveals-first",
+        action="store_true",
+        help="Value fights as if red had to show their card first, for experiments.solveable_games",
+    )
+    add_rules_arguments(parser, "-p", "--points-to-win")
+    args = vars(parser.parse_args())
+    tablebase_rules = rules_from_args(args)
+
+    start = time.time()
+    built = build_tablebase(
+        tablebase_rules,
+        args["max_cards"],
+        args["red_reveals_first"],
+        lambda size, count: print(
+            "Solved {} states with {} cards per hand ({:.1f}s)".format(count, size, time.time() - start)
+        ),
+    )
+    built.save(args["output"])
+    print("Wrote {} ({} slots, {} bytes)".format(args["output"], built.num_slots, os.path.getsize(args["output"])))
@@ -0,0 +1,111 @@
+#!/usr/bin/python
+#  -*- coding: UTF8 -*-
+"""Plays a brain from the registry against a `game_server.py`, as a remote seat.
+
+    python game_client.py randomBestOutcome -n 10 --port 7777
+    python game_client.py random --opponent spyingBeatRand
+
+The client rebuilds the game from the server's FIGHT messages, so the brain sees the same GameStatus it would
+in a local game.
+"""
+import argparse
+import asyncio
+from collections import Counter
+from typing import Optional
+
+from brains.Brain import Brain
+from brains.registry import default_registry
+from components.cards import Color
+from components.game_status import GameStatus
+from components.player import Player
+from game_server import DEFAULT_PORT, EXCLUDED_BRAIN_NAMES, format_message, parse_card, parse_message
+
+
+def _cards(names: Optional[str]):
+    return [parse_card(name) for name in names.split(",")] if names else []
+
+
+async def play_remote(
+    brain: Brain,
+    num_games: int = 1,
+    host: str = "localhost",
+    port: int = DEFAULT_PORT,
+    unix_path: Optional[str] = None,
+    table: Optional[str] = None,
+    color: Optional[str] = None,
+    opponent: Optional[str] = None,
+) -> Counter:
+    """Plays `num_games` games on the server, joining with the given table, color and opponent each time.
+    Returns a Counter of how the games went for this client: "win", "loss" or "tie"."""
+    if unix_path is not None:
+        reader, writer = await asyncio.open_unix_connection(unix_path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    results = Counter()
+    try:
+        for _ in range(num_games):
+            writer.write(format_message("JOIN", table=table, color=color, opponent=opponent).encode() + b"\n")
+            await writer.drain()
+            game, player = None, None
+            while True:
+                line = await reader.readline()
+                if not line:
+                    raise ConnectionError("The server hung up")
+                command, _, fields = parse_message(line.decode())
+                if command == "START":
+                    game = GameStatus(int(fields["points_to_win"]))
+                    player = Player(Color[fields["color"]], brain)
+                elif command == "TURN":
+                    player.hand = _cards(fields["hand"])
+                    spied = parse_card(fields["spied"]) if "spied" in fields else None
+                    opponent_hand = set(_cards(fields["opponent_hand"])) if "opponent_hand" in fields else None
+                    card = brain.play_turn(player, game, spied, opponent_hand)
+                    writer.write("PLAY {}\n".format(card.name).encode())
+                    await writer.drain()
+                elif command == "FIGHT":
+                    game.resolve_fight(parse_card(fields["red"]), parse_card(fields["blue"]))
+                elif command == "END":
+                    if fields["winner"] == "tie":
+                        results["tie"] += 1
+                    else:
+                        results["win" if fields["winner"] == player.color.name else "loss"] += 1
+                    break
+                elif command == "ERROR":
+                    raise ValueError(line.decode().strip())
+        writer.write(b"QUIT\n")
+        await writer.drain()
+    finally:
+        writer.close()
+    return results
+
+
+if __name__ == "__main__":
+    registry = default_registry()
+    parser = argparse.ArgumentParser(description="Play a brain against a Brave Rats game server")
+    parser.add_argument("brain", choices=registry.names(), help="Brain to play")
+    parser.add_argument("-n", "--num-games", type=int, default=1, help="Number of games to play")
+    parser.add_argument("--host", default="localhost", help="Server host")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Server TCP port")
+    parser.add_argument("--unix", help="Connect to this Unix socket path instead of TCP")
+    parser.add_argument("--table", help="Table to join (default: any open table)")
+    parser.add_argument("--color", choices=[color.name for color in Color], help="Seat to take")
+    parser.add_argument(
+        "--opponent",
+        choices=[name for name in registry.names() if name not in EXCLUDED_BRAIN_NAMES],
+        help="Play against this brain on the server",
+    )
+    args = parser.parse_args()
+
+    game_results = asyncio.run(
+        play_remote(
+            registry.create(args.brain),
+            args.num_games,
+            args.host,
+            args.port,
+            args.unix,
+            args.table,
+            args.color,
+            args.opponent,
+        )
+    )
+    print("{} wins, {} losses, {} ties".format(game_results["win"], game_results["loss"], game_results["tie"]))
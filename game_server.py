@@ -0,0 +1,399 @@
+#!/usr/bin/python
+#  -*- coding: UTF8 -*-
+"""Hosts any number of concurrent Brave Rats games over TCP or a Unix socket, in one asyncio process.
+
+    python game_server.py --port 7777
+    nc localhost 7777          # play by hand
+    python game_client.py randomBestOutcome --port 7777
+
+The protocol is one line per message, a command followed by `key=value` fields. Cards are sent by name, and
+accepted by name or number.
+
+Client to server:
+    JOIN [table=NAME] [color=red|blue] [opponent=BRAIN]
+        Takes a seat. Without a table, joins the first open table that has the seat free, or opens a new one.
+        With an opponent, the other seat goes to that brain (any name from the brain registry but `human`)
+        running on the server, and the game starts right away. Otherwise it starts once someone takes the other seat.
+    PLAY CARD   answers a TURN
+    QUIT        leaves the server, forfeiting any game in progress
+
+Server to client:
+    HELLO version=1
+    SEATED table=NAME color=red|blue
+    START color=red|blue opponent=NAME points_to_win=N
+    TURN hand=CARD,CARD,... [spied=CARD] [opponent_hand=CARD,CARD,...]
+        Asks for a card. `spied` is the card the opponent is about to play, after a successful spy.
+    FIGHT red=CARD blue=CARD result=RESULT red_points=N blue_points=N on_hold=N
+    END winner=red|blue|tie [forfeit=red|blue]
+    ERROR message
+
+A player who disconnects, quits or runs out of `--move-timeout` mid-game forfeits it. After END the client is back
+in the lobby and can JOIN again.
+"""
+import argparse
+import asyncio
+import itertools
+from typing import Dict, Optional, Set, Tuple
+
+from brains.registry import BrainRegistry, default_registry
+from brave_rats import turn_order
+from components.cards import Card, Color
+from components.game_log import brain_name
+from components.game_status import GameStatus
+from components.player import Player
+
+PROTOCOL_VERSION = 1
+DEFAULT_PORT = 7777
+# Connections waiting to be accepted. asyncio's default of 100 turns away clients when hundreds connect at once.
+DEFAULT_BACKLOG = 1024
+# Brains that can't play from the server: `human` would wait on the server's own terminal
+EXCLUDED_BRAIN_NAMES = {"human"}
+
+
+def format_message(command: str, **fields) -> str:
+    """One protocol line, leaving out fields that are None"""
+    return " ".join([command] + ["{}={}".format(key, value) for key, value in fields.items() if value is not None])
+
+
+def parse_message(line: str) -> Tuple[str, list, Dict[str, str]]:
+    """(command, positional arguments, key=value fields) of one protocol line"""
+    words = line.split()
+    if not words:
+        return "", [], {}
+    args, fields = [], {}
+    for word in words[1:]:
+        key, equals, value = word.partition("=")
+        if equals:
+            fields[key.lower()] = value
+        else:
+            args.append(word)
+    return words[0].upper(), args, fields
+
+
+def card_names(cards) -> str:
+    return ",".join(card.name for card in sorted(cards))
+
+
+def parse_card(text: str) -> Optional[Card]:
+    """A card from its name or number, or None"""
+    if text.isdigit():
+        number = int(text)
+        return Card(number) if number < len(Card) else None
+    return Card.__members__.get(text.lower())
+
+
+class Forfeit(Exception):
+    def __init__(self, color: Color, message: str):
+        super().__init__(message)
+        self.color = color
+
+
+class RemoteSeat(object):
+    """A seat played by a client. Its connection handler puts each line the client sends during the game in
+    `lines`, and an empty line if the connection drops."""
+
+    def __init__(self, writer: asyncio.StreamWriter, table: "Table", color: Color):
+        self.writer = writer
+        self.table = table
+        self.name = "remote"
+        self.lines = asyncio.Queue()
+        # Only used to keep track of the hand; the client does the thinking
+        self.player = Player(color, None)
+
+    def send(self, line: str):
+        if not self.writer.is_closing():
+            self.writer.write(line.encode() + b"\n")
+
+    async def choose_card(
+        self,
+        game: GameStatus,
+        spied_card: Optional[Card],
+        opponent_hand: Optional[Set[Card]],
+        timeout: Optional[float],
+    ) -> Card:
+        color = self.player.color
+        self.send(
+            format_message(
+                "TURN",
+                hand=card_names(self.player.hand),
+                spied=None if spied_card is None else spied_card.name,
+                opponent_hand=None if opponent_hand is None else card_names(opponent_hand),
+            )
+        )
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            try:
+                remaining = None if deadline is None else max(deadline - loop.time(), 0)
+                line = await asyncio.wait_for(self.lines.get(), remaining)
+            except asyncio.TimeoutError:
+                raise Forfeit(color, "{} ran out of time".format(color.name))
+            if not line:
+                raise Forfeit(color, "{} disconnected".format(color.name))
+
+            command, args, _ = parse_message(line.decode(errors="replace"))
+            if command == "QUIT":
+                raise Forfeit(color, "{} quit".format(color.name))
+            if command != "PLAY" or len(args) != 1:
+                self.send("ERROR expected PLAY CARD")
+                continue
+            card = parse_card(args[0])
+            if card not in self.player.hand:
+                self.send("ERROR {} is not in your hand: {}".format(args[0], card_names(self.player.hand)))
+                continue
+            self.player.hand.remove(card)
+            self.player.cards_played += 1
+            return card
+
+
+class BrainSeat(object):
+    """A seat played by a brain running in the server process. Brains think in the event loop's default executor,
+    so a slow one only holds up its own game."""
+
+    def __init__(self, brain, color: Color):
+        self.name = brain_name(brain)
+        self.player = Player(color, brain)
+
+    def send(self, line: str):
+        pass
+
+    async def choose_card(
+        self,
+        game: GameStatus,
+        spied_card: Optional[Card],
+        opponent_hand: Optional[Set[Card]],
+        timeout: Optional[float],
+    ) -> Card:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.player.choose_and_play_card, game, spied_card, opponent_hand)
+
+
+class Table(object):
+    def __init__(self, name: str, open_: bool):
+        self.name = name
+        # Tables opened without a name can be joined by anyone who doesn't ask for a specific table
+        self.open = open_
+        self.seats = {Color.red: None, Color.blue: None}
+        loop = asyncio.get_running_loop()
+        self.started = loop.create_future()
+        self.finished = loop.create_future()
+
+    def free_colors(self):
+        return [color for color, seat in self.seats.items() if seat is None]
+
+
+class GameServer(object):
+    """
+    :param notify_of_hand: whether players are told what's left in their opponent's hand, as in `play_match`
+    :param move_timeout: seconds a remote player gets per move before forfeiting, or None for no limit
+    """
+
+    def __init__(
+        self,
+        points_to_win: int = 4,
+        notify_of_hand: bool = True,
+        move_timeout: Optional[float] = None,
+        registry: Optional[BrainRegistry] = None,
+    ):
+        self.points_to_win = points_to_win
+        self.notify_of_hand = notify_of_hand
+        self.move_timeout = move_timeout
+        self.registry = registry if registry is not None else default_registry()
+        self.tables: Dict[str, Table] = {}
+        self.games_played = 0
+        self._table_numbers = itertools.count(1)
+        # Keeps running games from being garbage collected
+        self._games = set()
+
+    async def start_tcp(
+        self, host: str = "localhost", port: int = DEFAULT_PORT, backlog: int = DEFAULT_BACKLOG
+    ) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self.handle_connection, host, port, backlog=backlog)
+
+    async def start_unix(self, path: str, backlog: int = DEFAULT_BACKLOG) -> asyncio.AbstractServer:
+        return await asyncio.start_unix_server(self.handle_connection, path, backlog=backlog)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # Only this coroutine reads from the connection. While the client is in a game, its lines are passed on to
+        # its seat, which the game is waiting on.
+        writer.write(format_message("HELLO", version=PROTOCOL_VERSION).encode() + b"\n")
+        seat = None
+        try:
+            while True:
+                await writer.drain()
+                line = await reader.readline()
+                if seat is not None and seat.table.finished.done():
+                    seat = None
+                command, _, fields = parse_message(line.decode(errors="replace"))
+
+                if seat is not None and seat.table.started.done():
+                    seat.lines.put_nowait(line)
+                    if not line or command == "QUIT":
+                        break
+                elif seat is not None:
+                    if not line or command == "QUIT":
+                        self._leave(seat)
+                        break
+                    writer.write(b"ERROR waiting for an opponent\n")
+                elif not line or command == "QUIT":
+                    break
+                elif command == "JOIN":
+                    seat, error = self._join(writer, fields)
+                    if error:
+                        writer.write("ERROR {}\n".format(error).encode())
+                elif command:
+                    writer.write("ERROR unknown command {}\n".format(command).encode())
+        except (ConnectionError, ValueError):
+            if seat is not None and seat.table.started.done():
+                seat.lines.put_nowait(b"")
+            elif seat is not None:
+                self._leave(seat)
+        finally:
+            writer.close()
+
+    def _leave(self, seat: "RemoteSeat"):
+        """Takes a client out of a table that hasn't started yet"""
+        table = seat.table
+        table.seats[seat.player.color] = None
+        if not any(table.seats.values()):
+            del self.tables[table.name]
+
+    def _join(self, writer: asyncio.StreamWriter, fields) -> Tuple[Optional["RemoteSeat"], Optional[str]]:
+        """Seats the client as asked in a JOIN. Returns its seat, or an error message."""
+        color = fields.get("color")
+        if color is not None and color not in Color.__members__:
+            return None, "color must be red or blue"
+        colors = [Color[color]] if color is not None else [Color.red, Color.blue]
+        opponent = fields.get("opponent")
+        opponent_brain = None
+        if opponent is not None:
+            if opponent not in self.registry or opponent in EXCLUDED_BRAIN_NAMES:
+                return None, "unknown brain {}".format(opponent)
+            try:
+                opponent_brain = self.registry.create(opponent)
+            except Exception as e:
+                # Brains can fail to start in all sorts of ways (e.g. a missing data file), none of them the client's
+                # fault or a reason to drop the connection
+                return None, "brain {} failed to start: {}".format(opponent, e)
+
+        name = fields.get("table")
+        if name is not None:
+            table = self.tables.get(name)
+            if table is not None and opponent is not None:
+                return None, "table {} is already taken".format(name)
+        elif opponent is None:
+            table = next(
+                (
+                    table
+                    for table in self.tables.values()
+                    if table.open and any(color in table.free_colors() for color in colors)
+                ),
+                None,
+            )
+        else:
+            table = None
+        if table is None:
+            while name is None or name in self.tables:
+                name = "table-{}".format(next(self._table_numbers))
+            table = self.tables[name] = Table(name, open_="table" not in fields)
+
+        free = [color for color in colors if color in table.free_colors()]
+        if not free:
+            return None, "no free seat for you at table {}".format(table.name)
+        seat = RemoteSeat(writer, table, free[0])
+        table.seats[free[0]] = seat
+        seat.send(format_message("SEATED", table=table.name, color=free[0].name))
+        if opponent is not None:
+            other = Color.blue if free[0] == Color.red else Color.red
+            table.seats[other] = BrainSeat(opponent_brain, other)
+
+        if not table.free_colors():
+            del self.tables[table.name]
+            table.started.set_result(True)
+            game = asyncio.ensure_future(self._play(table))
+            self._games.add(game)
+            game.add_done_callback(self._games.discard)
+        return seat, None
+
+    async def _play(self, table: Table):
+        seats = table.seats
+        for color, seat in seats.items():
+            other = Color.blue if color == Color.red else Color.red
+            seat.send(
+                format_message(
+                    "START", color=color.name, opponent=seats[other].name, points_to_win=self.points_to_win
+                )
+            )
+
+        game = GameStatus(self.points_to_win)
+        forfeit = None
+        try:
+            while not game.winner and seats[Color.red].player.has_cards() and seats[Color.blue].player.has_cards():
+                red_card, blue_card = await self._play_cards(seats, game)
+                result = game.resolve_fight(red_card, blue_card)
+                for seat in seats.values():
+                    seat.send(
+                        format_message(
+                            "FIGHT",
+                            red=red_card.name,
+                            blue=blue_card.name,
+                            result=result.name,
+                            red_points=game.red_points,
+                            blue_points=game.blue_points,
+                            on_hold=game.on_hold_points,
+                        )
+                    )
+        except Forfeit as e:
+            forfeit = e.color
+            game.forfeit(e.color)
+        finally:
+            winner = game.winner.name if game.winner else "tie"
+            for seat in seats.values():
+                seat.send(format_message("END", winner=winner, forfeit=None if forfeit is None else forfeit.name))
+            self.games_played += 1
+            table.finished.set_result(game)
+
+    async def _play_cards(self, seats, game: GameStatus) -> Tuple[Card, Card]:
+        """Async counterpart of `brave_rats._get_played_cards`: same order, but seats can wait on their clients"""
+        hands = {Color.red: None, Color.blue: None}
+        if self.notify_of_hand:
+            hands = {color: set(seat.player.hand) for color, seat in seats.items()}
+        first, second, second_sees_first = turn_order(game)
+        first_card = await seats[first].choose_card(game, None, hands[second], self.move_timeout)
+        second_card = await seats[second].choose_card(
+            game, first_card if second_sees_first else None, hands[first], self.move_timeout
+        )
+        return (first_card, second_card) if first == Color.red else (second_card, first_card)
+
+
+async def serve(server: GameServer, host: str, port: int, unix_path: Optional[str] = None):
+    if unix_path is not None:
+        listener = await server.start_unix(unix_path)
+        print("Serving on {}".format(unix_path))
+    else:
+        listener = await server.start_tcp(host, port)
+        print("Serving on {}:{}".format(host, port))
+    async with listener:
+        await listener.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Host Brave Rats games for remote players")
+    parser.add_argument("--host", default="localhost", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="TCP port to listen on")
+    parser.add_argument("--unix", help="Listen on this Unix socket path instead of TCP")
+    parser.add_argument("--points-to-win", type=int, default=4, help="Points needed to win a game")
+    parser.add_argument("--move-timeout", type=float, help="Seconds a remote player gets per move")
+    parser.add_argument(
+        "--hide-hands",
+        default=False,
+        action="store_true",
+        help="Don't tell players what's left in their opponent's hand",
+    )
+    args = parser.parse_args()
+
+    game_server = GameServer(args.points_to_win, not args.hide_hands, args.move_timeout)
+    try:
+        asyncio.run(serve(game_server, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        print("{} games played".format(game_server.games_played))
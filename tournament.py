@@ -1,20 +1,31 @@
 #!/usr/bin/python
 #  -*- coding: UTF8 -*-
 import argparse
+import os
+import random
 import sys
-from collections import Counter
-
-from brains.beat_opponent_random import BeatOpponentRandomAI
-from brains.example_ai import RandomAI
-from brains.in_progress_ai import InProgressAI
-from brains.random_best_outcome import RandomBestOutcome
-from brains.random_plus_beat_spied import RandomPlusBeatSpiedAI
-from brains.spying_beat_rand import SpyingBeatRandomAI
+from multiprocessing import Pool
+
+from brains.registry import default_registry
 from brave_rats import play_match
 from components.cards import Color
+from components.instrumentation import Instrumentation
+from components.match_stats import MatchStats, SequentialTest
+from components.paths import DEFAULT_POLICY_PATH
+from components.player import FALLBACK, OVERRUN_POLICIES
+from components.rules import STANDARD_RULES, add_rules_arguments, rules_from_args
 from components.style import blueify, color_pad, redify
 
-EXCLUDED_BRAIN_NAMES = {"human"}
+# Brains that need a person at the keyboard, or are too slow for a round robin of the default size
+EXCLUDED_BRAIN_NAMES = {"human", "ismcts"}
+
+# Brains that play from a generated file, which sit out until it exists
+REQUIRED_FILES = {"cfrPolicy": DEFAULT_POLICY_PATH}
+
+# Parallel runs split each matchup into shards of at most this many games
+DEFAULT_SHARD_SIZE = 1000
+# ...or this many with a sequential test, which can only stop a match between shards
+SEQUENTIAL_SHARD_SIZE = 200
 
 
 def _table_cell(contents):
@@ -32,21 +43,26 @@ def _print_table_row(contents):
 
 
 def _print_summary(results, ai_names):
+    print("Red wins/ties/blue wins, and a 95% confidence interval for red's score (1 per win, 0.5 per tie)")
     _print_table_row([color_pad("")] + [blueify(name) for name in ai_names])
     for red_ai in ai_names:
         _print_table_cell(redify(red_ai))
         for blue_ai in ai_names:
             try:
-                games = results[(red_ai, blue_ai)]
+                stats = results[(red_ai, blue_ai)]
             except KeyError:
+                stats = None
+            if stats is None:
                 win_count = {Color.red: "-", Color.blue: "-", None: "-"}
+                interval = ""
             else:
-                winners = [game.winner for game in games]
-                win_count = Counter(winners)
-            result_descrip = "{}/{}/{}".format(
+                win_count = stats.wins
+                interval = " [{:.2f},{:.2f}]".format(*stats.score_interval())
+            result_descrip = "{}/{}/{}{}".format(
                 "←{}".format(win_count[Color.red]),
                 win_count[None],
                 "↑{}".format(win_count[Color.blue]),
+                interval,
             )
             if win_count[Color.red] > win_count[Color.blue]:
                 colored_result_descrip = redify(result_descrip)
@@ -58,26 +74,176 @@ def _print_summary(results, ai_names):
         _print_table_row([])
 
 
-def play_round_robin(num_games=1000, interactive=False):
-    # New AIs need to go into this dict
-    brains_dict = {
-        "random": RandomAI,
-        "randomPlusBeatSpied": RandomPlusBeatSpiedAI,
-        "beatOpponentRandom": BeatOpponentRandomAI,
-        "spyingBeatRand": SpyingBeatRandomAI,
-        "randomBestOutcome": RandomBestOutcome,
-        "inProgressAI": InProgressAI,
+def _print_games_played(results, ai_names, num_games):
+    played = sum(stats.num_games for stats in results.values())
+    print("Played {} of {} games".format(played, num_games * len(ai_names) ** 2))
+
+
+def tournament_brain_names():
+    """Names of every brain discovered in the tree, minus the excluded ones and those missing their files"""
+    return [
+        name
+        for name in default_registry().names()
+        if name not in EXCLUDED_BRAIN_NAMES and os.path.exists(REQUIRED_FILES.get(name, os.curdir))
+    ]
+
+
+def _shard_seed(seed, red_ai_name, blue_ai_name, shard_index):
+    # String seeds are hashed deterministically by `random.seed`, unlike tuples
+    return "{}/{}/{}/{}".format(seed, red_ai_name, blue_ai_name, shard_index)
+
+
+def _game_log_path(game_log_dir, red_ai_name, blue_ai_name, shard_index):
+    if game_log_dir is None:
+        return None
+    return os.path.join(game_log_dir, "{}_vs_{}_{}.brlog".format(red_ai_name, blue_ai_name, shard_index))
+
+
+def _play_shard(shard):
+    """Plays one slice of a matchup in a worker process.
+    Returns the matchup, its MatchStats and, if requested, the shard's Instrumentation."""
+    red_ai_name, blue_ai_name, shard_index, num_games, seed, instrument, game_log_dir, match_options = shard
+    instrumentation = Instrumentation() if instrument else None
+    registry = default_registry()
+    games = play_match(
+        registry.create(red_ai_name),
+        registry.create(blue_ai_name),
+        num_games=num_games,
+        verbose=False,
+        instrumentation=instrumentation,
+        seed=seed,
+        game_log=_game_log_path(game_log_dir, red_ai_name, blue_ai_name, shard_index),
+        **match_options,
+    )
+    return (red_ai_name, blue_ai_name), MatchStats().consume(games), instrumentation
+
+
+def _matchup_shards(red_ai_name, blue_ai_name, num_games, shard_size, seed, instrument, game_log_dir, match_options):
+    shards = []
+    for shard_index, first_game in enumerate(range(0, num_games, shard_size)):
+        shard_games = min(shard_size, num_games - first_game)
+        shard_seed = _shard_seed(seed, red_ai_name, blue_ai_name, shard_index)
+        shards.append(
+            (
+                red_ai_name,
+                blue_ai_name,
+                shard_index,
+                shard_games,
+                shard_seed,
+                instrument,
+                game_log_dir,
+                match_options,
+            )
+        )
+    return shards
+
+
+def _play_round_robin_parallel(
+    ai_names, num_games, processes, shard_size, seed, instrumentation, game_log_dir, match_options, sequential_test
+):
+    """With a `sequential_test`, shards are capped at SEQUENTIAL_SHARD_SIZE games and handed out in waves of one
+    shard per undecided matchup, and a matchup gets no more shards once the test has settled it. Decisions are only
+    made between waves, so the games played don't depend on how the shards get scheduled."""
+    if sequential_test is not None:
+        shard_size = min(shard_size, SEQUENTIAL_SHARD_SIZE)
+    results = {}
+    pending = {
+        (red_ai_name, blue_ai_name): _matchup_shards(
+            red_ai_name,
+            blue_ai_name,
+            num_games,
+            shard_size,
+            seed,
+            instrumentation is not None,
+            game_log_dir,
+            match_options,
+        )
+        for red_ai_name in ai_names
+        for blue_ai_name in ai_names
     }
+    with Pool(processes) as pool:
+        while pending:
+            if sequential_test is None:
+                wave = [shard for shards in pending.values() for shard in shards]
+                pending = {}
+            else:
+                wave = [shards.pop(0) for shards in pending.values()]
+            for matchup, stats, shard_instrumentation in pool.imap_unordered(_play_shard, wave):
+                results.setdefault(matchup, MatchStats()).merge(stats)
+                if shard_instrumentation is not None:
+                    instrumentation.merge(shard_instrumentation)
+            pending = {
+                matchup: shards
+                for matchup, shards in pending.items()
+                if shards and sequential_test.decide(results[matchup]) is None
+            }
+    return results
 
-    ai_names = brains_dict.keys()
+
+def play_round_robin(
+    num_games=1000,
+    interactive=False,
+    processes=1,
+    shard_size=DEFAULT_SHARD_SIZE,
+    seed=None,
+    instrumentation=None,
+    time_budget=None,
+    overrun_policy=FALLBACK,
+    game_log_dir=None,
+    sequential_test=None,
+    batch_size=1,
+    rules=STANDARD_RULES,
+):
+    """
+    :param processes: if more than 1, matchups are split into shards of `shard_size` games and played across a
+        process pool. Each shard is seeded from `seed`, the matchup and the shard index, so a run is repeatable
+        for a given seed and shard size no matter how the shards get scheduled.
+    :param instrumentation: if given, an Instrumentation that collects decision and fight timings for every game
+    :param time_budget: seconds each brain gets per move, enforced according to `overrun_policy` (see `play_game`)
+    :param game_log_dir: if given, every game is recorded in this directory, in one game log per matchup (per
+        shard when running in parallel)
+    :param sequential_test: if given, a SequentialTest that can end each match early, once it has settled whether
+        either brain is stronger. `num_games` is then the most games a match can take.
+    :param batch_size: games each match plays at a time, handing brains their decisions in batches (see
+        `play_match`)
+    :param rules: the rules variant every game is played with. Parallel workers get a pickled copy, which
+        compiles its tables once per shard.
+    :return: MatchStats for every (red brain, blue brain) matchup
+    """
+    ai_names = tournament_brain_names()
+    match_options = dict(time_budget=time_budget, overrun_policy=overrun_policy, batch_size=batch_size, rules=rules)
+    if game_log_dir is not None:
+        os.makedirs(game_log_dir, exist_ok=True)
 
     print("{} AIs discovered:".format(len(ai_names)))
     print("AIs:")
     print("\n".join(ai_names))
 
+    if processes > 1:
+        if interactive:
+            raise ValueError("Interactive mode can't be combined with multiple processes")
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        print("Seed: {}".format(seed))
+        results = _play_round_robin_parallel(
+            ai_names,
+            num_games,
+            processes,
+            shard_size,
+            seed,
+            instrumentation,
+            game_log_dir,
+            match_options,
+            sequential_test,
+        )
+        _print_summary(results, ai_names)
+        _print_games_played(results, ai_names, num_games)
+        return results
+
+    registry = default_registry()
     results = {}
-    for red_ai_name, red_ai_class in brains_dict.items():
-        for blue_ai_name, blue_ai_class in brains_dict.items():
+    for red_ai_name in ai_names:
+        for blue_ai_name in ai_names:
             next_match_intro = "Next match: {} vs. {}".format(
                 redify(red_ai_name), blueify(blue_ai_name)
             )
@@ -86,17 +252,29 @@ def play_round_robin(num_games=1000, interactive=False):
             else:
                 print(next_match_intro)
 
-            games = list(
-                play_match(
-                    red_ai_class(),
-                    blue_ai_class(),
-                    num_games=num_games,
-                    verbose=True,
-                    quiet_games=True,
-                )
+            games = play_match(
+                registry.create(red_ai_name),
+                registry.create(blue_ai_name),
+                num_games=num_games,
+                verbose=True,
+                quiet_games=True,
+                instrumentation=instrumentation,
+                seed=None if seed is None else _shard_seed(seed, red_ai_name, blue_ai_name, 0),
+                game_log=_game_log_path(game_log_dir, red_ai_name, blue_ai_name, 0),
+                **match_options,
             )
-            results[(red_ai_name, blue_ai_name)] = games
+            stats = results[(red_ai_name, blue_ai_name)] = MatchStats()
+            for game in games:
+                stats.add_game(game)
+                if sequential_test is not None:
+                    verdict = sequential_test.decide(stats)
+                    if verdict is not None:
+                        games.close()
+                        print("\nStopped after {} games: {}".format(stats.num_games, verdict.name.replace("_", " ")))
+                        break
             _print_summary(results, ai_names)
+    _print_games_played(results, ai_names, num_games)
+    return results
 
 
 if __name__ == "__main__":
@@ -108,11 +286,80 @@ if __name__ == "__main__":
         "--num-games",
         type=int,
         default=1000,
-        help="Number of games to play in each match",
+        help="Number of games to play in each match (at most, with --sprt)",
     )
     parser.add_argument(
         "-i", "--interactive", default=False, action="store_true", help="Requires"
     )
+    parser.add_argument(
+        "-p",
+        "--processes",
+        type=int,
+        default=1,
+        help="Number of worker processes to spread the games over",
+    )
+    parser.add_argument(
+        "--shard-size",
+        type=int,
+        default=DEFAULT_SHARD_SIZE,
+        help="Max number of games per unit of parallel work (at most {} with --sprt)".format(SEQUENTIAL_SHARD_SIZE),
+    )
+    parser.add_argument("-s", "--seed", type=int, help="Seed for reproducible runs")
+    parser.add_argument(
+        "-t",
+        "--timings",
+        help="Time every brain decision, print a latency table and save the raw numbers to this JSON file",
+    )
+    parser.add_argument("--time-budget", type=float, help="Seconds each brain gets per move (default: no limit)")
+    parser.add_argument(
+        "--overrun-policy",
+        choices=OVERRUN_POLICIES,
+        default=FALLBACK,
+        help="What happens to a brain that goes over its time budget",
+    )
+    parser.add_argument("--game-log-dir", help="Record every game in binary game logs in this directory")
+    parser.add_argument(
+        "--sprt",
+        default=False,
+        action="store_true",
+        help="End each match once a sequential test has settled whether either brain is stronger",
+    )
+    parser.add_argument(
+        "--sprt-margin",
+        type=float,
+        default=0.05,
+        help="How far from an even score (0.5) counts as one brain being stronger",
+    )
+    parser.add_argument(
+        "--sprt-error", type=float, default=0.05, help="Chance the sequential test names the wrong brain"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help="Games each match plays at a time, handing brains their decisions in batches",
+    )
+    add_rules_arguments(parser)
     args = parser.parse_args()
+    if args.batch_size > 1 and (args.time_budget is not None or args.timings):
+        parser.error("--batch-size can't be combined with --time-budget or --timings")
+    tournament_rules = rules_from_args(vars(args))
 
-    play_round_robin(num_games=args.num_games, interactive=args.interactive)
+    tournament_instrumentation = Instrumentation() if args.timings else None
+    play_round_robin(
+        num_games=args.num_games,
+        interactive=args.interactive,
+        processes=args.processes,
+        shard_size=args.shard_size,
+        seed=args.seed,
+        instrumentation=tournament_instrumentation,
+        time_budget=args.time_budget,
+        overrun_policy=args.overrun_policy,
+        game_log_dir=args.game_log_dir,
+        sequential_test=SequentialTest(args.sprt_margin, args.sprt_error) if args.sprt else None,
+        batch_size=args.batch_size,
+        rules=tournament_rules,
+    )
+    if tournament_instrumentation is not None:
+        print(tournament_instrumentation.summary_table())
+        tournament_instrumentation.save(args.timings)